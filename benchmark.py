@@ -0,0 +1,223 @@
+import logging, threading, time, json, argparse, sys, platform
+import urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import harris_lrc
+import lrc_simulator
+
+logger = logging.getLogger(__name__)
+
+# Benchmark harness for harris_lrc.py.
+#
+# Starts lrc_simulator.LRCSimulator and the control server in-process, then measures
+# latency percentiles and throughput of IP3Router operations and of the HTTP
+# endpoints across matrix sizes and concurrent client counts. Results are written
+# as JSON; --compare flags any p99 that regressed against a previous run.
+#
+# With --trace, a protocol capture from GET /trace is instead fed through the
+# message parser chunk by chunk, as it arrived from the router, to profile parsing.
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def measure(operation, requests, concurrency=1):
+    #Run operation(i) `requests` times across `concurrency` threads and summarize the timings
+    samples = []
+    errors = 0
+    lock = threading.Lock()
+
+    def run(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = operation(i)
+        except Exception as e:
+            logger.debug(f"Benchmark operation failed: {str(e)}")
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples.append(elapsed)
+            if ok is False:
+                errors += 1
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        for i in range(requests):
+            run(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': max(samples) * 1000,
+        'throughput_per_s': requests / wall if wall else None
+    }
+
+
+class BenchmarkStack:
+    #A simulator plus a control server frame and HTTP server, all on ephemeral local ports
+    def __init__(self, size, latency=0.0):
+        self.size = size
+        self.simulator = lrc_simulator.LRCSimulator(port=0, sources=size, destinations=size, latency=latency)
+        self.frame = None
+        self.httpd = None
+        self.base_url = None
+
+    def start(self, timeout=30):
+        port = self.simulator.start()
+        harris_lrc.frames.clear()
+        self.frame = harris_lrc.add_frame('bench', '127.0.0.1', port)
+        harris_lrc.load_ui_template()
+        harris_lrc.start_frames()
+
+        self.httpd = harris_lrc.RouterHTTPServer(('127.0.0.1', 0), harris_lrc.RouterHTTPRequestHandler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+        # Wait until the name tables and tally have loaded over the simulated link
+        deadline = time.monotonic() + timeout
+        while self.frame.names.loaded_at is None or self.frame.tally.stale:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Control server did not finish loading from the simulator")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.frame.supervisor.stop()
+        self.frame.router.close()
+        self.simulator.stop()
+
+    def source(self, i):
+        return f"SRC {i % self.size + 1}"
+
+    def destination(self, i):
+        return f"DST {i % self.size + 1}"
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base_url + urllib.request.quote(path)) as response:
+            response.read()
+            return response.status == 200
+
+    def post(self, path, data=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        request = urllib.request.Request(self.base_url + urllib.request.quote(path), data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+            return bool(result.get('success'))
+
+
+def bench_router(stack, requests):
+    #IP3Router calls issued through the frame's command queue, as the HTTP handlers do
+    router = stack.frame.router
+    call = stack.frame.commands.call
+    return {
+        'status': measure(lambda i: call(router.status, stack.destination(i)) is not None, requests),
+        'route': measure(lambda i: call(router.route, stack.source(i), stack.destination(i)) is True, requests),
+        'lock_unlock': measure(lambda i: call(router.lock_destination, stack.destination(i)) and call(router.unlock_destination, stack.destination(i)), requests),
+        'salvo_16': measure(lambda i: all(result is True for result in call(router.salvo,
+            [(stack.source(i + n), stack.destination(i * 16 + n)) for n in range(16)]).values()), max(1, requests // 16)),
+        'status_all': measure(lambda i: len(call(router.status_all)) == stack.size, max(1, requests // 20)),
+        'query_names': measure(lambda i: call(lambda: sum(1 for _ in router.query_names('SRC'))) == stack.size, max(1, requests // 20)),
+    }
+
+def bench_http(stack, requests, concurrency):
+    #HTTP endpoints as operator browsers would hit them
+    return {
+        'index': measure(lambda i: stack.get('/'), requests, concurrency),
+        'status': measure(lambda i: stack.get(f"/status/{stack.destination(i)}"), requests, concurrency),
+        'route': measure(lambda i: stack.post('/route', {'source': stack.source(i), 'destination': stack.destination(i)}), requests, concurrency),
+        'lock_unlock': measure(lambda i: stack.post(f"/lock/{stack.destination(i)}") and stack.post(f"/unlock/{stack.destination(i)}"), requests, concurrency),
+    }
+
+def run(sizes, concurrency_levels, requests, latency):
+    results = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'simulated_latency_s': latency,
+        'runs': []
+    }
+    for size in sizes:
+        stack = BenchmarkStack(size, latency).start()
+        try:
+            logger.warning(f"Benchmarking {size}x{size} matrix")
+            results['runs'].append({'size': size, 'target': 'router', 'concurrency': 1,
+                                    'operations': bench_router(stack, requests)})
+            for concurrency in concurrency_levels:
+                logger.warning(f"Benchmarking HTTP endpoints with {concurrency} clients")
+                results['runs'].append({'size': size, 'target': 'http', 'concurrency': concurrency,
+                                        'operations': bench_http(stack, requests, concurrency)})
+        finally:
+            stack.stop()
+    return results
+
+def compare(results, baseline, threshold):
+    #Return a description of every operation whose p99 grew by more than `threshold` times
+    previous = {(run['size'], run['target'], run['concurrency'], name): stats
+                for run in baseline['runs'] for name, stats in run['operations'].items()}
+    regressions = []
+    for run in results['runs']:
+        for name, stats in run['operations'].items():
+            old = previous.get((run['size'], run['target'], run['concurrency'], name))
+            if old and old['p99_ms'] and stats['p99_ms'] > old['p99_ms'] * threshold:
+                regressions.append(f"{run['target']} {name} size={run['size']} clients={run['concurrency']}: "
+                                   f"p99 {old['p99_ms']:.2f}ms -> {stats['p99_ms']:.2f}ms")
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark harris_lrc.py against a simulated router')
+    parser.add_argument('--sizes', default='64,512', help='Comma separated matrix sizes (default: 64,512)')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma separated HTTP client counts (default: 1,8,32)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per operation (default: 200)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated router reply latency in seconds (default: 0)')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='Previous JSON results to check for p99 regressions')
+    parser.add_argument('--threshold', type=float, default=1.5, help='p99 growth factor counted as a regression (default: 1.5)')
+    parser.add_argument('--trace', help='Profile parsing of a protocol trace captured with GET /trace instead')
+    parser.add_argument('--repeat', type=int, default=100, help='Times to replay the trace through the parser (default: 100)')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('harris_lrc').setLevel(logging.ERROR)
+    logging.getLogger('lrc_simulator').setLevel(logging.ERROR)
+
+    if args.trace:
+        header, records = harris_lrc.load_trace(args.trace)
+        results = dict(harris_lrc.replay_trace_parser(records, args.repeat), trace=args.trace,
+                       frame=header.get('frame'), router=header.get('router'))
+        print(json.dumps(results, indent=2))
+        sys.exit(0)
+
+    results = run([int(size) for size in args.sizes.split(',')],
+                  [int(count) for count in args.concurrency.split(',')],
+                  args.requests, args.latency)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
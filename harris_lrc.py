@@ -1,127 +1,683 @@
-import logging, subprocess, re, socket, time, json, threading, base64, argparse
+import logging, subprocess, re, socket, time, json, threading, base64, argparse, queue, os, gzip, hashlib, random, bisect, asyncio
 from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from collections import deque
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global router configuration
-router_host = None
-router_port = 52116
+class LRCMessage:
+    #A single framed LRC message, e.g. ~XPOINT%D${CAM 1};S${VTR 2}\
+    HEADER_PATTERN = re.compile(r'~?([A-Z]+)([:?%!])')
+    ARG_PATTERN = re.compile(r'([A-Z]+)[\$#]\{([^}]*)\}')
+
+    def __init__(self, raw):
+        self.raw = raw
+        match = self.HEADER_PATTERN.match(raw)
+        self.command = match.group(1) if match else ''
+        self.op = match.group(2) if match else ''
+        self.args = dict(self.ARG_PATTERN.findall(raw))
+
+    def __repr__(self):
+        return f"LRCMessage({self.raw!r})"
+
+
+class LRCFramer:
+    #Incrementally split the router byte stream into LRC messages on the '\' terminator
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scanned = 0
+
+    def feed(self, data):
+        #Add received bytes and return every complete message now available.
+        #Bytes already searched for a terminator are never scanned again, and messages
+        #are decoded only once complete, so multi-byte names split across reads survive.
+        self.buffer.extend(data)
+        messages = []
+        start = 0
+        while True:
+            end = self.buffer.find(b'\\', max(start, self.scanned))
+            if end == -1:
+                self.scanned = len(self.buffer) - start
+                break
+            raw = self.buffer[start:end + 1].strip()
+            start = end + 1
+            if len(raw) > 1:
+                messages.append(LRCMessage(raw.decode('utf-8', errors='replace')))
+        del self.buffer[:start]
+        return messages
+
+    def reset(self):
+        self.buffer.clear()
+        self.scanned = 0
+
+
+class ReplyWaiter:
+    #A caller waiting for router messages that satisfy match(); filled by the reader thread
+    def __init__(self, match):
+        self.match = match
+        self.queue = queue.Queue()
+
+    def get(self, timeout):
+        #Next matching message, or None on timeout or disconnect
+        try:
+            return self.queue.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+
+class ProtocolTrace:
+    #Bounded, always-on record of the raw bytes sent to and received from the router.
+    #Entries are (monotonic time, direction, bytes) with receives kept exactly as read
+    #from the socket, so captures preserve fragmentation and timing for replay.
+    #The oldest entries are dropped once the data held exceeds max_bytes.
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.records = deque()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def record(self, direction, data):
+        with self.lock:
+            self.records.append((time.monotonic(), direction, data))
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.size -= len(self.records.popleft()[2])
+
+    def dump(self, **header):
+        #Yield the buffer as JSON lines: a header object, then [seconds, direction, data]
+        #per record with times relative to the first record. Data is latin-1 so it round-trips.
+        #Lines are encoded one at a time, so a full buffer is never copied into one string.
+        with self.lock:
+            records = list(self.records)
+        origin = records[0][0] if records else time.monotonic()
+        yield json.dumps(dict(header, format='lrc-trace', version=1, captured_at=time.time(), records=len(records))) + "\n"
+        for timestamp, direction, data in records:
+            yield json.dumps([round(timestamp - origin, 6), direction, data.decode('latin-1')]) + "\n"
+
+
+def load_trace(path):
+    #Read a capture written by ProtocolTrace.dump(); returns (header, [(seconds, direction, bytes), ...])
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != 'lrc-trace':
+            raise ValueError(f"{path} is not an LRC trace")
+        records = [(timestamp, direction, data.encode('latin-1'))
+                   for timestamp, direction, data in (json.loads(line) for line in f if line.strip())]
+    return header, records
+
+def replay_trace_parser(records, repeat=1):
+    #Feed captured receive chunks through LRCFramer exactly as they arrived, to reproduce
+    #and profile parsing offline. Returns message and byte counts and parse time.
+    chunks = [data for _, direction, data in records if direction == 'rx']
+    messages = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        framer = LRCFramer()
+        for data in chunks:
+            messages += len(framer.feed(data))
+    elapsed = time.perf_counter() - started
+    return {
+        'chunks': len(chunks),
+        'bytes': sum(len(data) for data in chunks),
+        'messages': messages // repeat,
+        'repeat': repeat,
+        'parse_seconds': elapsed / repeat,
+        'messages_per_second': messages / elapsed if elapsed else None
+    }
+
+
+class Histogram:
+    #Cumulative latency histogram with fixed Prometheus-style buckets (seconds)
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    #Counters and histograms collected on the hot path and rendered as Prometheus text by /metrics.
+    #Recording is a dict lookup and a few additions under one lock.
+    HELP = {
+        'lrc_command_duration_seconds': ('histogram', 'Router command latency by command type'),
+        'lrc_command_retries_total': ('counter', 'Router command attempts that were retried'),
+        'lrc_command_failures_total': ('counter', 'Router commands that failed after all attempts'),
+        'lrc_heartbeat_misses_total': ('counter', 'Router heartbeats that went unanswered'),
+        'lrc_salvo_fire_jitter_seconds': ('histogram', 'Offset of scheduled salvo writes from their target time'),
+        'lrc_proxy_commands_total': ('counter', 'Commands from proxy clients, by whether they were answered from cache or sent to the router'),
+        'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+    def render(self, gauges=()):
+        #Prometheus text exposition. gauges is a list of (name, type, help, labels, value)
+        #sampled at scrape time, for state that is cheaper to read than to track.
+        with self.lock:
+            histograms = [(name, labels, list(h.counts), h.sum, h.count) for (name, labels), h in self.histograms.items()]
+            counters = list(self.counters.items())
+
+        families = {}
+        for name, labels, counts, total, count in sorted(histograms):
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket in zip(Histogram.BUCKETS + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{self.format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{self.format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self.format_labels(labels)} {count}")
+        for (name, labels), value in sorted(counters):
+            families.setdefault(name, []).append(f"{name}{self.format_labels(labels)} {value}")
+
+        help_text = dict(self.HELP)
+        for name, kind, description, labels, value in gauges:
+            help_text.setdefault(name, (kind, description))
+            families.setdefault(name, []).append(f"{name}{self.format_labels(tuple(labels.items()))} {value}")
+
+        output = []
+        for name, lines in families.items():
+            kind, description = help_text.get(name, ('untyped', name))
+            output.append(f"# HELP {name} {description}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
+
+
+metrics = Metrics()
+
 
 class IP3Router:
-    def __init__(self, host, port=52116):
+    def __init__(self, host, port=52116, timeout=2.0, confirm_timeout=None, name=None):
         self.host = host
         self.port = port
+        self.name = name or f"{host}:{port}"
+        self.timeout = timeout
+        self.confirm_timeout = timeout if confirm_timeout is None else confirm_timeout
         self.sock = None
         self.connected = False
+        self.connected_at = None
+        self.waiters = []
+        self.waiters_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.reader_thread = None
+        self.listeners = []
+        self.connect_listeners = []
+        self.supervised = False
+        self.trace = ProtocolTrace()
+        self.locks = None
         logger.info(f"IP3Router initialized with host {host}:{port}")
 
     def connect(self):
-        #Establish connection to the router.
-        if self.connected:
-            return True
-            
-        try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.settimeout(5) 
-            self.sock.connect((self.host, self.port))
+        #Establish connection to the router and start the reader thread.
+        with self.connect_lock:
+            if self.connected:
+                return True
+
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.settimeout(5)
+                sock.connect((self.host, self.port))
+                sock.settimeout(None)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (socket.error, ConnectionRefusedError) as e:
+                logger.error(f"Failed to connect to router: {str(e)}")
+                self.connected = False
+                return False
+
+            self.sock = sock
             self.connected = True
+            self.connected_at = time.time()
+            self.trace.record('open', b'')
+            self.reader_thread = threading.Thread(target=self._reader_loop, args=(sock,), daemon=True)
+            self.reader_thread.start()
             logger.info(f"Connected to router at {self.host}:{self.port}")
-            return True
-        except (socket.error, ConnectionRefusedError) as e:
-            logger.error(f"Failed to connect to router: {str(e)}")
-            self.connected = False
-            return False
+
+        for callback in self.connect_listeners:
+            threading.Thread(target=callback, daemon=True).start()
+        return True
 
     def ensure_connection(self):
         #Ensure connection is established before operations.
+        #A supervised router is reconnected in the background, never inside a request.
         if not self.connected:
-            return self.connect()
+            return False if self.supervised else self.connect()
         return True
 
-    def clear_buffer(self):
-        #Clear any existing data in the socket buffer to prevent mixed responses.
-        if not self.ensure_connection():
-            return False
-
-        self.sock.settimeout(0.1)
+    def _reader_loop(self, sock):
+        #Own the socket's receive side: frame every message and hand it to matching waiters.
+        framer = LRCFramer()
         try:
-            while self.sock.recv(4096):
-                pass
-        except socket.timeout:
-            pass
-        self.sock.settimeout(None)
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    logger.warning("Router closed the connection")
+                    break
+                self.trace.record('rx', data)
+                for message in framer.feed(data):
+                    self._dispatch(message)
+        except (socket.error, OSError) as e:
+            if self.sock is sock:
+                logger.error(f"Socket error in router reader: {str(e)}")
+        finally:
+            self.trace.record('close', b'')
+            if self.sock is sock:
+                self.connected = False
+            with self.waiters_lock:
+                for waiter in self.waiters:
+                    waiter.queue.put(None)
+
+    def _dispatch(self, message):
+        #Deliver a message to every waiter that matches it, then to every listener.
+        delivered = False
+        with self.waiters_lock:
+            for waiter in self.waiters:
+                if waiter.match(message):
+                    waiter.queue.put(message)
+                    delivered = True
+        if not delivered:
+            logger.debug(f"Unsolicited router message: '{message.raw}'")
+        for callback in self.listeners:
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error in router message listener: {str(e)}")
+
+    def add_listener(self, callback):
+        #Call callback(message) for every message received, solicited or not.
+        self.listeners.append(callback)
+
+    def add_connect_listener(self, callback):
+        #Call callback() in a background thread after every (re)connect.
+        self.connect_listeners.append(callback)
+
+    def expect(self, match):
+        #Register interest in replies before the command is sent, so none can be missed.
+        waiter = ReplyWaiter(match)
+        with self.waiters_lock:
+            self.waiters.append(waiter)
+        return waiter
+
+    def release(self, waiter):
+        with self.waiters_lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def record(self, command, started):
+        #Record the latency of a completed command for /metrics
+        metrics.observe('lrc_command_duration_seconds', time.monotonic() - started, frame=self.name, command=command)
+
+    def record_retry(self, command):
+        metrics.increment('lrc_command_retries_total', frame=self.name, command=command)
+
+    def record_failure(self, command):
+        metrics.increment('lrc_command_failures_total', frame=self.name, command=command)
+
+    def send(self, command):
+        #Write a command to the router; writes from concurrent callers are never interleaved.
+        self.send_bytes(command.encode())
+
+    def send_bytes(self, data):
+        with self.send_lock:
+            sock = self.sock
+            if sock is None or not self.connected:
+                raise ConnectionError("Router not connected")
+            self.trace.record('tx', data)
+            sock.sendall(data)
+
+    def request(self, command, match, timeout=None):
+        #Send a command and return the first reply satisfying match(), or None on timeout.
+        waiter = self.expect(match)
+        try:
+            self.send(command)
+            return waiter.get(self.timeout if timeout is None else timeout)
+        finally:
+            self.release(waiter)
+
+    def stream(self, command, match, until, timeout=None):
+        #Send a command and yield matching replies as they arrive, until one satisfies until().
+        #timeout applies between consecutive messages, so long dumps are not cut short.
+        waiter = self.expect(match)
+        count = 0
+        try:
+            self.send(command)
+            while True:
+                message = waiter.get(self.timeout if timeout is None else timeout)
+                if message is None:
+                    logger.warning(f"Incomplete reply to '{command.strip()}' after {count} messages")
+                    return
+                count += 1
+                yield message
+                if until(message):
+                    return
+        finally:
+            self.release(waiter)
+
+    def query_names(self, kind):
+        #Yield (index, name) from a ~SRC?/~DEST? name dump as each entry arrives.
+        #The dump ends with ~SRC%Q${NAME}\ (or ~DEST%...); a dump cut short without it
+        #raises TimeoutError after the entries that did arrive.
+        command = f"~{kind}?Q${{NAME}}\\\n"
+        started = time.monotonic()
+        complete = False
+        count = 0
+        for message in self.stream(command, lambda m: m.command == kind, lambda m: m.args.get('Q') == 'NAME'):
+            if message.args.get('Q') == 'NAME':
+                complete = True
+            index = message.args.get('I', '')
+            name = message.args.get('NAME')
+            if index.isdigit() and name:
+                count += 1
+                yield int(index), name
+        if complete:
+            self.record('names', started)
+        else:
+            self.record_failure('names')
+            raise TimeoutError(f"{kind} name dump ended without its terminator after {count} entries")
 
     def status(self, dst, retries=3):
         #Send the status command and attempt to get a valid response.
+        #Only socket errors are retried: an unanswered query fails after one timeout, so a
+        #destination the router ignores never holds the link for several.
         if not self.ensure_connection():
+            self.record_failure('status')
             return None
 
+        started = time.monotonic()
         for attempt in range(retries):
             try:
-                self.clear_buffer()
                 command = f"~XPOINT?D${{{dst}}}\\\n"
-                self.sock.sendall(command.encode())
-
-                time.sleep(0.5)
+                reply = self.request(command, lambda m: m.command == 'XPOINT' and m.args.get('D') == dst)
 
-                response = self.sock.recv(4096).decode()
-
-                if f"D${{{dst}}}" in response:
-                    match = re.search(r"S\${(.*?)}\\", response)
-                    if match:
-                        source = match.group(1)
+                if reply:
+                    source = reply.args.get('S')
+                    if source is not None:
                         logger.info(f"Source '{source}' is routed to Destination '{dst}'")
+                        self.record('status', started)
                         return source
                     else:
-                        logger.warning(f"Could not parse source for {dst}. Raw response: '{response.strip()}'")
+                        logger.warning(f"Could not parse source for {dst}. Raw response: '{reply.raw}'")
+                        self.record_failure('status')
                         return None
 
-                logger.warning(f"Attempt {attempt + 1} failed. Retrying...")
+                logger.error(f"No status reply for Destination '{dst}' after {self.timeout}s")
+                self.record_failure('status')
+                return None
 
             except socket.error as e:
                 logger.error(f"Socket error during status check: {str(e)}")
                 self.connected = False
-                if attempt == retries - 1:
+                if attempt == retries - 1 or self.supervised:
+                    self.record_failure('status')
                     return None
-                time.sleep(1) 
+                self.record_retry('status')
+                time.sleep(1)
+                self.ensure_connection()
 
         logger.error(f"Failed to get a valid response for {dst} after {retries} attempts.")
+        self.record_failure('status')
         return None
 
+    def ping(self, dst, timeout=None):
+        #Round-trip a status query for dst as a heartbeat; returns seconds, or None if unanswered
+        started = time.monotonic()
+        reply = self.request(f"~XPOINT?D${{{dst}}}\\\n", lambda m: m.command == 'XPOINT' and m.args.get('D') == dst, timeout)
+        if reply:
+            self.record('heartbeat', started)
+        return time.monotonic() - started if reply else None
+
+    def status_many(self, dsts, timeout=None):
+        #Query several destinations with one pipelined write.
+        #Returns {destination: source} for every destination that answered before the deadline.
+        wanted = set(dsts)
+        if not wanted or not self.ensure_connection():
+            return {}
+
+        results = {}
+        started = time.monotonic()
+        waiter = self.expect(lambda m: m.command == 'XPOINT' and m.op == '%' and m.args.get('D') in wanted)
+        try:
+            self.send("".join(f"~XPOINT?D${{{dst}}}\\\n" for dst in wanted))
+            while len(results) < len(wanted):
+                reply = waiter.get(self.timeout if timeout is None else timeout)
+                if reply is None:
+                    break
+                results[reply.args['D']] = reply.args.get('S')
+        finally:
+            self.release(waiter)
+
+        if len(results) < len(wanted):
+            logger.warning(f"No status reply for {len(wanted) - len(results)} of {len(wanted)} destinations")
+            self.record_failure('status_many')
+        else:
+            self.record('status_many', started)
+        return results
+
+    def status_all(self, timeout=None, idle=0.25):
+        #Query every destination at once with ~XPOINT? and parse the streamed reply.
+        #The router sends one ~XPOINT% per destination with no terminator, so the
+        #stream is considered complete once it goes quiet for `idle` seconds.
+        if not self.ensure_connection():
+            return {}
+
+        results = {}
+        started = time.monotonic()
+        waiter = self.expect(lambda m: m.command == 'XPOINT' and m.op == '%' and 'D' in m.args)
+        try:
+            self.send("~XPOINT?\\\n")
+            reply = waiter.get(self.timeout if timeout is None else timeout)
+            while reply is not None:
+                results[reply.args['D']] = reply.args.get('S')
+                reply = waiter.get(idle)
+        finally:
+            self.release(waiter)
+
+        logger.info(f"Matrix query returned {len(results)} destinations")
+        if results:
+            self.record('status_all', started)
+        else:
+            self.record_failure('status_all')
+        return results
+
+    def lock_status_all(self, timeout=None, idle=0.25):
+        #Query every destination's lock state at once with ~LOCK?; like ~XPOINT? the reply
+        #has no terminator and is complete once quiet for `idle` seconds.
+        #Returns {destination: True if locked}.
+        if not self.ensure_connection():
+            return {}
+
+        results = {}
+        started = time.monotonic()
+        waiter = self.expect(lambda m: m.command == 'LOCK' and m.op == '%' and 'D' in m.args)
+        try:
+            self.send("~LOCK?\\\n")
+            reply = waiter.get(self.timeout if timeout is None else timeout)
+            while reply is not None:
+                results[reply.args['D']] = reply.args.get('V') == 'ON'
+                reply = waiter.get(idle)
+        finally:
+            self.release(waiter)
+
+        logger.info(f"Lock query returned {len(results)} destinations, {sum(results.values())} locked")
+        if results:
+            self.record('lock_status_all', started)
+        else:
+            self.record_failure('lock_status_all')
+        return results
+
     def route(self, src, dst, retries=3):
         #route a source to a destination
-        for attempt in range(retries):
-            self.clear_buffer()
-            command = f"~XPOINT:S${{{src}}};D${{{dst}}}\\\n"  
-            self.sock.sendall(command.encode())
+        return self.route_timed(src, dst, retries)[0]
 
-            time.sleep(0.5)  
+    def route_timed(self, src, dst, retries=3, timeout=None):
+        #Route and confirm from the router's own ~XPOINT% acknowledgement for dst.
+        #Only if none arrives within the confirm deadline is the crosspoint queried, once.
+        #Only socket errors are retried. Returns (True | False | "locked", take latency in seconds).
+        if not self.ensure_connection():
+            self.record_failure('route')
+            return False, None
 
-            response = self.sock.recv(4096).decode()
-            logger.debug(f"Router Response: '{response.strip()}'")
+        if self.locks is not None and self.locks.is_locked(dst):
+            logger.info(f"Destination '{dst}' is locked, take refused without a router round trip")
+            return "locked", 0.0
 
-            if "LOCK!D" in response:
+        confirm_timeout = self.confirm_timeout if timeout is None else timeout
+        command = f"~XPOINT:S${{{src}}};D${{{dst}}}\\\n"
+        for attempt in range(retries):
+            started = time.monotonic()
+            try:
+                response = self.request(command, lambda m: m.args.get('D') == dst and m.command == 'XPOINT' and (m.op == '!' or (m.op == '%' and m.args.get('S') == src)), confirm_timeout)
+            except socket.error as e:
+                logger.error(f"Socket error during route: {str(e)}")
+                self.connected = False
+                if attempt == retries - 1 or self.supervised:
+                    break
+                self.record_retry('route')
+                time.sleep(1)
+                self.ensure_connection()
+                continue
+            latency = time.monotonic() - started
+            logger.debug(f"Router Response: '{response.raw if response else ''}'")
+
+            if response and "LOCK!D" in response.raw:
                 logger.info(f"Destination '{dst}' is locked")
-                return "locked" 
-                
+                return "locked", latency
+
+            if response and response.op == '!':
+                # The router rejected the take outright (e.g. an unknown name); retrying cannot help
+                logger.error(f"Router refused Source '{src}' to Destination '{dst}': '{response.raw}'")
+                self.record_failure('route')
+                return False, latency
+
+            if response:
+                logger.info(f"Successfully routed Source '{src}' to Destination '{dst}' in {latency * 1000:.1f}ms")
+                self.record('route', started)
+                return True, latency
+
+            logger.warning(f"No acknowledgement for Destination '{dst}' after {confirm_timeout}s, querying status")
             current_source = self.status(dst)
+            latency = time.monotonic() - started
             if current_source == src:
                 logger.info(f"Successfully routed Source '{src}' to Destination '{dst}'")
-                return True
-            else:
-                logger.warning(f"Attempt {attempt + 1} failed. Unexpected response.")
+                self.record('route', started)
+                return True, latency
+            logger.error(f"Take of Source '{src}' to Destination '{dst}' was not confirmed, Destination reports '{current_source}'")
+            self.record_failure('route')
+            return False, latency
 
         logger.error(f"Failed to route Source '{src}' to Destination '{dst}' after {retries} attempts.")
-        return False
+        self.record_failure('route')
+        return False, None
+
+    def salvo(self, pairs, timeout=None):
+        #Route many (source, destination) pairs with one buffered write, confirm them
+        #from the ~XPOINT% reply stream, then verify any stragglers with a single
+        #pipelined status pass. Returns {destination: True | False | "locked"}.
+        expected = {dst: src for src, dst in pairs}
+        if not expected or not self.ensure_connection():
+            return {dst: False for dst in expected}
+
+        refused = {}
+        if self.locks is not None:
+            refused = {dst: "locked" for dst in expected if self.locks.is_locked(dst)}
+            expected = {dst: src for dst, src in expected.items() if dst not in refused}
+            if not expected:
+                return refused
+
+        results, _ = self.fire_salvo(expected, self.encode_salvo((src, dst) for dst, src in expected.items()), timeout)
+        results.update(refused)
+        return results
+
+    @staticmethod
+    def encode_salvo(pairs):
+        #The exact bytes of a salvo: one ~XPOINT: take per (source, destination), for a single write
+        return "".join(f"~XPOINT:S${{{src}}};D${{{dst}}}\\\n" for src, dst in pairs).encode()
+
+    def fire_salvo(self, expected, data, timeout=None, at=None):
+        #Write pre-encoded takes in one write, at wall-clock time `at` if given, and confirm
+        #them as salvo() does. expected is {destination: source}.
+        #Returns (results, wall-clock time the write started).
+        if at is not None:
+            wait_until(at)
+        results = {}
+        waiter = self.expect(lambda m: m.args.get('D') in expected and m.command == 'XPOINT' and m.op in ('%', '!'))
+        try:
+            sent_at = time.time()
+            started = time.monotonic()
+            self.send_bytes(data)
+            deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+            while len(results) < len(expected):
+                reply = waiter.get(deadline - time.monotonic())
+                if reply is None:
+                    break
+                dst = reply.args['D']
+                if 'LOCK!D' in reply.raw:
+                    results[dst] = "locked"
+                elif reply.op == '!':
+                    results[dst] = False
+                elif reply.args.get('S') == expected[dst]:
+                    results[dst] = True
+        finally:
+            self.release(waiter)
+
+        unconfirmed = [dst for dst in expected if dst not in results]
+        if unconfirmed:
+            current = self.status_many(unconfirmed)
+            for dst in unconfirmed:
+                results[dst] = current.get(dst) == expected[dst]
+
+        failed = [dst for dst, result in results.items() if result is not True]
+        if failed:
+            logger.warning(f"Salvo failed for {len(failed)} of {len(results)} destinations: {failed}")
+            self.record_failure('salvo')
+        else:
+            logger.info(f"Salvo routed {len(results)} destinations")
+            self.record('salvo', started)
+        return results, sent_at
 
     def close(self):
         #Close the connection to the router.
         if self.sock:
-            self.sock.close()
+            sock, self.sock = self.sock, None
             self.connected = False
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
             logger.info("Router connection closed")
 
     def clear_route(self, src, retries=3):
@@ -131,80 +687,1260 @@ class IP3Router:
 
         for attempt in range(retries):
             try:
-                self.clear_buffer()
                 command = f"~XPOINT%D${{{src}}}\\\n"
-                self.sock.sendall(command.encode())
-
-                time.sleep(1.0)
-
-                response = self.sock.recv(4096).decode()
-                logger.info(f"Clear Route Response: '{response.strip()}'")
+                reply = self.request(command, lambda m: m.command == 'XPOINT' or '!' in m.op)
+                response = reply.raw if reply else ""
+                logger.info(f"Clear Route Response: '{response}'")
 
                 if "cleared" in response or f"D${{{src}}}" not in response:
                     logger.info(f"Successfully cleared route for Source '{src}'")
                     return True
                 else:
-                    logger.warning(f"Attempt {attempt + 1} failed. Response: '{response.strip()}'")
+                    logger.warning(f"Attempt {attempt + 1} failed. Response: '{response}'")
 
             except socket.error as e:
                 logger.error(f"Socket error during clear route: {str(e)}")
                 self.connected = False
-                if attempt == retries - 1:
+                if attempt == retries - 1 or self.supervised:
                     return False
-                time.sleep(1)  
+                time.sleep(1)
+                self.ensure_connection()
 
         logger.error(f"Failed to clear route for Source '{src}' after {retries} attempts.")
         return False
-    
+
     def lock_destination(self, dst, retries=3):
-        #Lock a destination
+        #Lock a destination; succeeds only once the router reports it locked
+        if not self.ensure_connection():
+            return False
+
+        started = time.monotonic()
+        command = f"LOCK:D${{{dst}}};V${{ON}};U#{{20}}\\\n"
         for attempt in range(retries):
-            self.clear_buffer()
-            command = f"LOCK:D${{{dst}}};V${{ON}};U#{{20}}\\\n"
-            self.sock.sendall(command.encode())
+            try:
+                reply = self.request(command, lambda m: m.command == 'LOCK' and m.args.get('D') == dst)
+            except socket.error as e:
+                logger.error(f"Socket error during lock: {str(e)}")
+                self.connected = False
+                if attempt == retries - 1 or self.supervised:
+                    break
+                self.record_retry('lock')
+                time.sleep(1)
+                self.ensure_connection()
+                continue
+            logger.debug(f"Lock Response: '{reply.raw if reply else ''}'")
+
+            if reply and reply.op == '%' and reply.args.get('V') == 'ON':
+                logger.info(f"Successfully locked destination '{dst}'")
+                self.record('lock', started)
+                return True
+            elif reply:
+                logger.warning(f"Router refused to lock destination '{dst}'")
+            else:
+                logger.warning(f"No reply to lock destination '{dst}' after {self.timeout}s")
+            break
 
-            time.sleep(0.5)
+        logger.error(f"Failed to lock destination '{dst}'")
+        self.record_failure('lock')
+        return False
 
-            response = self.sock.recv(4096).decode()
-            print(f"Lock Response: '{response.strip()}'")
+    def unlock_destination(self, dst, retries=3):
+        #Unlock a destination
+        if not self.ensure_connection():
+            return False
 
-            print(f"Lock command sent for destination '{dst}'")
-            return True
+        started = time.monotonic()
+        command = f"LOCK:D${{{dst}}};V${{OFF}};U#{{20}}\\\n"
+        for attempt in range(retries):
+            try:
+                reply = self.request(command, lambda m: m.command == 'LOCK' and m.args.get('D') == dst)
+            except socket.error as e:
+                logger.error(f"Socket error during unlock: {str(e)}")
+                self.connected = False
+                if attempt == retries - 1 or self.supervised:
+                    break
+                self.record_retry('unlock')
+                time.sleep(1)
+                self.ensure_connection()
+                continue
+            logger.debug(f"Unlock Response: '{reply.raw if reply else ''}'")
+
+            if reply and reply.op == '%' and reply.args.get('V') == 'OFF':
+                logger.info(f"Successfully unlocked destination '{dst}'")
+                self.record('unlock', started)
+                return True
+            elif reply:
+                logger.warning(f"Router refused to unlock destination '{dst}'")
+            else:
+                logger.warning(f"No reply to unlock destination '{dst}' after {self.timeout}s")
+            break
 
+        logger.error(f"Failed to unlock destination '{dst}'")
+        self.record_failure('unlock')
         return False
 
-    def unlock_destination(self, dst, retries=3):
-        #Unlock a destination
+    def lock_many(self, dsts, locked=True, timeout=None):
+        #Lock or unlock several destinations with one pipelined write.
+        #Returns {destination: True if the router confirmed the new state}.
+        wanted = set(dsts)
+        if not wanted or not self.ensure_connection():
+            return {dst: False for dst in wanted}
+
+        value = 'ON' if locked else 'OFF'
+        results = {}
+        started = time.monotonic()
+        deadline = started + (self.timeout if timeout is None else timeout)
+        waiter = self.expect(lambda m: m.command == 'LOCK' and m.args.get('D') in wanted)
+        try:
+            self.send("".join(f"LOCK:D${{{dst}}};V${{{value}}};U#{{20}}\\\n" for dst in wanted))
+            while len(results) < len(wanted):
+                reply = waiter.get(deadline - time.monotonic())
+                if reply is None:
+                    break
+                results[reply.args['D']] = reply.op == '%' and reply.args.get('V') == value
+        finally:
+            self.release(waiter)
+
+        failed = [dst for dst in wanted if not results.get(dst)]
+        if failed:
+            logger.warning(f"Failed to {'lock' if locked else 'unlock'} {len(failed)} of {len(wanted)} destinations: {failed}")
+            self.record_failure('lock_many')
+        else:
+            self.record('lock_many', started)
+        return {dst: results.get(dst, False) for dst in wanted}
+
+class AsyncReplyWaiter:
+    #A coroutine waiting for router messages that satisfy match(); filled by the read task
+    def __init__(self, match):
+        self.match = match
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout):
+        #Next matching message, or None on timeout or disconnect
+        try:
+            return await asyncio.wait_for(self.queue.get(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return None
+
+
+class AsyncIP3Router:
+    #asyncio client for automation integrations. One connection carries any number of
+    #commands in flight at once: each caller registers a waiter before sending and the
+    #read task hands every framed reply to the waiters it matches, as IP3Router does.
+    def __init__(self, host, port=52116, timeout=2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.waiters = []
+        self.subscribers = set()
+        self.read_task = None
+
+    async def connect(self):
+        if self.connected:
+            return True
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), 5)
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.error(f"Failed to connect to router: {str(e)}")
+            return False
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected = True
+        self.read_task = asyncio.get_running_loop().create_task(self._read_loop())
+        logger.info(f"Async client connected to router at {self.host}:{self.port}")
+        return True
+
+    async def close(self):
+        if self.writer:
+            writer, self.writer = self.writer, None
+            self.connected = False
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        if self.read_task:
+            await self.read_task
+
+    async def __aenter__(self):
+        if not await self.connect():
+            raise ConnectionError(f"Could not connect to router at {self.host}:{self.port}")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _read_loop(self):
+        framer = LRCFramer()
+        try:
+            while True:
+                data = await self.reader.read(4096)
+                if not data:
+                    if self.connected:
+                        logger.warning("Router closed the connection")
+                    break
+                for message in framer.feed(data):
+                    self._dispatch(message)
+        except OSError as e:
+            if self.connected:
+                logger.error(f"Socket error in async router reader: {str(e)}")
+        finally:
+            self.connected = False
+            for waiter in self.waiters:
+                waiter.queue.put_nowait(None)
+            for subscriber in self.subscribers:
+                subscriber.put_nowait(None)
+
+    def _dispatch(self, message):
+        for waiter in self.waiters:
+            if waiter.match(message):
+                waiter.queue.put_nowait(message)
+
+        if message.op != '%' or 'D' not in message.args:
+            return
+        if message.command == 'XPOINT' and 'S' in message.args:
+            event = {'event': 'xpoint', 'destination': message.args['D'], 'source': message.args['S']}
+        elif message.command == 'LOCK' and 'V' in message.args:
+            event = {'event': 'lock', 'destination': message.args['D'], 'locked': message.args['V'] == 'ON'}
+        else:
+            return
+        for subscriber in list(self.subscribers):
+            if subscriber.full():
+                # A consumer that stops iterating is ended rather than buffered without bound
+                self.subscribers.discard(subscriber)
+                subscriber.get_nowait()
+                subscriber.put_nowait(None)
+                logger.warning("Ending a tally event consumer that fell behind")
+            else:
+                subscriber.put_nowait(event)
+
+    def expect(self, match):
+        waiter = AsyncReplyWaiter(match)
+        self.waiters.append(waiter)
+        return waiter
+
+    def release(self, waiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+
+    async def send(self, command):
+        #Each write is queued whole by the transport, so concurrent commands never interleave
+        if not self.connected:
+            raise ConnectionError("Router not connected")
+        self.writer.write(command.encode())
+        await self.writer.drain()
+
+    async def request(self, command, match, timeout=None):
+        waiter = self.expect(match)
+        try:
+            await self.send(command)
+            return await waiter.get(self.timeout if timeout is None else timeout)
+        finally:
+            self.release(waiter)
+
+    async def stream(self, command, match, until, timeout=None):
+        #Async generator of matching replies, until one satisfies until()
+        waiter = self.expect(match)
+        try:
+            await self.send(command)
+            while True:
+                message = await waiter.get(self.timeout if timeout is None else timeout)
+                if message is None:
+                    logger.warning(f"Incomplete reply to '{command.strip()}'")
+                    return
+                yield message
+                if until(message):
+                    return
+        finally:
+            self.release(waiter)
+
+    async def query_names(self, kind):
+        #Async generator of (index, name) from a ~SRC?/~DEST? name dump
+        async for message in self.stream(f"~{kind}?Q${{NAME}}\\\n", lambda m: m.command == kind, lambda m: m.args.get('Q') == 'NAME'):
+            index = message.args.get('I', '')
+            name = message.args.get('NAME')
+            if index.isdigit() and name:
+                yield int(index), name
+
+    async def status(self, dst, retries=3):
+        #Current source for dst, or None; an ~XPOINT! error reply fails at once
         for attempt in range(retries):
-            self.clear_buffer()
-            command = f"LOCK:D${{{dst}}};V${{OFF}};U#{{20}}\\\n" 
-            self.sock.sendall(command.encode())
+            reply = await self.request(f"~XPOINT?D${{{dst}}}\\\n", lambda m: m.command == 'XPOINT' and m.op in ('%', '!') and m.args.get('D') == dst)
+            if reply and reply.op == '!':
+                logger.warning(f"Router refused status query for {dst}: '{reply.raw}'")
+                return None
+            if reply:
+                return reply.args.get('S')
+            if not self.connected:
+                break
+            logger.warning(f"Attempt {attempt + 1} failed. Retrying...")
+        return None
 
-            time.sleep(0.5)
+    async def route(self, src, dst, timeout=None):
+        #Take src to dst, confirmed from the router's ~XPOINT% acknowledgement.
+        #Returns True, False or "locked".
+        reply = await self.request(f"~XPOINT:S${{{src}}};D${{{dst}}}\\\n",
+                                   lambda m: m.args.get('D') == dst and m.command == 'XPOINT' and (m.op == '!' or (m.op == '%' and m.args.get('S') == src)),
+                                   timeout)
+        if reply and 'LOCK!D' in reply.raw:
+            return "locked"
+        if reply and reply.op == '!':
+            return False
+        if reply:
+            return True
+        return self.connected and await self.status(dst, retries=1) == src
+
+    async def salvo(self, pairs, timeout=None):
+        #Take many (source, destination) pairs in one write. Returns {destination: True | False | "locked"}.
+        expected = {dst: src for src, dst in pairs}
+        results = {}
+        waiter = self.expect(lambda m: m.args.get('D') in expected and m.command == 'XPOINT' and m.op in ('%', '!'))
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        try:
+            await self.send("".join(f"~XPOINT:S${{{src}}};D${{{dst}}}\\\n" for dst, src in expected.items()))
+            while len(results) < len(expected):
+                reply = await waiter.get(deadline - time.monotonic())
+                if reply is None:
+                    break
+                dst = reply.args['D']
+                if 'LOCK!D' in reply.raw:
+                    results[dst] = "locked"
+                elif reply.op == '!':
+                    results[dst] = False
+                elif reply.args.get('S') == expected[dst]:
+                    results[dst] = True
+        finally:
+            self.release(waiter)
+        return {dst: results.get(dst, False) for dst in expected}
+
+    async def lock(self, dst, locked=True, timeout=None):
+        #Lock or unlock dst; True once the router confirms the new state
+        value = 'ON' if locked else 'OFF'
+        reply = await self.request(f"LOCK:D${{{dst}}};V${{{value}}};U#{{20}}\\\n",
+                                   lambda m: m.command == 'LOCK' and m.args.get('D') == dst, timeout)
+        return bool(reply) and reply.op == '%' and reply.args.get('V') == value
+
+    async def unlock(self, dst, timeout=None):
+        return await self.lock(dst, False, timeout)
+
+    async def tally_events(self, max_pending=1024):
+        #Async iterator of crosspoint and lock changes seen on the connection:
+        #{'event': 'xpoint', 'destination', 'source'} or {'event': 'lock', 'destination', 'locked'}.
+        #Ends when the connection closes.
+        subscriber = asyncio.Queue(max_pending)
+        self.subscribers.add(subscriber)
+        try:
+            while True:
+                event = await subscriber.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.subscribers.discard(subscriber)
+
+
+class CommandQueue:
+    #Runs router commands one at a time, in submission order, on a single worker thread.
+    #HTTP handlers run concurrently but never interleave commands on the router link.
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        #Submit and wait for the result; commands issued from the worker itself run inline
+        if threading.current_thread() is self.worker:
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+
+class RouterSupervisor:
+    #Keeps a router session alive from a background thread: heartbeats the link while it is
+    #up, and reconnects with exponential backoff and jitter when it drops, so HTTP requests
+    #never wait on TCP connection setup. Reconnects fire the router's connect listeners,
+    #which resync the tally and name tables.
+    def __init__(self, router, commands, heartbeat_destination, interval=5.0, max_missed=2, max_backoff=30.0, on_change=None):
+        self.router = router
+        self.commands = commands
+        self.heartbeat_destination = heartbeat_destination
+        self.interval = interval
+        self.max_missed = max_missed
+        self.max_backoff = max_backoff
+        self.on_change = on_change
+        self.rtt = None
+        self.last_heartbeat = None
+        self.reconnects = 0
+        self.failures = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.router.supervised = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    @property
+    def state(self):
+        return 'connected' if self.router.connected else 'disconnected'
+
+    def _run(self):
+        missed = 0
+        while not self.stop_event.is_set():
+            if not self.router.connected:
+                missed = 0
+                self._reconnect()
+                continue
+
+            # Sleep until the next heartbeat, waking early if the reader thread sees the link drop
+            deadline = time.monotonic() + self.interval
+            while self.router.connected and not self.stop_event.is_set() and time.monotonic() < deadline:
+                self.stop_event.wait(min(0.25, deadline - time.monotonic()))
+            if not self.router.connected or self.stop_event.is_set():
+                self._changed()
+                continue
+
+            dst = self.heartbeat_destination()
+            if dst is None:
+                continue
+            try:
+                rtt = self.commands.call(self.router.ping, dst)
+            except socket.error:
+                rtt = None
+            if rtt is None:
+                missed += 1
+                metrics.increment('lrc_heartbeat_misses_total', frame=self.router.name)
+                logger.warning(f"Router heartbeat missed ({missed}/{self.max_missed})")
+                if missed >= self.max_missed:
+                    logger.error("Router stopped answering heartbeats, reconnecting")
+                    self.router.close()
+                    self._changed()
+            else:
+                missed = 0
+                self.rtt = rtt
+                self.last_heartbeat = time.time()
+
+    def _reconnect(self):
+        if self.router.connect():
+            if self.failures or self.last_heartbeat is not None:
+                self.reconnects += 1
+            self.failures = 0
+            self.last_heartbeat = time.time()
+            self._changed()
+            return
+
+        self.failures += 1
+        delay = min(self.max_backoff, 0.5 * 2 ** self.failures) * random.uniform(0.5, 1.0)
+        logger.info(f"Reconnecting to router in {delay:.1f}s (attempt {self.failures})")
+        self.stop_event.wait(delay)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self)
+
+    def describe(self):
+        return {
+            'state': self.state,
+            'rtt': self.rtt,
+            'last_heartbeat_age': None if self.last_heartbeat is None else time.time() - self.last_heartbeat,
+            'reconnects': self.reconnects,
+            'failed_attempts': self.failures
+        }
 
-            response = self.sock.recv(4096).decode()
-            print(f"Unlock Response: '{response.strip()}'")
 
-            if response:
-                print(f"Successfully unlocked destination '{dst}'")
-                return True
+class EventBroadcaster:
+    #Fans router change events out to every connected /events client.
+    #A client that stops reading is dropped rather than allowed to grow without bound.
+    def __init__(self, max_pending=256):
+        self.max_pending = max_pending
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self.lock:
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.put_nowait((event, data))
+                except queue.Full:
+                    logger.warning("Dropping slow event subscriber")
+                    self.subscribers.discard(subscriber)
+
+    @property
+    def count(self):
+        return len(self.subscribers)
+
+
+class TallyMatrix:
+    #Crosspoint state held in typed arrays indexed by router destination number: the
+    #routed source number (0 for none), when it was last reported and the version at which
+    #it last changed. Every change bumps one counter, so clients can ask for just the
+    #destinations changed since the version they last saw. Names missing from the router
+    #tables are given numbers after the last table entry. Not thread-safe; TallyCache
+    #holds its lock around every call.
+    def __init__(self):
+        self.sources = array('i')
+        self.updated = array('d')
+        self.versions = array('q')
+        # Start from the clock so versions handed out before a restart predate the baseline
+        self.version = time.time_ns() // 1000000
+        self.baseline = self.version
+        self.count = 0
+        self.table_destinations = {}
+        self.table_sources = {}
+        self.destination_names = {}
+        self.destination_numbers = {}
+        self.source_names = {}
+        self.source_numbers = {}
+        self.next_destination = 1
+        self.next_source = 1
+
+    def intern_destination(self, name):
+        #The number for a destination, assigning the next free one if it is not in the router table
+        number = self.destination_numbers.get(name)
+        if number is None:
+            number = self.next_destination
+            self.next_destination += 1
+            self.destination_numbers[name] = number
+            self.destination_names[number] = name
+        return number
+
+    def intern_source(self, name):
+        number = self.source_numbers.get(name)
+        if number is None:
+            number = self.next_source
+            self.next_source += 1
+            self.source_numbers[name] = number
+            self.source_names[number] = name
+        return number
+
+    def slot(self, dst):
+        number = self.intern_destination(dst)
+        if number >= len(self.sources):
+            grow = number + 1 - len(self.sources)
+            self.sources.extend(array('i', [0]) * grow)
+            self.updated.extend(array('d', [0.0]) * grow)
+            self.versions.extend(array('q', [self.baseline]) * grow)
+        return number
+
+    def renumber(self, destinations, sources):
+        #Re-index for new router name tables ({number: name}), keeping the current state.
+        #Returns False if the tables are unchanged and nothing needed rebuilding.
+        if destinations == self.table_destinations and sources == self.table_sources:
+            return False
+        state = [(dst, src, self.updated[number]) for number, dst in self.destination_names.items()
+                 if number < len(self.sources) and self.sources[number]
+                 for src in [self.source_names[self.sources[number]]]]
+
+        self.table_destinations = dict(destinations)
+        self.table_sources = dict(sources)
+        self.destination_names = dict(destinations)
+        self.destination_numbers = {name: number for number, name in destinations.items()}
+        self.source_names = dict(sources)
+        self.source_numbers = {name: number for number, name in sources.items()}
+        self.next_destination = max(destinations, default=0) + 1
+        self.next_source = max(sources, default=0) + 1
+        # Versions from before the renumbering no longer describe the same slots
+        self.version += 1
+        self.baseline = self.version
+        size = max(destinations, default=0) + 1
+        self.sources = array('i', [0]) * size
+        self.updated = array('d', [0.0]) * size
+        self.versions = array('q', [self.version]) * size
+        for dst, src, updated in state:
+            number = self.slot(dst)
+            self.sources[number] = self.intern_source(src)
+            self.updated[number] = updated
+        self.count = len(state)
+        return True
+
+    def set(self, dst, src, when):
+        #Record a reported crosspoint; returns True if it changed
+        number = self.slot(dst)
+        source = self.intern_source(src)
+        self.updated[number] = when
+        if self.sources[number] == source:
+            return False
+        if not self.sources[number]:
+            self.count += 1
+        self.version += 1
+        self.sources[number] = source
+        self.versions[number] = self.version
+        return True
+
+    def get(self, dst):
+        #(source, time last reported), or (None, None) if the destination has no known crosspoint
+        number = self.destination_numbers.get(dst)
+        if number is None or number >= len(self.sources) or not self.sources[number]:
+            return None, None
+        return self.source_names[self.sources[number]], self.updated[number]
+
+    def items(self, since=None):
+        #{destination: source} for every known crosspoint, or only those changed after `since`
+        names, source_names, sources, versions = self.destination_names, self.source_names, self.sources, self.versions
+        return {names[number]: source_names[source] for number, source in enumerate(sources)
+                if source and (since is None or versions[number] > since)}
+
+    def changed_since(self, since):
+        #{destination: source} changed after version `since`, or None if `since` is from
+        #before the last renumbering (or from another server) and cannot be diffed
+        if since < self.baseline or since > self.version:
+            return None
+        return self.items(since)
+
+
+class TallyCache:
+    #In-memory destination -> source table, seeded from the router and kept current
+    #from the ~XPOINT% notifications the router sends whenever a crosspoint changes.
+    #The state is held in a versioned TallyMatrix so clients can also sync by difference.
+    def __init__(self, router, commands, destinations):
+        self.router = router
+        self.commands = commands
+        self.destinations = destinations
+        self.matrix = TallyMatrix()
+        self.synced_at = None
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.change_listeners = []
+        self.sync_listeners = []
+        router.add_listener(self.on_message)
+        router.add_connect_listener(self.resync)
+
+    def on_message(self, message):
+        if message.command == 'XPOINT' and message.op == '%' and 'D' in message.args and 'S' in message.args:
+            self.update(message.args['D'], message.args['S'])
+
+    def update(self, dst, src):
+        with self.lock:
+            changed = self.matrix.set(dst, src, time.time())
+        if changed:
+            for callback in self.change_listeners:
+                callback(dst, src)
+
+    def add_change_listener(self, callback):
+        #Call callback(destination, source) whenever a crosspoint changes
+        self.change_listeners.append(callback)
+
+    def add_sync_listener(self, callback):
+        #Call callback({destination: source}) with the whole matrix after every full sync
+        self.sync_listeners.append(callback)
+
+    @property
+    def stale(self):
+        #True until a full sync has completed on the current connection
+        connected_at = self.router.connected_at
+        return not self.router.connected or self.synced_at is None or connected_at is None or self.synced_at < connected_at
+
+    def snapshot(self):
+        with self.lock:
+            return self.matrix.items()
+
+    def renumber(self, destinations, sources):
+        #Re-index the versioned matrix after the router name tables (re)load
+        with self.lock:
+            if self.matrix.renumber(destinations, sources):
+                logger.info(f"Tally matrix indexed {len(destinations)} destinations at version {self.matrix.version}")
+
+    def changes(self, since=None):
+        #Return (version, full, {dst: src}): only destinations changed after version
+        #`since`, or the whole table if since is None or too old to diff against
+        with self.lock:
+            changed = None if since is None else self.matrix.changed_since(since)
+            if changed is None:
+                return self.matrix.version, True, self.matrix.items()
+            return self.matrix.version, False, changed
+
+    def lookup(self, dst):
+        #Return (source, age in seconds) from memory, or (None, None) if the destination is unknown
+        with self.lock:
+            source, updated = self.matrix.get(dst)
+        if source is None:
+            return None, None
+        return source, time.time() - updated
+
+    def resync(self):
+        #Reload the whole matrix from the router; called after each (re)connect.
+        if not self.sync_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.router.ensure_connection():
+                return
+            started = time.time()
+            crosspoints = self.commands.call(self.router.status_all)
+            if not crosspoints:
+                # Frames that ignore the bulk query still answer per-destination ones
+                destinations = self.destinations()
+                if not destinations:
+                    return
+                crosspoints = self.commands.call(self.router.status_many, destinations)
+            for dst, src in crosspoints.items():
+                self.update(dst, src)
+            self.synced_at = started
+            logger.info(f"Tally cache synced {self.matrix.count} destinations in {time.time() - started:.3f}s")
+            for callback in self.sync_listeners:
+                callback(crosspoints)
+        finally:
+            self.sync_lock.release()
+
+    def resync_async(self):
+        threading.Thread(target=self.resync, daemon=True).start()
+
+
+class LockCache:
+    #Locked destinations, seeded with one ~LOCK? query after each (re)connect and kept
+    #current from ~LOCK% notifications, so takes on locked destinations are refused locally.
+    def __init__(self, router, commands):
+        self.router = router
+        self.commands = commands
+        self.locked = set()
+        self.synced_at = None
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.change_listeners = []
+        router.add_listener(self.on_message)
+        router.add_connect_listener(self.resync)
+
+    def on_message(self, message):
+        if message.command == 'LOCK' and message.op == '%' and 'D' in message.args and 'V' in message.args:
+            self.update(message.args['D'], message.args['V'] == 'ON')
+        elif 'LOCK!D' in message.raw and 'D' in message.args:
+            # A take refused as locked proves the lock even if its notification was missed
+            self.update(message.args['D'], True)
+
+    def update(self, dst, locked):
+        with self.lock:
+            changed = (dst in self.locked) != locked
+            if locked:
+                self.locked.add(dst)
             else:
-                print(f"Attempt {attempt + 1} failed to unlock destination")
+                self.locked.discard(dst)
+        if changed:
+            for callback in self.change_listeners:
+                callback(dst, locked)
+
+    def add_change_listener(self, callback):
+        #Call callback(destination, locked) whenever a destination's lock state changes
+        self.change_listeners.append(callback)
+
+    @property
+    def stale(self):
+        #True until a full lock query has completed on the current connection
+        connected_at = self.router.connected_at
+        return not self.router.connected or self.synced_at is None or connected_at is None or self.synced_at < connected_at
+
+    def is_locked(self, dst):
+        with self.lock:
+            return dst in self.locked
+
+    def snapshot(self):
+        with self.lock:
+            return sorted(self.locked)
+
+    def resync(self):
+        #Reload every lock from the router; called after each (re)connect.
+        #Frames that do not answer ~LOCK? are tracked from notifications alone.
+        if not self.sync_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.router.ensure_connection():
+                return
+            started = time.time()
+            states = self.commands.call(self.router.lock_status_all)
+            if not states:
+                # No answer is not "nothing locked"; keep what the notifications said
+                return
+            for dst in set(self.locked) - set(states):
+                self.update(dst, False)
+            for dst, locked in states.items():
+                self.update(dst, locked)
+            self.synced_at = started
+            logger.info(f"Lock cache synced: {len(self.locked)} of {len(states)} destinations locked")
+        finally:
+            self.sync_lock.release()
+
+
+def wait_until(when):
+    #Block until wall-clock time `when`: sleep most of the way, then spin the last
+    #couple of milliseconds, since sleep() alone can overshoot by a scheduler tick.
+    while True:
+        remaining = when - time.time()
+        if remaining <= 0:
+            return
+        if remaining > 0.003:
+            time.sleep(remaining - 0.002)
+
+def parse_timecode(timecode, fps=25):
+    #Time-of-day timecode HH:MM:SS:FF (or HH:MM:SS;FF) to the next matching wall-clock time
+    parts = re.split(r'[:;.]', timecode)
+    if len(parts) != 4 or not all(part.isdigit() for part in parts):
+        raise ValueError(f"Timecode must be HH:MM:SS:FF, got '{timecode}'")
+    hours, minutes, seconds, frame_number = (int(part) for part in parts)
+    if hours > 23 or minutes > 59 or seconds > 59 or frame_number >= fps:
+        raise ValueError(f"Timecode out of range: '{timecode}'")
+    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    when = midnight + hours * 3600 + minutes * 60 + seconds + frame_number / fps
+    # A timecode already past today means the same time tomorrow
+    return when if when > time.time() else when + 86400
+
+
+class SalvoScheduler:
+    #Fires route sets at a set wall-clock instant. Routes are resolved, validated against
+    #the name tables and lock cache, and encoded to their exact ~XPOINT: bytes when the job
+    #is scheduled; at the deadline they go out in one write from this thread, bypassing
+    #the command queue, and the write's offset from the target is reported as jitter.
+    def __init__(self, frame, lead=0.25, keep=100):
+        self.frame = frame
+        self.lead = lead
+        self.keep = keep
+        self.jobs = {}
+        self.next_id = 1
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, routes, fire_at, label=None):
+        #routes are (source, destination) pairs, alias or router names. Raises ValueError if invalid.
+        if fire_at <= time.time():
+            raise ValueError("Fire time is in the past")
+        pairs = [(SOURCE_ALIASES.get(src, src), DESTINATION_ALIASES.get(dst, dst)) for src, dst in routes]
+        if not pairs:
+            raise ValueError("At least one route is required")
+
+        problems = []
+        destinations = [dst for _, dst in pairs]
+        duplicates = sorted({dst for dst in destinations if destinations.count(dst) > 1})
+        if duplicates:
+            problems.append(f"destinations routed twice: {duplicates}")
+        known_sources, known_destinations = set(self.frame.sources.values()), set(self.frame.destinations.values())
+        if known_sources and known_destinations:
+            unknown = sorted({src for src, _ in pairs if src not in known_sources} | {dst for dst in destinations if dst not in known_destinations})
+            if unknown:
+                problems.append(f"unknown names: {unknown}")
+        locked = sorted(dst for dst in destinations if self.frame.locks.is_locked(dst))
+        if locked:
+            problems.append(f"locked destinations: {locked}")
+        if problems:
+            raise ValueError("; ".join(problems))
+
+        with self.condition:
+            job = {
+                'id': self.next_id,
+                'label': label,
+                'fire_at': fire_at,
+                'state': 'scheduled',
+                'routes': [{'source': src, 'destination': dst} for src, dst in pairs],
+                'expected': {dst: src for src, dst in pairs},
+                'data': IP3Router.encode_salvo(pairs)
+            }
+            self.next_id += 1
+            self.jobs[job['id']] = job
+            self.condition.notify()
+        logger.info(f"Salvo {job['id']} of {len(pairs)} routes scheduled for {datetime.fromtimestamp(fire_at).isoformat(timespec='milliseconds')}")
+        return self.describe(job)
+
+    def cancel(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != 'scheduled':
+                return None
+            job['state'] = 'cancelled'
+            self.condition.notify()
+            return self.describe(job)
+
+    def list(self):
+        with self.condition:
+            return [self.describe(job) for job in sorted(self.jobs.values(), key=lambda job: job['fire_at'])]
+
+    @staticmethod
+    def describe(job):
+        described = {key: value for key, value in job.items() if key not in ('expected', 'data')}
+        described['routes'] = [dict(route) for route in job['routes']]
+        return described
+
+    def _run(self):
+        while True:
+            with self.condition:
+                pending = [job for job in self.jobs.values() if job['state'] == 'scheduled']
+                job = min(pending, key=lambda job: job['fire_at'], default=None)
+                if job is None or job['fire_at'] - time.time() > self.lead:
+                    # Wake shortly before the next deadline, or when a job is added or cancelled
+                    self.condition.wait(None if job is None else job['fire_at'] - time.time() - self.lead)
+                    continue
+                job['state'] = 'firing'
+            self._fire(job)
+            self._prune()
+
+    def _fire(self, job):
+        # A lock taken since scheduling is honoured; those destinations are left alone
+        expected = job['expected']
+        locked = {dst for dst in expected if self.frame.locks.is_locked(dst)}
+        if locked:
+            expected = {dst: src for dst, src in expected.items() if dst not in locked}
+            data = IP3Router.encode_salvo((src, dst) for dst, src in expected.items())
+        else:
+            data = job['data']
+
+        results = {}
+        try:
+            if expected:
+                results, sent_at = self.frame.router.fire_salvo(expected, data, at=job['fire_at'])
+            else:
+                wait_until(job['fire_at'])
+                sent_at = time.time()
+            job['fired_at'] = sent_at
+            job['jitter'] = sent_at - job['fire_at']
+            metrics.observe('lrc_salvo_fire_jitter_seconds', abs(job['jitter']), frame=self.frame.name)
+        except (ConnectionError, socket.error) as e:
+            logger.error(f"Scheduled salvo {job['id']} could not be sent: {str(e)}")
+            job['error'] = str(e)
+
+        results.update({dst: "locked" for dst in locked})
+        for route in job['routes']:
+            result = results.get(route['destination'], False)
+            route['success'] = result is True
+            route['locked'] = result == "locked"
+        job['state'] = 'fired' if all(route['success'] for route in job['routes']) else 'failed'
+        logger.info(f"Salvo {job['id']} {job['state']}, jitter {job.get('jitter', 0) * 1000:.2f}ms")
+        self.frame.events.publish('salvo', dict(self.describe(job), frame=self.frame.name))
+
+    def _prune(self):
+        with self.condition:
+            finished = sorted((job for job in self.jobs.values() if job['state'] not in ('scheduled', 'firing')),
+                              key=lambda job: job['fire_at'])
+            for job in finished[:-self.keep]:
+                del self.jobs[job['id']]
+
+
+class JournalSegment:
+    #One append-only journal file plus its index: a sparse time -> offset table for range
+    #scans and, per destination, the time and offset of every record that touches it.
+    SPARSE_EVERY = 256
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path[:-len('.jsonl')] + '.idx.json'
+        self.start = None
+        self.end = None
+        self.count = 0
+        self.size = 0
+        self.sparse_times = array('d')
+        self.sparse_offsets = array('q')
+        self.destination_times = {}
+        self.destination_offsets = {}
+        self.lock_times = {}
+        self.lock_offsets = {}
+
+    def add(self, record, offset):
+        timestamp = record['t']
+        if self.count % self.SPARSE_EVERY == 0:
+            self.sparse_times.append(timestamp)
+            self.sparse_offsets.append(offset)
+        if self.start is None:
+            self.start = timestamp
+        self.end = timestamp
+        self.count += 1
+        dst = record['d']
+        if dst not in self.destination_times:
+            self.destination_times[dst] = array('d')
+            self.destination_offsets[dst] = array('q')
+        self.destination_times[dst].append(timestamp)
+        self.destination_offsets[dst].append(offset)
+        if record['e'] == 'l':
+            # Locks are rare next to takes; indexed apart so the last one is found directly
+            if dst not in self.lock_times:
+                self.lock_times[dst] = array('d')
+                self.lock_offsets[dst] = array('q')
+            self.lock_times[dst].append(timestamp)
+            self.lock_offsets[dst].append(offset)
+
+    def save_index(self):
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'start': self.start, 'end': self.end, 'count': self.count, 'size': self.size,
+                'sparse': [list(self.sparse_times), list(self.sparse_offsets)],
+                'destinations': {dst: [list(times), list(self.destination_offsets[dst])]
+                                 for dst, times in self.destination_times.items()},
+                'locks': {dst: [list(times), list(self.lock_offsets[dst])]
+                          for dst, times in self.lock_times.items()}
+            }, f, separators=(',', ':'))
+
+    def load_index(self):
+        #Load the sidecar index, rebuilding it from the segment if it is missing or damaged
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+            self.start, self.end, self.count, self.size = index['start'], index['end'], index['count'], index['size']
+            self.sparse_times, self.sparse_offsets = array('d', index['sparse'][0]), array('q', index['sparse'][1])
+            for dst, (times, offsets) in index['destinations'].items():
+                self.destination_times[dst] = array('d', times)
+                self.destination_offsets[dst] = array('q', offsets)
+            for dst, (times, offsets) in index['locks'].items():
+                self.lock_times[dst] = array('d', times)
+                self.lock_offsets[dst] = array('q', offsets)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.rebuild()
+
+    def rebuild(self):
+        logger.info(f"Rebuilding journal index for {self.path}")
+        offset = 0
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    self.add(json.loads(line), offset)
+                    end = offset + len(line)
+                except (ValueError, KeyError):
+                    # A torn final line from a crash is skipped
+                    pass
+                offset += len(line)
+        # The indexed size ends with the last complete record, so range scans stop before a torn line
+        self.size = end
+        self.save_index()
+
+    def read(self, f, offset):
+        f.seek(offset)
+        return json.loads(f.readline())
+
+
+class RouteJournal:
+    #Append-only on-disk history of every crosspoint and lock change on a frame.
+    #append() only queues the record; a background thread writes, flushes and indexes
+    #batches, so takes never wait on disk. Segments rotate at segment_size bytes and
+    #the oldest are deleted beyond max_segments.
+    def __init__(self, directory, segment_size=4 * 1024 * 1024, max_segments=32):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.segments = []
+        self.current = None
+        self.file = None
+        self.writer = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith('segment_') and name.endswith('.jsonl'):
+                segment = JournalSegment(os.path.join(self.directory, name))
+                segment.load_index()
+                self.segments.append(segment)
+        self._rotate()
+        self.writer = threading.Thread(target=self._run, daemon=True)
+        self.writer.start()
+        logger.info(f"Route journal in {self.directory} ({len(self.segments)} segments)")
+
+    def record_xpoint(self, dst, src):
+        self.queue.put({'t': time.time(), 'e': 'x', 'd': dst, 's': src})
+
+    def record_baseline(self, crosspoints):
+        #Every crosspoint after a full resync, so state_at never has to look further back
+        now = time.time()
+        for dst, src in crosspoints.items():
+            self.queue.put({'t': now, 'e': 'x', 'd': dst, 's': src, 'b': 1})
+
+    def record_lock(self, message):
+        if message.command == 'LOCK' and message.op == '%' and 'D' in message.args and 'V' in message.args:
+            self.queue.put({'t': time.time(), 'e': 'l', 'd': message.args['D'], 'v': int(message.args['V'] == 'ON')})
+
+    def _rotate(self):
+        #Close the current segment and start a new one; called from start() and the writer
+        if self.file:
+            self.file.close()
+            self.current.save_index()
+        # Names sort by creation time; never reuse one, even when rotating twice in a millisecond
+        stamp = int(time.time() * 1000)
+        if self.segments:
+            stamp = max(stamp, int(os.path.basename(self.segments[-1].path)[len('segment_'):-len('.jsonl')]) + 1)
+        segment = JournalSegment(os.path.join(self.directory, f"segment_{stamp:015d}.jsonl"))
+        self.file = open(segment.path, 'ab')
+        with self.lock:
+            self.current = segment
+            self.segments.append(segment)
+            expired = self.segments[:-self.max_segments]
+            del self.segments[:-self.max_segments]
+        for old in expired:
+            for path in (old.path, old.index_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                written = []
+                position = self.current.size
+                for record in batch:
+                    line = (json.dumps(record, separators=(',', ':')) + "\n").encode('utf-8')
+                    self.file.write(line)
+                    written.append((record, position))
+                    position += len(line)
+                self.file.flush()
+                # Index only flushed records, so readers never seek past the end of the file
+                with self.lock:
+                    for record, offset in written:
+                        self.current.add(record, offset)
+                    self.current.size = position
+                if self.current.size >= self.segment_size:
+                    self._rotate()
+            except OSError as e:
+                logger.error(f"Error writing route journal: {str(e)}")
+
+    @staticmethod
+    def expand(record):
+        entry = {'timestamp': record['t'], 'time': datetime.fromtimestamp(record['t']).isoformat(timespec='milliseconds'),
+                 'destination': record['d']}
+        if record['e'] == 'x':
+            entry.update(event='xpoint', source=record['s'])
+            if record.get('b'):
+                entry['baseline'] = True
+        else:
+            entry.update(event='lock', locked=bool(record['v']))
+        return entry
+
+    def query(self, start=None, end=None, destination=None, limit=500):
+        #Records between start and end (epoch seconds), oldest first, optionally for one destination.
+        #Returns (records, truncated).
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        with self.lock:
+            segments = [segment for segment in self.segments
+                        if segment.count and segment.start <= end and segment.end >= start]
+            if destination is not None:
+                plans = [(segment, segment.destination_times.get(destination), segment.destination_offsets.get(destination))
+                         for segment in segments]
+            else:
+                plans = [(segment, segment.sparse_times, segment.sparse_offsets) for segment in segments]
+            plans = [(segment, times[:], offsets[:], segment.size) for segment, times, offsets in plans if times]
+
+        records = []
+        for segment, times, offsets, size in plans:
+            try:
+                with open(segment.path, 'rb') as f:
+                    if destination is not None:
+                        # Every record for the destination is indexed; read just those in range
+                        for i in range(bisect.bisect_left(times, start), bisect.bisect_right(times, end)):
+                            records.append(segment.read(f, offsets[i]))
+                            if len(records) > limit:
+                                return [self.expand(r) for r in records[:limit]], True
+                    else:
+                        # Seek to the sparse entry before start, then read sequentially
+                        f.seek(offsets[max(0, bisect.bisect_right(times, start) - 1)])
+                        while f.tell() < size:
+                            try:
+                                record = json.loads(f.readline())
+                            except ValueError:
+                                # A line torn by a crash
+                                continue
+                            if record['t'] > end:
+                                break
+                            if record['t'] >= start:
+                                records.append(record)
+                                if len(records) > limit:
+                                    return [self.expand(r) for r in records[:limit]], True
+            except FileNotFoundError:
+                # Rotated out while the query was running
+                continue
+        return [self.expand(r) for r in records], False
+
+    def state_at(self, destination, when):
+        #The source on a destination and its lock state at `when`, from the latest records at or before it
+        with self.lock:
+            segments = [segment for segment in reversed(self.segments) if segment.count and segment.start <= when]
+            takes = [(segment, segment.destination_times[destination][:], segment.destination_offsets[destination][:])
+                     for segment in segments if destination in segment.destination_times]
+            locks = [(segment, segment.lock_times[destination][:], segment.lock_offsets[destination][:])
+                     for segment in segments if destination in segment.lock_times]
+
+        state = {'source': None, 'source_since': None, 'locked': None, 'locked_since': None}
+        record = self.latest(takes, when, 'x')
+        if record:
+            state['source'], state['source_since'] = record['s'], record['t']
+        record = self.latest(locks, when, 'l')
+        if record:
+            state['locked'], state['locked_since'] = bool(record['v']), record['t']
+        return state
+
+    @staticmethod
+    def latest(plans, when, event):
+        #The newest `event` record at or before `when` from (segment, times, offsets), newest segment first
+        for segment, times, offsets in plans:
+            try:
+                with open(segment.path, 'rb') as f:
+                    for i in reversed(range(bisect.bisect_right(times, when))):
+                        record = segment.read(f, offsets[i])
+                        if record['e'] == event:
+                            return record
+            except FileNotFoundError:
+                continue
+        return None
 
-        print(f"Failed to unlock destination '{dst}' after {retries} attempts")
-        return False
 
 # HTML template will be decoded from base64 at startup
 HTML_TEMPLATE = None
+TEMPLATE_PLACEHOLDER = re.compile(r'\{(source_categories|destination_categories|router_status|simulation_banner|timestamp)\}')
+
+HTML_TEMPLATE_B64 = """PCFET0NUWVBFIGh0bWw+CjxodG1sIGxhbmc9ImVuIj4KPGhlYWQ+CiAgICA8bWV0YSBjaGFyc2V0PSJVVEYtOCI+CiAgICA8bWV0YSBuYW1lPSJ2aWV3cG9ydCIgY29udGVudD0id2lkdGg9ZGV2aWNlLXdpZHRoLCBpbml0aWFsLXNjYWxlPTEuMCI+CiAgICA8dGl0bGU+Um91dGVyIENvbnRyb2wgSW50ZXJmYWNlPC90aXRsZT4KICAgIDxzdHlsZT4KICAgICAgICAvKiBFbWJlZGRlZCBDU1MgKi8KICAgICAgICA6cm9vdCB7CiAgICAgICAgICAgIC0tYmFja2dyb3VuZC1kYXJrOiAjMWExZjJlOwogICAgICAgICAgICAtLXBhbmVsLWJnOiAjMjMyODM2OwogICAgICAgICAgICAtLWJ1dHRvbi1iZzogIzJhMzAzZTsKICAgICAgICAgICAgLS1hY2NlbnQtY3lhbjogIzAwZjBmZjsKICAgICAgICAgICAgLS1hY2NlbnQtcmVkOiAjZmYzYjNiOwogICAgICAgICAgICAtLXRleHQtcHJpbWFyeTogI2ZmZmZmZjsKICAgICAgICAgICAgLS10ZXh0LXNlY29uZGFyeTogcmdiYSgyNTUsIDI1NSwgMjU1LCAwLjcpOwogICAgICAgICAgICAtLWJvcmRlci1jb2xvcjogcmdiYSgyNTUsIDI1NSwgMjU1LCAwLjEpOwogICAgICAgIH0KCiAgICAgICAgKiB7CiAgICAgICAgICAgIG1hcmdpbjogMDsKICAgICAgICAgICAgcGFkZGluZzogMDsKICAgICAgICAgICAgYm94LXNpemluZzogYm9yZGVyLWJveDsKICAgICAgICAgICAgZm9udC1mYW1pbHk6IC1hcHBsZS1zeXN0ZW0sIEJsaW5rTWFjU3lzdGVtRm9udCwgIlNlZ29lIFVJIiwgUm9ib3RvLCBBcmlhbCwgc2Fucy1zZXJpZjsKICAgICAgICB9CgogICAgICAgIGJvZHkgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1iYWNrZ3JvdW5kLWRhcmspOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICAgICAgbGluZS1oZWlnaHQ6IDEuNTsKICAgICAgICAgICAgbWluLWhlaWdodDogMTAwdmg7CiAgICAgICAgfQoKICAgICAgICAuY29udGFpbmVyIHsKICAgICAgICAgICAgbWF4LXdpZHRoOiAxODAwcHg7CiAgICAgICAgICAgIG1hcmdpbjogMCBhdXRvOwogICAgICAgICAgICBwYWRkaW5nOiAyMHB4OwogICAgICAgIH0KCiAgICAgICAgLyogVG9wIEJhciAqLwogICAgICAgIC50b3AtYmFyIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBzcGFjZS1iZXR3ZWVuOwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgICAgICBtYXJnaW4tYm90dG9tOiAyMHB4OwogICAgICAgICAgICBwYWRkaW5nOiAxMHB4IDIwcHg7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLXBhbmVsLWJnKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogOHB4OwogICAgICAgIH0KCiAgICAgICAgLnN0YXR1cy1pbmRpY2F0b3JzIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgZ2FwOiAyMHB4OwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgIH0KCiAgICAgICAgLnN0YXR1cy1pdGVtIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgYWxpZ24taXRlbXM6IGNlbnRlcjsKICAgICAgICAgICAgZ2FwOiA4cHg7CiAgICAgICAgfQoKICAgICAgICAuc3RhdHVzLWRvdCB7CiAgICAgICAgICAgIHdpZHRoOiAxMHB4OwogICAgICAgICAgICBoZWlnaHQ6IDEwcHg7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDUwJTsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYWNjZW50LXJlZCk7CiAgICAgICAgfQoKICAgICAgICAuc3RhdHVzLWRvdC5hY3RpdmUgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiAjMDBmZjAwOwogICAgICAgIH0KCiAgICAgICAgLnRpbWVzdGFtcCB7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS10ZXh0LXNlY29uZGFyeSk7CiAgICAgICAgICAgIGZvbnQtc2l6ZTogMC45ZW07CiAgICAgICAgfQoKICAgICAgICAvKiBNYWluIENvbnRlbnQgTGF5b3V0ICovCiAgICAgICAgLm1haW4tY29udGVudCB7CiAgICAgICAgICAgIGRpc3BsYXk6IGdyaWQ7CiAgICAgICAgICAgIGdyaWQtdGVtcGxhdGUtY29sdW1uczogYXV0byAxZnIgYXV0byAxZnIgYXV0bzsKICAgICAgICAgICAgZ2FwOiAyMHB4OwogICAgICAgICAgICBoZWlnaHQ6IGNhbGMoMTAwdmggLSAxMjBweCk7CiAgICAgICAgfQoKICAgICAgICAvKiBQYW5lbHMgKi8KICAgICAgICAucGFuZWwgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1wYW5lbC1iZyk7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDhweDsKICAgICAgICAgICAgb3ZlcmZsb3c6IGhpZGRlbjsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgZmxleC1kaXJlY3Rpb246IGNvbHVtbjsKICAgICAgICB9CgogICAgICAgIC5wYW5lbC1oZWFkZXIgewogICAgICAgICAgICBwYWRkaW5nOiAxNXB4OwogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiByZ2JhKDAsIDAsIDAsIDAuMik7CiAgICAgICAgfQoKICAgICAgICAucGFuZWwtaGVhZGVyIGgyIHsKICAgICAgICAgICAgZm9udC1zaXplOiAxLjFlbTsKICAgICAgICAgICAgZm9udC13ZWlnaHQ6IDUwMDsKICAgICAgICAgICAgbWFyZ2luLWJvdHRvbTogMTBweDsKICAgICAgICB9CgogICAgICAgIC5zZWFyY2gtY29udGFpbmVyIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgZ2FwOiAxMHB4OwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgIH0KCiAgICAgICAgLnNlYXJjaC1pbnB1dCB7CiAgICAgICAgICAgIGZsZXg6IDE7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLWJ1dHRvbi1iZyk7CiAgICAgICAgICAgIGJvcmRlcjogMXB4IHNvbGlkIHZhcigtLWJvcmRlci1jb2xvcik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS10ZXh0LXByaW1hcnkpOwogICAgICAgICAgICBwYWRkaW5nOiA4cHggMTJweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgICAgICBmb250LXNpemU6IDAuOWVtOwogICAgICAgIH0KCiAgICAgICAgLnNlYXJjaC1pbnB1dDpmb2N1cyB7CiAgICAgICAgICAgIG91dGxpbmU6IG5vbmU7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgIH0KCiAgICAgICAgLmNvdW50LWJhZGdlIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYnV0dG9uLWJnKTsKICAgICAgICAgICAgcGFkZGluZzogNHB4IDhweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgICAgICBmb250LXNpemU6IDAuOGVtOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1zZWNvbmRhcnkpOwogICAgICAgIH0KCiAgICAgICAgLnBhbmVsLWNvbnRlbnQgewogICAgICAgICAgICBwYWRkaW5nOiAxNXB4OwogICAgICAgICAgICBkaXNwbGF5OiBncmlkOwogICAgICAgICAgICBncmlkLXRlbXBsYXRlLWNvbHVtbnM6IHJlcGVhdCg0LCBtaW5tYXgoMCwgMWZyKSk7CiAgICAgICAgICAgIGdhcDogOHB4OwogICAgICAgICAgICBvdmVyZmxvdy15OiBhdXRvOwogICAgICAgICAgICBmbGV4OiAxOwogICAgICAgICAgICBhbGlnbi1jb250ZW50OiBzdGFydDsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBzdGFydDsKICAgICAgICB9CgogICAgICAgIC8qIEJ1dHRvbnMgKi8KICAgICAgICAuc291cmNlLWJ0biwgLmRlc3RpbmF0aW9uLWJ0biB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLWJ1dHRvbi1iZyk7CiAgICAgICAgICAgIGJvcmRlcjogMXB4IHNvbGlkIHZhcigtLWJvcmRlci1jb2xvcik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS10ZXh0LXByaW1hcnkpOwogICAgICAgICAgICBwYWRkaW5nOiA4cHggMTBweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgICAgICBjdXJzb3I6IHBvaW50ZXI7CiAgICAgICAgICAgIHRleHQtYWxpZ246IGNlbnRlcjsKICAgICAgICAgICAgZm9udC1zaXplOiAwLjllbTsKICAgICAgICAgICAgdHJhbnNpdGlvbjogYWxsIDAuMnMgZWFzZTsKICAgICAgICAgICAgd2lkdGg6IDEyMHB4OwogICAgICAgICAgICBoZWlnaHQ6IDQycHg7CiAgICAgICAgICAgIGRpc3BsYXk6IGZsZXg7CiAgICAgICAgICAgIGFsaWduLWl0ZW1zOiBjZW50ZXI7CiAgICAgICAgICAgIGp1c3RpZnktY29udGVudDogY2VudGVyOwogICAgICAgICAgICBvdmVyZmxvdzogaGlkZGVuOwogICAgICAgICAgICB3aGl0ZS1zcGFjZTogbm93cmFwOwogICAgICAgICAgICB0ZXh0LW92ZXJmbG93OiBlbGxpcHNpczsKICAgICAgICB9CgogICAgICAgIC5zb3VyY2UtYnRuIHsKICAgICAgICAgICAgYm9yZGVyLWxlZnQ6IDNweCBzb2xpZCB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgfQoKICAgICAgICAuZGVzdGluYXRpb24tYnRuIHsKICAgICAgICAgICAgaGVpZ2h0OiA0OHB4OyAKICAgICAgICAgICAgcGFkZGluZzogNHB4IDhweDsKICAgICAgICAgICAgZmxleC1kaXJlY3Rpb246IGNvbHVtbjsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBzcGFjZS1iZXR3ZWVuOwogICAgICAgICAgICBib3JkZXItbGVmdDogM3B4IHNvbGlkIHZhcigtLWFjY2VudC1yZWQpOwogICAgICAgIH0KCiAgICAgICAgLnNvdXJjZS1idG46aG92ZXIsIC5kZXN0aW5hdGlvbi1idG46aG92ZXIgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiByZ2JhKDI1NSwgMjU1LCAyNTUsIDAuMSk7CiAgICAgICAgfQoKICAgICAgICAuc291cmNlLWJ0bi5zZWxlY3RlZCB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMCwgMjQwLCAyNTUsIDAuMik7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgIH0KCiAgICAgICAgLmRlc3RpbmF0aW9uLWJ0bi5zZWxlY3RlZCB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMjU1LCA1OSwgNTksIDAuMik7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LXJlZCk7CiAgICAgICAgfQoKICAgICAgICAvKiBSb3V0ZSBDb250cm9sIFBhbmVsICovCiAgICAgICAgLnJvdXRlLWNvbnRyb2wtcGFuZWwgewogICAgICAgICAgICBkaXNwbGF5OiBmbGV4OwogICAgICAgICAgICBmbGV4LWRpcmVjdGlvbjogY29sdW1uOwogICAgICAgICAgICBqdXN0aWZ5LWNvbnRlbnQ6IGNlbnRlcjsKICAgICAgICAgICAgYWxpZ24taXRlbXM6IGNlbnRlcjsgCiAgICAgICAgICAgIHBhZGRpbmc6IDIwcHg7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLXBhbmVsLWJnKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogOHB4OwogICAgICAgICAgICBtaW4td2lkdGg6IDMwMHB4OwogICAgICAgICAgICBnYXA6IDIwcHg7CiAgICAgICAgfQoKICAgICAgICAuc2VsZWN0aW9uLWRpc3BsYXkgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBib3JkZXI6IDFweCBzb2xpZCB2YXIoLS1ib3JkZXItY29sb3IpOwogICAgICAgICAgICBib3JkZXItcmFkaXVzOiA0cHg7CiAgICAgICAgICAgIHBhZGRpbmc6IDEwcHg7CiAgICAgICAgICAgIGN1cnNvcjogcG9pbnRlcjsKICAgICAgICAgICAgbWluLWhlaWdodDogODBweDsKICAgICAgICAgICAgbWluLXdpZHRoOiAyMTBweDsKICAgICAgICB9CgogICAgICAgIC5zZWxlY3Rpb24tbGFiZWwgewogICAgICAgICAgICBmb250LXNpemU6IDAuOGVtOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1zZWNvbmRhcnkpOwogICAgICAgICAgICBtYXJnaW4tYm90dG9tOiA1cHg7CiAgICAgICAgfQoKICAgICAgICAuc2VsZWN0aW9uLXZhbHVlIHsKICAgICAgICAgICAgZm9udC1zaXplOiAxLjJlbTsKICAgICAgICAgICAgbWluLWhlaWdodDogMS41ZW07CiAgICAgICAgfQoKICAgICAgICAudGFrZS1idXR0b24gewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICAgICAgYm9yZGVyOiAycHggc29saWQgdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBwYWRkaW5nOiAxNXB4IDQwcHg7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDRweDsKICAgICAgICAgICAgY3Vyc29yOiBwb2ludGVyOwogICAgICAgICAgICBmb250LXNpemU6IDEuMmVtOwogICAgICAgICAgICB0cmFuc2l0aW9uOiBhbGwgMC4ycyBlYXNlOwogICAgICAgIH0KCiAgICAgICAgLnRha2UtYnV0dG9uOmhvdmVyIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogcmdiYSgwLCAyNDAsIDI1NSwgMC4yKTsKICAgICAgICB9CgogICAgICAgIC50YWtlLWJ1dHRvbi5hY3RpdmUgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS1iYWNrZ3JvdW5kLWRhcmspOwogICAgICAgIH0KCiAgICAgICAgLyogQ29udHJvbCBCdXR0b25zICovCiAgICAgICAgLmNvbnRyb2wtYnRuIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYnV0dG9uLWJnKTsKICAgICAgICAgICAgYm9yZGVyOiAxcHggc29saWQgdmFyKC0tYm9yZGVyLWNvbG9yKTsKICAgICAgICAgICAgY29sb3I6IHZhcigtLXRleHQtcHJpbWFyeSk7CiAgICAgICAgICAgIHBhZGRpbmc6IDhweCAxMHB4OwogICAgICAgICAgICBib3JkZXItcmFkaXVzOiA0cHg7CiAgICAgICAgICAgIGN1cnNvcjogcG9pbnRlcjsKICAgICAgICAgICAgdGV4dC1hbGlnbjogY2VudGVyOwogICAgICAgICAgICBmb250LXNpemU6IDAuOWVtOwogICAgICAgICAgICB0cmFuc2l0aW9uOiBhbGwgMC4ycyBlYXNlOwogICAgICAgICAgICB3aWR0aDogMTIwcHg7CiAgICAgICAgICAgIGhlaWdodDogNDJweDsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgYWxpZ24taXRlbXM6IGNlbnRlcjsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBjZW50ZXI7CiAgICAgICAgICAgIG92ZXJmbG93OiBoaWRkZW47CiAgICAgICAgICAgIHdoaXRlLXNwYWNlOiBub3dyYXA7CiAgICAgICAgICAgIHRleHQtb3ZlcmZsb3c6IGVsbGlwc2lzOwogICAgICAgICAgICBib3JkZXItbGVmdDogM3B4IHNvbGlkIHZhcigtLWFjY2VudC1jeWFuKTsKICAgICAgICB9CgogICAgICAgIC5jb250cm9sLWJ0bjpob3ZlciB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMCwgMjQwLCAyNTUsIDAuMSk7CiAgICAgICAgfQoKICAgICAgICAuY29udHJvbC1idG4uc2VsZWN0ZWQgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS1iYWNrZ3JvdW5kLWRhcmspOwogICAgICAgIH0KCiAgICAgICAgLyogQ2F0ZWdvcnkgYnV0dG9ucyAqLwogICAgICAgIC5jYXRlZ29yeS1idXR0b25zIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tcGFuZWwtYmcpOwogICAgICAgICAgICBib3JkZXItcmFkaXVzOiA4cHg7CiAgICAgICAgICAgIHBhZGRpbmc6IDE1cHg7CiAgICAgICAgICAgIGRpc3BsYXk6IGZsZXg7CiAgICAgICAgICAgIGZsZXgtZGlyZWN0aW9uOiBjb2x1bW47CiAgICAgICAgICAgIGdhcDogMTBweDsKICAgICAgICAgICAgbWF4LXdpZHRoOiAxNTBweDsKICAgICAgICAgICAgb3ZlcmZsb3cteTogYXV0bzsKICAgICAgICB9CgogICAgICAgIC5jYXRlZ29yeS1idG4gewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBib3JkZXI6IDFweCBzb2xpZCB2YXIoLS1ib3JkZXItY29sb3IpOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICAgICAgcGFkZGluZzogOHB4IDEycHg7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDRweDsKICAgICAgICAgICAgY3Vyc29yOiBwb2ludGVyOwogICAgICAgICAgICB0ZXh0LWFsaWduOiBsZWZ0OwogICAgICAgICAgICB0cmFuc2l0aW9uOiBhbGwgMC4ycyBlYXNlOwogICAgICAgIH0KCiAgICAgICAgLmNhdGVnb3J5LWJ0bjpob3ZlciB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMjU1LCAyNTUsIDI1NSwgMC4xKTsKICAgICAgICB9CgogICAgICAgIC5jYXRlZ29yeS1idG4uYWN0aXZlIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tYmFja2dyb3VuZC1kYXJrKTsKICAgICAgICB9CgogICAgICAgIC8qIExvY2sgc3RhdHVzIG1lc3NhZ2UgKi8KICAgICAgICAubG9jay1tZXNzYWdlIHsKICAgICAgICAgICAgZGlzcGxheTogbm9uZTsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogIzIzMjgzNjsKICAgICAgICAgICAgY29sb3I6IHZhcigtLWFjY2VudC1yZWQpOwogICAgICAgICAgICBwYWRkaW5nOiAxMHB4OwogICAgICAgICAgICB0ZXh0LWFsaWduOiBjZW50ZXI7CiAgICAgICAgICAgIGJvcmRlcjogc29saWQ7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LXJlZCk7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDRweDsKICAgICAgICAgICAgbWFyZ2luLXRvcDogMTBweDsKICAgICAgICAgICAgZm9udC13ZWlnaHQ6IGJvbGQ7CiAgICAgICAgICAgIG1heC13aWR0aDogMjYwcHg7CiAgICAgICAgICAgIHBvc2l0aW9uOiBhYnNvbHV0ZTsKICAgICAgICAgICAgYm90dG9tOiAzMHB4OwogICAgICAgIH0KCiAgICAgICAgLmxvY2stbWVzc2FnZS52aXNpYmxlIHsKICAgICAgICAgICAgZGlzcGxheTogYmxvY2s7CiAgICAgICAgfQoKICAgICAgICAvKiBJbmZvIEJ1dHRvbiAqLwogICAgICAgIC5pbmZvLWJ1dHRvbiB7CiAgICAgICAgICAgIHBvc2l0aW9uOiBmaXhlZDsKICAgICAgICAgICAgYm90dG9tOiAyMHB4OwogICAgICAgICAgICByaWdodDogMjBweDsKICAgICAgICAgICAgd2lkdGg6IDQwcHg7CiAgICAgICAgICAgIGhlaWdodDogNDBweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNTAlOwogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBib3JkZXI6IDJweCBzb2xpZCB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgICAgIGRpc3BsYXk6IGZsZXg7CiAgICAgICAgICAgIGFsaWduLWl0ZW1zOiBjZW50ZXI7CiAgICAgICAgICAgIGp1c3RpZnktY29udGVudDogY2VudGVyOwogICAgICAgICAgICBmb250LXNpemU6IDIwcHg7CiAgICAgICAgICAgIGZvbnQtd2VpZ2h0OiBib2xkOwogICAgICAgICAgICBjdXJzb3I6IHBvaW50ZXI7CiAgICAgICAgICAgIHotaW5kZXg6IDEwMDsKICAgICAgICAgICAgdHJhbnNpdGlvbjogYWxsIDAuMnMgZWFzZTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLmluZm8tYnV0dG9uOmhvdmVyIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tYmFja2dyb3VuZC1kYXJrKTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLyogTW9kYWwgUG9wdXAgKi8KICAgICAgICAubW9kYWwgewogICAgICAgICAgICBkaXNwbGF5OiBub25lOwogICAgICAgICAgICBwb3NpdGlvbjogZml4ZWQ7CiAgICAgICAgICAgIHRvcDogMDsKICAgICAgICAgICAgbGVmdDogMDsKICAgICAgICAgICAgd2lkdGg6IDEwMCU7CiAgICAgICAgICAgIGhlaWdodDogMTAwJTsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogcmdiYSgwLCAwLCAwLCAwLjcpOwogICAgICAgICAgICB6LWluZGV4OiAxMDAwOwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgICAgICBqdXN0aWZ5LWNvbnRlbnQ6IGNlbnRlcjsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLm1vZGFsLnZpc2libGUgewogICAgICAgICAgICBkaXNwbGF5OiBmbGV4OwogICAgICAgIH0KICAgICAgICAKICAgICAgICAubW9kYWwtY29udGVudCB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLXBhbmVsLWJnKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogOHB4OwogICAgICAgICAgICBwYWRkaW5nOiAzMHB4OwogICAgICAgICAgICBtYXgtd2lkdGg6IDYwMHB4OwogICAgICAgICAgICB3aWR0aDogODAlOwogICAgICAgICAgICBwb3NpdGlvbjogcmVsYXRpdmU7CiAgICAgICAgICAgIGJveC1zaGFkb3c6IDAgNHB4IDIwcHggcmdiYSgwLCAwLCAwLCAwLjUpOwogICAgICAgIH0KICAgICAgICAKICAgICAgICAubW9kYWwtY2xvc2UgewogICAgICAgICAgICBwb3NpdGlvbjogYWJzb2x1dGU7CiAgICAgICAgICAgIHRvcDogMTBweDsKICAgICAgICAgICAgcmlnaHQ6IDE1cHg7CiAgICAgICAgICAgIGZvbnQtc2l6ZTogMjRweDsKICAgICAgICAgICAgY3Vyc29yOiBwb2ludGVyOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1zZWNvbmRhcnkpOwogICAgICAgIH0KICAgICAgICAKICAgICAgICAubW9kYWwtY2xvc2U6aG92ZXIgewogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLm1vZGFsLXRpdGxlIHsKICAgICAgICAgICAgZm9udC1zaXplOiAxLjRlbTsKICAgICAgICAgICAgbWFyZ2luLWJvdHRvbTogMjBweDsKICAgICAgICAgICAgY29sb3I6IHZhcigtLWFjY2VudC1jeWFuKTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLm1vZGFsLXRleHQgewogICAgICAgICAgICBsaW5lLWhlaWdodDogMS42OwogICAgICAgICAgICB3aGl0ZS1zcGFjZTogcHJlLWxpbmU7CiAgICAgICAgfQogICAgICAgIAogICAgICAgIC8qIFNpbXVsYXRpb24gQmFubmVyICovCiAgICAgICAgLnNpbXVsYXRpb24tYmFubmVyIHsKICAgICAgICAgICAgcG9zaXRpb246IGZpeGVkOwogICAgICAgICAgICBib3R0b206IDA7CiAgICAgICAgICAgIGxlZnQ6IDA7CiAgICAgICAgICAgIHJpZ2h0OiAwOwogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1hY2NlbnQtcmVkKTsKICAgICAgICAgICAgY29sb3I6IHdoaXRlOwogICAgICAgICAgICB0ZXh0LWFsaWduOiBjZW50ZXI7CiAgICAgICAgICAgIHBhZGRpbmc6IDhweDsKICAgICAgICAgICAgZm9udC13ZWlnaHQ6IDUwMDsKICAgICAgICB9CgogICAgICAgIC8qIEhpZGRlbiBDbGFzcyAqLwogICAgICAgIC5oaWRkZW4gewogICAgICAgICAgICBkaXNwbGF5OiBub25lICFpbXBvcnRhbnQ7CiAgICAgICAgfQoKICAgICAgICAvKiBTY3JvbGxiYXIgU3R5bGluZyAqLwogICAgICAgIDo6LXdlYmtpdC1zY3JvbGxiYXIgewogICAgICAgICAgICB3aWR0aDogOHB4OwogICAgICAgIH0KCiAgICAgICAgOjotd2Via2l0LXNjcm9sbGJhci10cmFjayB7CiAgICAgICAgICAgIGJhY2tncm91bmQ6IHZhcigtLWJ1dHRvbi1iZyk7CiAgICAgICAgfQoKICAgICAgICA6Oi13ZWJraXQtc2Nyb2xsYmFyLXRodW1iIHsKICAgICAgICAgICAgYmFja2dyb3VuZDogdmFyKC0tYm9yZGVyLWNvbG9yKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgIH0KCiAgICAgICAgOjotd2Via2l0LXNjcm9sbGJhci10aHVtYjpob3ZlciB7CiAgICAgICAgICAgIGJhY2tncm91bmQ6IHZhcigtLXRleHQtc2Vjb25kYXJ5KTsKICAgICAgICB9CiAgICA8L3N0eWxlPgo8L2hlYWQ+Cjxib2R5PgogICAgPGRpdiBjbGFzcz0iY29udGFpbmVyIj4KICAgICAgICA8ZGl2IGNsYXNzPSJ0b3AtYmFyIj4KICAgICAgICAgICAgPGRpdiBjbGFzcz0ic3RhdHVzLWluZGljYXRvcnMiPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic3RhdHVzLWl0ZW0iPgogICAgICAgICAgICAgICAgICAgIDxzcGFuIGNsYXNzPSJzdGF0dXMtZG90IHtyb3V0ZXJfc3RhdHVzfSI+PC9zcGFuPgogICAgICAgICAgICAgICAgICAgIDxzcGFuIGNsYXNzPSJzdGF0dXMtbGFiZWwiPlJvdXRlciBDb25uZWN0aW9uIFN0YXR1czwvc3Bhbj4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0idGltZXN0YW1wIj57dGltZXN0YW1wfTwvZGl2PgogICAgICAgICAgICA8L2Rpdj4KICAgICAgICAgICAgPGRpdiBjbGFzcz0icm91dGVyLWNvbnRyb2xzIj4KICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9ImNvbnRyb2wtYnRuIiBkYXRhLXNvdXJjZT0iSEQtQkFSUyI+SEQgQkFSUzwvYnV0dG9uPgogICAgICAgICAgICA8L2Rpdj4KICAgICAgICA8L2Rpdj4KCiAgICAgICAgPGRpdiBjbGFzcz0ibWFpbi1jb250ZW50Ij4KICAgICAgICAgICAgPCEtLSBTb3VyY2UgQ2F0ZWdvcmllcyAtLT4KICAgICAgICAgICAgPGRpdiBjbGFzcz0iY2F0ZWdvcnktYnV0dG9ucyBzb3VyY2VzIj4KICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9ImNhdGVnb3J5LWJ0biBhY3RpdmUiIGRhdGEtY2F0ZWdvcnk9ImFsbCI+QWxsIFNvdXJjZXM8L2J1dHRvbj4KICAgICAgICAgICAgICAgIHtzb3VyY2VfY2F0ZWdvcmllc30KICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICA8IS0tIFNvdXJjZXMgUGFuZWwgLS0+CiAgICAgICAgICAgIDxkaXYgY2xhc3M9InBhbmVsIHNvdXJjZXMtcGFuZWwiPgogICAgICAgICAgICAgICAgPGgyPlNPVVJDRVM8L2gyPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic2VhcmNoLWNvbnRhaW5lciI+CiAgICAgICAgICAgICAgICAgICAgPGlucHV0IHR5cGU9InRleHQiIGlkPSJzb3VyY2Utc2VhcmNoIiBjbGFzcz0ic2VhcmNoLWlucHV0IiBwbGFjZWhvbGRlcj0iU2VhcmNoIHNvdXJjZXMuLi4iPgogICAgICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9ImNvdW50LWJhZGdlIiBpZD0ic291cmNlLWNvdW50Ij4wLzA8L2Rpdj4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0icGFuZWwtY29udGVudCIgaWQ9InNvdXJjZXMtZ3JpZCI+PC9kaXY+CiAgICAgICAgICAgIDwvZGl2PgoKICAgICAgICAgICAgPCEtLSBSb3V0ZSBDb250cm9sIFBhbmVsIC0tPgogICAgICAgICAgICA8ZGl2IGNsYXNzPSJyb3V0ZS1jb250cm9sLXBhbmVsIj4KICAgICAgICAgICAgICAgIDxkaXYgaWQ9InNlbGVjdGVkLXNvdXJjZSIgY2xhc3M9InNlbGVjdGlvbi1kaXNwbGF5Ij4KICAgICAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJzZWxlY3Rpb24tbGFiZWwiPlNPVVJDRTwvZGl2PgogICAgICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9InNlbGVjdGlvbi12YWx1ZSI+PC9kaXY+CiAgICAgICAgICAgICAgICA8L2Rpdj4KCiAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJ0YWtlLWJ1dHRvbi1jb250YWluZXIiPgogICAgICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9InRha2UtYnV0dG9uIj5UQUtFPC9idXR0b24+CiAgICAgICAgICAgICAgICA8L2Rpdj4KCiAgICAgICAgICAgICAgICA8ZGl2IGlkPSJzZWxlY3RlZC1kZXN0aW5hdGlvbiIgY2xhc3M9InNlbGVjdGlvbi1kaXNwbGF5Ij4KICAgICAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJzZWxlY3Rpb24tbGFiZWwiPkRFU1RJTkFUSU9OPC9kaXY+CiAgICAgICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic2VsZWN0aW9uLXZhbHVlIj48L2Rpdj4KICAgICAgICAgICAgICAgIDwvZGl2PgoKICAgICAgICAgICAgICAgIDxkaXYgaWQ9ImxvY2stbWVzc2FnZSIgY2xhc3M9ImxvY2stbWVzc2FnZSI+CiAgICAgICAgICAgICAgICAgICAgRGVzdGluYXRpb24gaXMgbG9ja2VkLCBjb250YWN0IEVuZ2luZWVyaW5nCiAgICAgICAgICAgICAgICA8L2Rpdj4KICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICA8IS0tIERlc3RpbmF0aW9ucyBQYW5lbCAtLT4KICAgICAgICAgICAgPGRpdiBjbGFzcz0icGFuZWwgZGVzdGluYXRpb25zLXBhbmVsIj4KICAgICAgICAgICAgICAgIDxoMj5ERVNUSU5BVElPTlM8L2gyPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic2VhcmNoLWNvbnRhaW5lciI+CiAgICAgICAgICAgICAgICAgICAgPGlucHV0IHR5cGU9InRleHQiIGlkPSJkZXN0aW5hdGlvbi1zZWFyY2giIGNsYXNzPSJzZWFyY2gtaW5wdXQiIHBsYWNlaG9sZGVyPSJTZWFyY2ggZGVzdGluYXRpb25zLi4uIj4KICAgICAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJjb3VudC1iYWRnZSIgaWQ9ImRlc3RpbmF0aW9uLWNvdW50Ij4wLzA8L2Rpdj4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0icGFuZWwtY29udGVudCIgaWQ9ImRlc3RpbmF0aW9ucy1ncmlkIj48L2Rpdj4KICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICA8IS0tIERlc3RpbmF0aW9uIENhdGVnb3JpZXMgLS0+CiAgICAgICAgICAgIDxkaXYgY2xhc3M9ImNhdGVnb3J5LWJ1dHRvbnMgZGVzdGluYXRpb25zIj4KICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9ImNhdGVnb3J5LWJ0biBhY3RpdmUiIGRhdGEtY2F0ZWdvcnk9ImFsbCI+QWxsIERlc3RpbmF0aW9uczwvYnV0dG9uPgogICAgICAgICAgICAgICAge2Rlc3RpbmF0aW9uX2NhdGVnb3JpZXN9CiAgICAgICAgICAgIDwvZGl2PgogICAgICAgIDwvZGl2PgoKICAgICAgICB7c2ltdWxhdGlvbl9iYW5uZXJ9CiAgICAgICAgCiAgICAgICAgPCEtLSBJbmZvIEJ1dHRvbiAtLT4KICAgICAgICA8YnV0dG9uIGNsYXNzPSJpbmZvLWJ1dHRvbiI+aTwvYnV0dG9uPgogICAgICAgIAogICAgICAgIDwhLS0gSW5mbyBNb2RhbCAtLT4KICAgICAgICA8ZGl2IGlkPSJpbmZvLW1vZGFsIiBjbGFzcz0ibW9kYWwiPgogICAgICAgICAgICA8ZGl2IGNsYXNzPSJtb2RhbC1jb250ZW50Ij4KICAgICAgICAgICAgICAgIDxzcGFuIGNsYXNzPSJtb2RhbC1jbG9zZSI+JnRpbWVzOzwvc3Bhbj4KICAgICAgICAgICAgICAgIDxoMyBjbGFzcz0ibW9kYWwtdGl0bGUiPkhhcnJpcyBMUkMgQ29udHJvbCBJbnRlcmZhY2U8L2gzPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ibW9kYWwtdGV4dCI+CiAgICAgICAgICAgICAgICAgICAgQSB3ZWItYmFzZWQgY29udHJvbCBpbnRlcmZhY2UgZm9yIEhhcnJpcyBMUkMgc3lzdGVtcy4gVGhpcyBhcHBsaWNhdGlvbiBwcm92aWRlcyB3ZWIgaW50ZXJmYWNlIGZvciBtYW5hZ2luZyB2aWRlbyByb3V0aW5nLCBtb25pdG9yaW5nIHJvdXRlciBzdGF0dXMsIGFuZCBjb250cm9sbGluZyBkZXN0aW5hdGlvbiBsb2NrcyBvbiBIYXJyaXMgTFJDIHJvdXRlcnMuCgogICAgICAgICAgICAgICAgICAgIFBhcnQgb2YgU0JDUy4KICAgICAgICAgICAgICAgICAgICAyMDI1IEJlbiBDb3N0ZXJ0b24gLSBodHRwczovL2dpdGh1Yi5jb20vQmVuY29zdGVydG9uLwoKICAgICAgICAgICAgICAgICAgICBUaGlzIHNvZnR3YXJlIGlzIHByb3ZpZGVkIGFzLWlzIGZvciBjb250cm9sbGluZyBIYXJyaXMgTFJDIHJvdXRlciBzeXN0ZW1zLiBQbGVhc2UgZW5zdXJlIGNvbXBsaWFuY2Ugd2l0aCB5b3VyIG9yZ2FuaXphdGlvbidzIG5ldHdvcmsgYW5kIGVxdWlwbWVudCBwb2xpY2llcyBiZWZvcmUgZGVwbG95bWVudC4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICA8L2Rpdj4KICAgICAgICA8L2Rpdj4KICAgIDwvZGl2PgoKICAgIDxzY3JpcHQ+CiAgICAgICAgLy8gRW1iZWRkZWQgSmF2YVNjcmlwdAogICAgICAgIGRvY3VtZW50LmFkZEV2ZW50TGlzdGVuZXIoJ0RPTUNvbnRlbnRMb2FkZWQnLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgbGV0IHNlbGVjdGVkU291cmNlID0gbnVsbDsKICAgICAgICAgICAgbGV0IHNlbGVjdGVkRGVzdGluYXRpb24gPSBudWxsOwogICAgICAgICAgICBsZXQgY3Jvc3Nwb2ludHMgPSB7fTsKICAgICAgICAgICAgbGV0IGRlc3RpbmF0aW9uQWxpYXNlcyA9IHt9OwogICAgICAgICAgICBjb25zdCBsb2NrZWREZXN0aW5hdGlvbnMgPSBuZXcgU2V0KCk7CgogICAgICAgICAgICAvLyBHZXQgdGhlIHRpbWUKICAgICAgICAgICAgZnVuY3Rpb24gdXBkYXRlVGltZXN0YW1wKCkgewogICAgICAgICAgICAgICAgY29uc3QgdGltZXN0YW1wRWxlbWVudCA9IGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJy50aW1lc3RhbXAnKTsKICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgZnVuY3Rpb24gdXBkYXRlKCkgewogICAgICAgICAgICAgICAgICAgIGNvbnN0IG5vdyA9IG5ldyBEYXRlKCk7CiAgICAgICAgICAgICAgICAgICAgY29uc3QgZm9ybWF0dGVkRGF0ZSA9IG5vdy50b0xvY2FsZURhdGVTdHJpbmcoJ2VuLUdCJyk7CiAgICAgICAgICAgICAgICAgICAgY29uc3QgZm9ybWF0dGVkVGltZSA9IG5vdy50b0xvY2FsZVRpbWVTdHJpbmcoJ2VuLUdCJywgeyAKICAgICAgICAgICAgICAgICAgICAgICAgaG91cjogJzItZGlnaXQnLCAKICAgICAgICAgICAgICAgICAgICAgICAgbWludXRlOiAnMi1kaWdpdCcsCiAgICAgICAgICAgICAgICAgICAgICAgIHNlY29uZDogJzItZGlnaXQnCiAgICAgICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgICAgICAgICAgdGltZXN0YW1wRWxlbWVudC50ZXh0Q29udGVudCA9IGAke2Zvcm1hdHRlZERhdGV9ICR7Zm9ybWF0dGVkVGltZX1gOwogICAgICAgICAgICAgICAgfQogICAgICAgICAgICAKICAgICAgICAgICAgICAgIHVwZGF0ZSgpOwogICAgICAgICAgICAgICAgc2V0SW50ZXJ2YWwodXBkYXRlLCAxMDAwKTsKICAgICAgICAgICAgfQoKICAgICAgICAgICAgLy8gTmFtZSBwYW5lbHM6IHNvdXJjZXMgYW5kIGRlc3RpbmF0aW9ucyBhcmUgbG9hZGVkIGEgcGFnZSBhdCBhIHRpbWUgZnJvbSB0aGUKICAgICAgICAgICAgLy8gc2VydmVyJ3Mgc29ydGVkIG5hbWUgaW5kZXgsIG9ubHkgZm9yIHRoZSBzZWxlY3RlZCBjYXRlZ29yeSBvciBzZWFyY2gKICAgICAgICAgICAgY29uc3QgUEFHRV9TSVpFID0gMjAwOwoKICAgICAgICAgICAgZnVuY3Rpb24gc2V0dXBOYW1lUGFuZWwoa2luZCwgYnV0dG9uQ2xhc3MsIGRhdGFLZXksIHNlYXJjaElkLCBjb3VudElkLCBncmlkSWQsIGNhdGVnb3J5U2VsZWN0b3IsIG9uU2VsZWN0KSB7CiAgICAgICAgICAgICAgICBjb25zdCBncmlkID0gZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoZ3JpZElkKTsKICAgICAgICAgICAgICAgIGNvbnN0IHNlYXJjaElucHV0ID0gZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoc2VhcmNoSWQpOwogICAgICAgICAgICAgICAgY29uc3QgY291bnREaXNwbGF5ID0gZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoY291bnRJZCk7CiAgICAgICAgICAgICAgICBjb25zdCBwYW5lbCA9IHtjYXRlZ29yeTogJ2FsbCcsIGNvbnRhaW5zOiAnJywgbG9hZGVkOiAwLCB0b3RhbDogMCwgcmVxdWVzdDogMCwgbG9hZGluZzogZmFsc2V9OwoKICAgICAgICAgICAgICAgIGZ1bmN0aW9uIGxvYWQocmVzZXQpIHsKICAgICAgICAgICAgICAgICAgICBpZiAocmVzZXQpIHsKICAgICAgICAgICAgICAgICAgICAgICAgcGFuZWwubG9hZGVkID0gMDsKICAgICAgICAgICAgICAgICAgICAgICAgcGFuZWwudG90YWwgPSAwOwogICAgICAgICAgICAgICAgICAgICAgICBwYW5lbC5yZXF1ZXN0ICs9IDE7CiAgICAgICAgICAgICAgICAgICAgfSBlbHNlIGlmIChwYW5lbC5sb2FkaW5nIHx8IHBhbmVsLmxvYWRlZCA+PSBwYW5lbC50b3RhbCkgewogICAgICAgICAgICAgICAgICAgICAgICByZXR1cm47CiAgICAgICAgICAgICAgICAgICAgfQoKICAgICAgICAgICAgICAgICAgICBjb25zdCByZXF1ZXN0ID0gcGFuZWwucmVxdWVzdDsKICAgICAgICAgICAgICAgICAgICBjb25zdCBwYXJhbXMgPSBuZXcgVVJMU2VhcmNoUGFyYW1zKHtvZmZzZXQ6IHBhbmVsLmxvYWRlZCwgbGltaXQ6IFBBR0VfU0laRX0pOwogICAgICAgICAgICAgICAgICAgIGlmIChwYW5lbC5jYXRlZ29yeSAhPT0gJ2FsbCcpIHBhcmFtcy5zZXQoJ2NhdGVnb3J5JywgcGFuZWwuY2F0ZWdvcnkpOwogICAgICAgICAgICAgICAgICAgIGlmIChwYW5lbC5jb250YWlucykgcGFyYW1zLnNldCgnY29udGFpbnMnLCBwYW5lbC5jb250YWlucyk7CiAgICAgICAgICAgICAgICAgICAgcGFuZWwubG9hZGluZyA9IHRydWU7CgogICAgICAgICAgICAgICAgICAgIGZldGNoKGBhcGkvJHtraW5kfT8ke3BhcmFtc31gKQogICAgICAgICAgICAgICAgICAgICAgICAudGhlbihyZXNwb25zZSA9PiByZXNwb25zZS5qc29uKCkpCiAgICAgICAgICAgICAgICAgICAgICAgIC50aGVuKGRhdGEgPT4gewogICAgICAgICAgICAgICAgICAgICAgICAgICAgLy8gQSBuZXdlciBjYXRlZ29yeSBvciBzZWFyY2ggc3VwZXJzZWRlZCB0aGlzIHBhZ2UKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGlmIChyZXF1ZXN0ICE9PSBwYW5lbC5yZXF1ZXN0KSByZXR1cm47CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBpZiAocmVzZXQpIGdyaWQucmVwbGFjZUNoaWxkcmVuKCk7CgogICAgICAgICAgICAgICAgICAgICAgICAgICAgY29uc3Qgc2VsZWN0ZWQgPSBraW5kID09PSAnc291cmNlcycgPyBzZWxlY3RlZFNvdXJjZSA6IHNlbGVjdGVkRGVzdGluYXRpb247CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBjb25zdCBmcmFnbWVudCA9IGRvY3VtZW50LmNyZWF0ZURvY3VtZW50RnJhZ21lbnQoKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGRhdGEuaXRlbXMuZm9yRWFjaChpdGVtID0+IHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICBjb25zdCBidG4gPSBkb2N1bWVudC5jcmVhdGVFbGVtZW50KCdkaXYnKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICBidG4uY2xhc3NOYW1lID0gYnV0dG9uQ2xhc3M7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgYnRuLmRhdGFzZXRbZGF0YUtleV0gPSBpdGVtLm5hbWU7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgYnRuLmRhdGFzZXQuY2F0ZWdvcmllcyA9IGl0ZW0uY2F0ZWdvcmllcy5qb2luKCcgJyk7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgYnRuLnRleHRDb250ZW50ID0gaXRlbS5uYW1lOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIGJ0bi5jbGFzc0xpc3QudG9nZ2xlKCdzZWxlY3RlZCcsIGl0ZW0ubmFtZSA9PT0gc2VsZWN0ZWQpOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIGZyYWdtZW50LmFwcGVuZENoaWxkKGJ0bik7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICB9KTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGdyaWQuYXBwZW5kQ2hpbGQoZnJhZ21lbnQpOwoKICAgICAgICAgICAgICAgICAgICAgICAgICAgIHBhbmVsLmxvYWRlZCArPSBkYXRhLml0ZW1zLmxlbmd0aDsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIHBhbmVsLnRvdGFsID0gZGF0YS50b3RhbDsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGNvdW50RGlzcGxheS50ZXh0Q29udGVudCA9IGAke2RhdGEudG90YWx9LyR7ZGF0YS5zaXplfWA7CiAgICAgICAgICAgICAgICAgICAgICAgIH0pCiAgICAgICAgICAgICAgICAgICAgICAgIC5jYXRjaChlcnJvciA9PiB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBjb25zb2xlLmVycm9yKGBFcnJvciBsb2FkaW5nICR7a2luZH06YCwgZXJyb3IpOwogICAgICAgICAgICAgICAgICAgICAgICB9KQogICAgICAgICAgICAgICAgICAgICAgICAuZmluYWxseSgoKSA9PiB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBpZiAocmVxdWVzdCA9PT0gcGFuZWwucmVxdWVzdCkgcGFuZWwubG9hZGluZyA9IGZhbHNlOwogICAgICAgICAgICAgICAgICAgICAgICB9KTsKICAgICAgICAgICAgICAgIH0KCiAgICAgICAgICAgICAgICAvLyBOZXh0IHBhZ2Ugd2hlbiBzY3JvbGxlZCBuZWFyIHRoZSBlbmQKICAgICAgICAgICAgICAgIGdyaWQuYWRkRXZlbnRMaXN0ZW5lcignc2Nyb2xsJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICAgICAgaWYgKGdyaWQuc2Nyb2xsVG9wICsgZ3JpZC5jbGllbnRIZWlnaHQgPj0gZ3JpZC5zY3JvbGxIZWlnaHQgLSAyMDApIHsKICAgICAgICAgICAgICAgICAgICAgICAgbG9hZChmYWxzZSk7CiAgICAgICAgICAgICAgICAgICAgfQogICAgICAgICAgICAgICAgfSk7CgogICAgICAgICAgICAgICAgLy8gT25lIGxpc3RlbmVyIGZvciBldmVyeSBidXR0b24sIGluY2x1ZGluZyB0aG9zZSBsb2FkZWQgbGF0ZXIKICAgICAgICAgICAgICAgIGdyaWQuYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbihlKSB7CiAgICAgICAgICAgICAgICAgICAgY29uc3QgYnRuID0gZS50YXJnZXQuY2xvc2VzdChgLiR7YnV0dG9uQ2xhc3N9YCk7CiAgICAgICAgICAgICAgICAgICAgaWYgKGJ0bikgb25TZWxlY3QoYnRuKTsKICAgICAgICAgICAgICAgIH0pOwoKICAgICAgICAgICAgICAgIGxldCBzZWFyY2hUaW1lciA9IG51bGw7CiAgICAgICAgICAgICAgICBzZWFyY2hJbnB1dC5hZGRFdmVudExpc3RlbmVyKCdpbnB1dCcsIGZ1bmN0aW9uKCkgewogICAgICAgICAgICAgICAgICAgIGNsZWFyVGltZW91dChzZWFyY2hUaW1lcik7CiAgICAgICAgICAgICAgICAgICAgc2VhcmNoVGltZXIgPSBzZXRUaW1lb3V0KCgpID0+IHsKICAgICAgICAgICAgICAgICAgICAgICAgcGFuZWwuY29udGFpbnMgPSB0aGlzLnZhbHVlLnRyaW0oKTsKICAgICAgICAgICAgICAgICAgICAgICAgbG9hZCh0cnVlKTsKICAgICAgICAgICAgICAgICAgICB9LCAxNTApOwogICAgICAgICAgICAgICAgfSk7CgogICAgICAgICAgICAgICAgc2VhcmNoSW5wdXQuYWRkRXZlbnRMaXN0ZW5lcigna2V5ZG93bicsIGZ1bmN0aW9uKGUpIHsKICAgICAgICAgICAgICAgICAgICBpZiAoZS5rZXkgPT09ICdFc2NhcGUnKSB7CiAgICAgICAgICAgICAgICAgICAgICAgIHRoaXMudmFsdWUgPSAnJzsKICAgICAgICAgICAgICAgICAgICAgICAgcGFuZWwuY29udGFpbnMgPSAnJzsKICAgICAgICAgICAgICAgICAgICAgICAgbG9hZCh0cnVlKTsKICAgICAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICB9KTsKCiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKGAke2NhdGVnb3J5U2VsZWN0b3J9IC5jYXRlZ29yeS1idG5gKS5mb3JFYWNoKGJ0biA9PiB7CiAgICAgICAgICAgICAgICAgICAgYnRuLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoYCR7Y2F0ZWdvcnlTZWxlY3Rvcn0gLmNhdGVnb3J5LWJ0bi5hY3RpdmVgKS5mb3JFYWNoKGIgPT4KICAgICAgICAgICAgICAgICAgICAgICAgICAgIGIuY2xhc3NMaXN0LnJlbW92ZSgnYWN0aXZlJykpOwogICAgICAgICAgICAgICAgICAgICAgICB0aGlzLmNsYXNzTGlzdC5hZGQoJ2FjdGl2ZScpOwogICAgICAgICAgICAgICAgICAgICAgICBwYW5lbC5jYXRlZ29yeSA9IHRoaXMuZGF0YXNldC5jYXRlZ29yeTsKICAgICAgICAgICAgICAgICAgICAgICAgbG9hZCh0cnVlKTsKICAgICAgICAgICAgICAgICAgICB9KTsKICAgICAgICAgICAgICAgIH0pOwoKICAgICAgICAgICAgICAgIGxvYWQodHJ1ZSk7CiAgICAgICAgICAgIH0KCiAgICAgICAgICAgIC8vIFJvdXRlciBzdGF0dXMgZnVuY3Rpb25hbGl0eQogICAgICAgICAgICBmdW5jdGlvbiBzaG93RGVzdGluYXRpb25Tb3VyY2UoZGVzdGluYXRpb24sIHNvdXJjZSkgewogICAgICAgICAgICAgICAgaWYgKHNlbGVjdGVkRGVzdGluYXRpb24gPT09IGRlc3RpbmF0aW9uICYmIHNvdXJjZSkgewogICAgICAgICAgICAgICAgICAgIC8vIFRoZSBzb3VyY2UncyBidXR0b24gbWF5IG5vdCBiZSBsb2FkZWQgaW4gdGhlIGN1cnJlbnQgY2F0ZWdvcnkgb3Igc2VhcmNoCiAgICAgICAgICAgICAgICAgICAgY29uc3Qgc291cmNlQnRuID0gZG9jdW1lbnQucXVlcnlTZWxlY3RvcihgLnNvdXJjZS1idG5bZGF0YS1zb3VyY2U9IiR7Q1NTLmVzY2FwZShzb3VyY2UpfSJdYCk7CiAgICAgICAgICAgICAgICAgICAgaWYgKHNvdXJjZSA9PT0gJ0hELUJBUlMnKSB7CiAgICAgICAgICAgICAgICAgICAgICAgIHNlbGVjdFNvdXJjZSgnSEQtQkFSUycsIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJy5jb250cm9sLWJ0bltkYXRhLXNvdXJjZT0iSEQtQkFSUyJdJykpOwogICAgICAgICAgICAgICAgICAgIH0gZWxzZSB7CiAgICAgICAgICAgICAgICAgICAgICAgIHNlbGVjdFNvdXJjZShzb3VyY2UsIHNvdXJjZUJ0bik7CiAgICAgICAgICAgICAgICAgICAgfQogICAgICAgICAgICAgICAgfQogICAgICAgICAgICB9CgogICAgICAgICAgICBmdW5jdGlvbiB1cGRhdGVEZXN0aW5hdGlvblN0YXR1cyhkZXN0aW5hdGlvbikgewogICAgICAgICAgICAgICAgLy8gQW5zd2VyIGZyb20gdGhlIHRhbGx5IHB1c2hlZCBvdmVyIC9ldmVudHMsIG9ubHkgYXNraW5nIHRoZSBzZXJ2ZXIgaWYgaXQgaXMgdW5rbm93bgogICAgICAgICAgICAgICAgY29uc3Qgcm91dGVyRGVzdGluYXRpb24gPSBkZXN0aW5hdGlvbkFsaWFzZXNbZGVzdGluYXRpb25dIHx8IGRlc3RpbmF0aW9uOwogICAgICAgICAgICAgICAgZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoJ2xvY2stbWVzc2FnZScpLmNsYXNzTGlzdC50b2dnbGUoJ3Zpc2libGUnLCBsb2NrZWREZXN0aW5hdGlvbnMuaGFzKHJvdXRlckRlc3RpbmF0aW9uKSk7CiAgICAgICAgICAgICAgICBpZiAocm91dGVyRGVzdGluYXRpb24gaW4gY3Jvc3Nwb2ludHMpIHsKICAgICAgICAgICAgICAgICAgICBzaG93RGVzdGluYXRpb25Tb3VyY2UoZGVzdGluYXRpb24sIGNyb3NzcG9pbnRzW3JvdXRlckRlc3RpbmF0aW9uXSk7CiAgICAgICAgICAgICAgICAgICAgcmV0dXJuOwogICAgICAgICAgICAgICAgfQoKICAgICAgICAgICAgICAgIGZldGNoKGBzdGF0dXMvJHtkZXN0aW5hdGlvbn1gKQogICAgICAgICAgICAgICAgICAgIC50aGVuKHJlc3BvbnNlID0+IHJlc3BvbnNlLmpzb24oKSkKICAgICAgICAgICAgICAgICAgICAudGhlbihkYXRhID0+IHNob3dEZXN0aW5hdGlvblNvdXJjZShkZXN0aW5hdGlvbiwgZGF0YS5zb3VyY2UpKQogICAgICAgICAgICAgICAgICAgIC5jYXRjaChlcnJvciA9PiB7CiAgICAgICAgICAgICAgICAgICAgICAgIGNvbnNvbGUuZXJyb3IoJ0Vycm9yIGdldHRpbmcgc3RhdHVzOicsIGVycm9yKTsKICAgICAgICAgICAgICAgICAgICB9KTsKICAgICAgICAgICAgfQoKICAgICAgICAgICAgLy8gRXZlbnRzIG5hbWUgcm91dGVyIGRlc3RpbmF0aW9uczsgdGhlIHNlbGVjdGlvbiBtYXkgYmUgYW4gYWxpYXMgb2Ygb25lCiAgICAgICAgICAgIGZ1bmN0aW9uIGlzU2VsZWN0ZWREZXN0aW5hdGlvbihyb3V0ZXJEZXN0aW5hdGlvbikgewogICAgICAgICAgICAgICAgcmV0dXJuIHNlbGVjdGVkRGVzdGluYXRpb24gIT09IG51bGwgJiYKICAgICAgICAgICAgICAgICAgICAoZGVzdGluYXRpb25BbGlhc2VzW3NlbGVjdGVkRGVzdGluYXRpb25dIHx8IHNlbGVjdGVkRGVzdGluYXRpb24pID09PSByb3V0ZXJEZXN0aW5hdGlvbjsKICAgICAgICAgICAgfQoKICAgICAgICAgICAgLy8gTGl2ZSB0YWxseSB1cGRhdGVzCiAgICAgICAgICAgIGZ1bmN0aW9uIHN1YnNjcmliZVRvRXZlbnRzKCkgewogICAgICAgICAgICAgICAgY29uc3QgZXZlbnRzID0gbmV3IEV2ZW50U291cmNlKCdldmVudHMnKTsKICAgICAgICAgICAgICAgIGNvbnN0IHN0YXR1c0RvdCA9IGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJy5zdGF0dXMtZG90Jyk7CgogICAgICAgICAgICAgICAgZXZlbnRzLmFkZEV2ZW50TGlzdGVuZXIoJ21hdHJpeCcsIGZ1bmN0aW9uKGUpIHsKICAgICAgICAgICAgICAgICAgICBjb25zdCBkYXRhID0gSlNPTi5wYXJzZShlLmRhdGEpOwogICAgICAgICAgICAgICAgICAgIHN0YXR1c0RvdC5jbGFzc0xpc3QudG9nZ2xlKCdhY3RpdmUnLCBkYXRhLmNvbm5lY3RlZCk7CiAgICAgICAgICAgICAgICAgICAgY3Jvc3Nwb2ludHMgPSBkYXRhLmNyb3NzcG9pbnRzOwogICAgICAgICAgICAgICAgICAgIGRlc3RpbmF0aW9uQWxpYXNlcyA9IGRhdGEuYWxpYXNlczsKICAgICAgICAgICAgICAgICAgICBsb2NrZWREZXN0aW5hdGlvbnMuY2xlYXIoKTsKICAgICAgICAgICAgICAgICAgICBkYXRhLmxvY2tzLmZvckVhY2goZGVzdGluYXRpb24gPT4gbG9ja2VkRGVzdGluYXRpb25zLmFkZChkZXN0aW5hdGlvbikpOwogICAgICAgICAgICAgICAgICAgIGlmIChzZWxlY3RlZERlc3RpbmF0aW9uKSB7CiAgICAgICAgICAgICAgICAgICAgICAgIHVwZGF0ZURlc3RpbmF0aW9uU3RhdHVzKHNlbGVjdGVkRGVzdGluYXRpb24pOwogICAgICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgICAgIH0pOwoKICAgICAgICAgICAgICAgIGV2ZW50cy5hZGRFdmVudExpc3RlbmVyKCd4cG9pbnQnLCBmdW5jdGlvbihlKSB7CiAgICAgICAgICAgICAgICAgICAgY29uc3QgZGF0YSA9IEpTT04ucGFyc2UoZS5kYXRhKTsKICAgICAgICAgICAgICAgICAgICBjcm9zc3BvaW50c1tkYXRhLmRlc3RpbmF0aW9uXSA9IGRhdGEuc291cmNlOwogICAgICAgICAgICAgICAgICAgIGlmIChpc1NlbGVjdGVkRGVzdGluYXRpb24oZGF0YS5kZXN0aW5hdGlvbikpIHsKICAgICAgICAgICAgICAgICAgICAgICAgc2hvd0Rlc3RpbmF0aW9uU291cmNlKHNlbGVjdGVkRGVzdGluYXRpb24sIGRhdGEuc291cmNlKTsKICAgICAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICB9KTsKCiAgICAgICAgICAgICAgICBldmVudHMuYWRkRXZlbnRMaXN0ZW5lcignbGluaycsIGZ1bmN0aW9uKGUpIHsKICAgICAgICAgICAgICAgICAgICBjb25zdCBkYXRhID0gSlNPTi5wYXJzZShlLmRhdGEpOwogICAgICAgICAgICAgICAgICAgIHN0YXR1c0RvdC5jbGFzc0xpc3QudG9nZ2xlKCdhY3RpdmUnLCBkYXRhLnN0YXRlID09PSAnY29ubmVjdGVkJyk7CiAgICAgICAgICAgICAgICB9KTsKCiAgICAgICAgICAgICAgICBldmVudHMuYWRkRXZlbnRMaXN0ZW5lcignbG9jaycsIGZ1bmN0aW9uKGUpIHsKICAgICAgICAgICAgICAgICAgICBjb25zdCBkYXRhID0gSlNPTi5wYXJzZShlLmRhdGEpOwogICAgICAgICAgICAgICAgICAgIGlmIChkYXRhLmxvY2tlZCkgewogICAgICAgICAgICAgICAgICAgICAgICBsb2NrZWREZXN0aW5hdGlvbnMuYWRkKGRhdGEuZGVzdGluYXRpb24pOwogICAgICAgICAgICAgICAgICAgIH0gZWxzZSB7CiAgICAgICAgICAgICAgICAgICAgICAgIGxvY2tlZERlc3RpbmF0aW9ucy5kZWxldGUoZGF0YS5kZXN0aW5hdGlvbik7CiAgICAgICAgICAgICAgICAgICAgfQogICAgICAgICAgICAgICAgICAgIGlmIChpc1NlbGVjdGVkRGVzdGluYXRpb24oZGF0YS5kZXN0aW5hdGlvbikpIHsKICAgICAgICAgICAgICAgICAgICAgICAgZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoJ2xvY2stbWVzc2FnZScpLmNsYXNzTGlzdC50b2dnbGUoJ3Zpc2libGUnLCBkYXRhLmxvY2tlZCk7CiAgICAgICAgICAgICAgICAgICAgfQogICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgIH0KCiAgICAgICAgICAgIC8vIFNlbGVjdGlvbiBmdW5jdGlvbmFsaXR5CiAgICAgICAgICAgIGZ1bmN0aW9uIHNlbGVjdFNvdXJjZShzb3VyY2UsIGJ1dHRvbkVsZW1lbnQpIHsKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5zb3VyY2UtYnRuLnNlbGVjdGVkLCAuY29udHJvbC1idG4uc2VsZWN0ZWQnKS5mb3JFYWNoKGIgPT4gYi5jbGFzc0xpc3QucmVtb3ZlKCdzZWxlY3RlZCcpKTsKICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgaWYgKGJ1dHRvbkVsZW1lbnQpIHsKICAgICAgICAgICAgICAgICAgICBidXR0b25FbGVtZW50LmNsYXNzTGlzdC5hZGQoJ3NlbGVjdGVkJyk7CiAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgIHNlbGVjdGVkU291cmNlID0gc291cmNlOwogICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvcignI3NlbGVjdGVkLXNvdXJjZSAuc2VsZWN0aW9uLXZhbHVlJykudGV4dENvbnRlbnQgPSBzb3VyY2U7CiAgICAgICAgICAgICAgICB1cGRhdGVUYWtlQnV0dG9uKCk7CiAgICAgICAgICAgIH0KCiAgICAgICAgICAgIGZ1bmN0aW9uIHJlc2V0U2VsZWN0aW9ucygpIHsKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5zb3VyY2UtYnRuLnNlbGVjdGVkLCAuY29udHJvbC1idG4uc2VsZWN0ZWQnKS5mb3JFYWNoKGJ0biA9PiBidG4uY2xhc3NMaXN0LnJlbW92ZSgnc2VsZWN0ZWQnKSk7CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuZGVzdGluYXRpb24tYnRuLnNlbGVjdGVkJykuZm9yRWFjaChidG4gPT4gYnRuLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvcignI3NlbGVjdGVkLXNvdXJjZSAuc2VsZWN0aW9uLXZhbHVlJykudGV4dENvbnRlbnQgPSAnJzsKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJyNzZWxlY3RlZC1kZXN0aW5hdGlvbiAuc2VsZWN0aW9uLXZhbHVlJykudGV4dENvbnRlbnQgPSAnJzsKICAgICAgICAgICAgICAgIGRvY3VtZW50LmdldEVsZW1lbnRCeUlkKCdsb2NrLW1lc3NhZ2UnKS5jbGFzc0xpc3QucmVtb3ZlKCd2aXNpYmxlJyk7CiAgICAgICAgICAgICAgICBzZWxlY3RlZFNvdXJjZSA9IG51bGw7CiAgICAgICAgICAgICAgICBzZWxlY3RlZERlc3RpbmF0aW9uID0gbnVsbDsKICAgICAgICAgICAgICAgIHVwZGF0ZVRha2VCdXR0b24oKTsKICAgICAgICAgICAgfQoKICAgICAgICAgICAgZnVuY3Rpb24gdXBkYXRlVGFrZUJ1dHRvbigpIHsKICAgICAgICAgICAgICAgIGNvbnN0IHRha2VCdXR0b24gPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcudGFrZS1idXR0b24nKTsKICAgICAgICAgICAgICAgIGlmIChzZWxlY3RlZFNvdXJjZSAmJiBzZWxlY3RlZERlc3RpbmF0aW9uKSB7CiAgICAgICAgICAgICAgICAgICAgdGFrZUJ1dHRvbi5jbGFzc0xpc3QuYWRkKCdhY3RpdmUnKTsKICAgICAgICAgICAgICAgIH0gZWxzZSB7CiAgICAgICAgICAgICAgICAgICAgdGFrZUJ1dHRvbi5jbGFzc0xpc3QucmVtb3ZlKCdhY3RpdmUnKTsKICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgfQoKICAgICAgICAgICAgLy8gRXZlbnQgTGlzdGVuZXJzCiAgICAgICAgICAgIGZ1bmN0aW9uIHNlbGVjdERlc3RpbmF0aW9uKGJ0bikgewogICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbCgnLmRlc3RpbmF0aW9uLWJ0bi5zZWxlY3RlZCcpLmZvckVhY2goYiA9PiBiLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgYnRuLmNsYXNzTGlzdC5hZGQoJ3NlbGVjdGVkJyk7CiAgICAgICAgICAgICAgICBzZWxlY3RlZERlc3RpbmF0aW9uID0gYnRuLmRhdGFzZXQuZGVzdGluYXRpb247CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcjc2VsZWN0ZWQtZGVzdGluYXRpb24gLnNlbGVjdGlvbi12YWx1ZScpLnRleHRDb250ZW50ID0gc2VsZWN0ZWREZXN0aW5hdGlvbjsKICAgICAgICAgICAgICAgIHVwZGF0ZVRha2VCdXR0b24oKTsKICAgICAgICAgICAgICAgIHVwZGF0ZURlc3RpbmF0aW9uU3RhdHVzKHNlbGVjdGVkRGVzdGluYXRpb24pOwogICAgICAgICAgICB9CgogICAgICAgICAgICBkb2N1bWVudC5nZXRFbGVtZW50QnlJZCgnc2VsZWN0ZWQtc291cmNlJykuYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgIHNlbGVjdGVkU291cmNlID0gbnVsbDsKICAgICAgICAgICAgICAgIHRoaXMucXVlcnlTZWxlY3RvcignLnNlbGVjdGlvbi12YWx1ZScpLnRleHRDb250ZW50ID0gJyc7CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuc291cmNlLWJ0bi5zZWxlY3RlZCwgLmNvbnRyb2wtYnRuLnNlbGVjdGVkJykuZm9yRWFjaChidG4gPT4gYnRuLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgdXBkYXRlVGFrZUJ1dHRvbigpOwogICAgICAgICAgICB9KTsKCiAgICAgICAgICAgIGRvY3VtZW50LmdldEVsZW1lbnRCeUlkKCdzZWxlY3RlZC1kZXN0aW5hdGlvbicpLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICBzZWxlY3RlZERlc3RpbmF0aW9uID0gbnVsbDsKICAgICAgICAgICAgICAgIHRoaXMucXVlcnlTZWxlY3RvcignLnNlbGVjdGlvbi12YWx1ZScpLnRleHRDb250ZW50ID0gJyc7CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuZGVzdGluYXRpb24tYnRuLnNlbGVjdGVkJykuZm9yRWFjaChidG4gPT4gYnRuLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgdXBkYXRlVGFrZUJ1dHRvbigpOwogICAgICAgICAgICAgICAgbG9ja01lc3NhZ2UgPSBkb2N1bWVudC5nZXRFbGVtZW50QnlJZCgnbG9jay1tZXNzYWdlJykuY2xhc3NMaXN0LnJlbW92ZSgndmlzaWJsZScpOwogICAgICAgICAgICB9KTsKCiAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJy50YWtlLWJ1dHRvbicpLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICBpZiAoc2VsZWN0ZWRTb3VyY2UgJiYgc2VsZWN0ZWREZXN0aW5hdGlvbikgewogICAgICAgICAgICAgICAgICAgIGZldGNoKCdyb3V0ZScsIHsKICAgICAgICAgICAgICAgICAgICAgICAgbWV0aG9kOiAnUE9TVCcsCiAgICAgICAgICAgICAgICAgICAgICAgIGhlYWRlcnM6IHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgICdDb250ZW50LVR5cGUnOiAnYXBwbGljYXRpb24vanNvbicsCiAgICAgICAgICAgICAgICAgICAgICAgIH0sCiAgICAgICAgICAgICAgICAgICAgICAgIGJvZHk6IEpTT04uc3RyaW5naWZ5KHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIHNvdXJjZTogc2VsZWN0ZWRTb3VyY2UsCiAgICAgICAgICAgICAgICAgICAgICAgICAgICBkZXN0aW5hdGlvbjogc2VsZWN0ZWREZXN0aW5hdGlvbgogICAgICAgICAgICAgICAgICAgICAgICB9KQogICAgICAgICAgICAgICAgICAgIH0pCiAgICAgICAgICAgICAgICAgICAgLnRoZW4ocmVzcG9uc2UgPT4gcmVzcG9uc2UuanNvbigpKQogICAgICAgICAgICAgICAgICAgIC50aGVuKGRhdGEgPT4gewogICAgICAgICAgICAgICAgICAgICAgICBjb25zb2xlLmxvZygnUm91dGUgcmVzcG9uc2U6JywgZGF0YSk7CiAgICAgICAgICAgICAgICAgICAgICAgIGNvbnN0IGxvY2tNZXNzYWdlID0gZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoJ2xvY2stbWVzc2FnZScpOwogICAgICAgICAgICAgICAgICAgICAgICBjb25zb2xlLmxvZygnTG9jayBtZXNzYWdlIGVsZW1lbnQ6JywgbG9ja01lc3NhZ2UpOwogICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgaWYgKGRhdGEubG9ja2VkKSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBjb25zb2xlLmxvZygnU2hvd2luZyBsb2NrIG1lc3NhZ2UnKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGxvY2tNZXNzYWdlLmNsYXNzTGlzdC5hZGQoJ3Zpc2libGUnKTsKICAgICAgICAgICAgICAgICAgICAgICAgfSBlbHNlIHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGNvbnNvbGUubG9nKCdIaWRpbmcgbG9jayBtZXNzYWdlJyk7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBsb2NrTWVzc2FnZS5jbGFzc0xpc3QucmVtb3ZlKCd2aXNpYmxlJyk7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGlmIChkYXRhLnN1Y2Nlc3MpIHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICByZXNldFNlbGVjdGlvbnMoKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgICAgICAgICAgICAgfQogICAgICAgICAgICAgICAgICAgIH0pCiAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgIH0pOwoKICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbCgnLmNvbnRyb2wtYnRuJykuZm9yRWFjaChidG4gPT4gewogICAgICAgICAgICAgICAgYnRuLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICAgICAgc2VsZWN0U291cmNlKHRoaXMuZGF0YXNldC5zb3VyY2UsIHRoaXMpOwogICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgIH0pOwoKICAgICAgICAgICAgLy8gSW5pdGlhbGl6ZSBhbGwgY29tcG9uZW50cwogICAgICAgICAgICAvLyBJbmZvIGJ1dHRvbiBmdW5jdGlvbmFsaXR5CiAgICAgICAgICAgIGNvbnN0IGluZm9CdXR0b24gPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcuaW5mby1idXR0b24nKTsKICAgICAgICAgICAgY29uc3QgaW5mb01vZGFsID0gZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoJ2luZm8tbW9kYWwnKTsKICAgICAgICAgICAgY29uc3QgY2xvc2VCdXR0b24gPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcubW9kYWwtY2xvc2UnKTsKICAgICAgICAgICAgCiAgICAgICAgICAgIGluZm9CdXR0b24uYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgIGluZm9Nb2RhbC5jbGFzc0xpc3QuYWRkKCd2aXNpYmxlJyk7CiAgICAgICAgICAgIH0pOwogICAgICAgICAgICAKICAgICAgICAgICAgY2xvc2VCdXR0b24uYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgIGluZm9Nb2RhbC5jbGFzc0xpc3QucmVtb3ZlKCd2aXNpYmxlJyk7CiAgICAgICAgICAgIH0pOwogICAgICAgICAgICAKICAgICAgICAgICAgLy8gQ2xvc2UgbW9kYWwgd2hlbiBjbGlja2luZyBvdXRzaWRlIG9mIGl0CiAgICAgICAgICAgIHdpbmRvdy5hZGRFdmVudExpc3RlbmVyKCdjbGljaycsIGZ1bmN0aW9uKGV2ZW50KSB7CiAgICAgICAgICAgICAgICBpZiAoZXZlbnQudGFyZ2V0ID09PSBpbmZvTW9kYWwpIHsKICAgICAgICAgICAgICAgICAgICBpbmZvTW9kYWwuY2xhc3NMaXN0LnJlbW92ZSgndmlzaWJsZScpOwogICAgICAgICAgICAgICAgfQogICAgICAgICAgICB9KTsKICAgICAgICAgICAgCiAgICAgICAgICAgIHVwZGF0ZVRpbWVzdGFtcCgpOwogICAgICAgICAgICBzZXR1cE5hbWVQYW5lbCgnc291cmNlcycsICdzb3VyY2UtYnRuJywgJ3NvdXJjZScsICdzb3VyY2Utc2VhcmNoJywgJ3NvdXJjZS1jb3VudCcsICdzb3VyY2VzLWdyaWQnLAogICAgICAgICAgICAgICAgICAgICAgICAgICAnLmNhdGVnb3J5LWJ1dHRvbnMuc291cmNlcycsIGJ0biA9PiBzZWxlY3RTb3VyY2UoYnRuLmRhdGFzZXQuc291cmNlLCBidG4pKTsKICAgICAgICAgICAgc2V0dXBOYW1lUGFuZWwoJ2Rlc3RpbmF0aW9ucycsICdkZXN0aW5hdGlvbi1idG4nLCAnZGVzdGluYXRpb24nLCAnZGVzdGluYXRpb24tc2VhcmNoJywgJ2Rlc3RpbmF0aW9uLWNvdW50JywgJ2Rlc3RpbmF0aW9ucy1ncmlkJywKICAgICAgICAgICAgICAgICAgICAgICAgICAgJy5jYXRlZ29yeS1idXR0b25zLmRlc3RpbmF0aW9ucycsIHNlbGVjdERlc3RpbmF0aW9uKTsKICAgICAgICAgICAgc3Vic2NyaWJlVG9FdmVudHMoKTsKICAgICAgICB9KTsKICAgIDwvc2NyaXB0Pgo8L2JvZHk+CjwvaHRtbD4="""
+
+class RenderedPage:
+    #A rendered page kept ready to send, with its gzip variant and ETag
+    def __init__(self, key, html):
+        self.key = key
+        self.body = html.encode('utf-8')
+        self.gzip_body = gzip.compress(self.body)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()}"'
 
-HTML_TEMPLATE_B64 = """PCFET0NUWVBFIGh0bWw+CjxodG1sIGxhbmc9ImVuIj4KPGhlYWQ+CiAgICA8bWV0YSBjaGFyc2V0PSJVVEYtOCI+CiAgICA8bWV0YSBuYW1lPSJ2aWV3cG9ydCIgY29udGVudD0id2lkdGg9ZGV2aWNlLXdpZHRoLCBpbml0aWFsLXNjYWxlPTEuMCI+CiAgICA8dGl0bGU+Um91dGVyIENvbnRyb2wgSW50ZXJmYWNlPC90aXRsZT4KICAgIDxzdHlsZT4KICAgICAgICAvKiBFbWJlZGRlZCBDU1MgKi8KICAgICAgICA6cm9vdCB7CiAgICAgICAgICAgIC0tYmFja2dyb3VuZC1kYXJrOiAjMWExZjJlOwogICAgICAgICAgICAtLXBhbmVsLWJnOiAjMjMyODM2OwogICAgICAgICAgICAtLWJ1dHRvbi1iZzogIzJhMzAzZTsKICAgICAgICAgICAgLS1hY2NlbnQtY3lhbjogIzAwZjBmZjsKICAgICAgICAgICAgLS1hY2NlbnQtcmVkOiAjZmYzYjNiOwogICAgICAgICAgICAtLXRleHQtcHJpbWFyeTogI2ZmZmZmZjsKICAgICAgICAgICAgLS10ZXh0LXNlY29uZGFyeTogcmdiYSgyNTUsIDI1NSwgMjU1LCAwLjcpOwogICAgICAgICAgICAtLWJvcmRlci1jb2xvcjogcmdiYSgyNTUsIDI1NSwgMjU1LCAwLjEpOwogICAgICAgIH0KCiAgICAgICAgKiB7CiAgICAgICAgICAgIG1hcmdpbjogMDsKICAgICAgICAgICAgcGFkZGluZzogMDsKICAgICAgICAgICAgYm94LXNpemluZzogYm9yZGVyLWJveDsKICAgICAgICAgICAgZm9udC1mYW1pbHk6IC1hcHBsZS1zeXN0ZW0sIEJsaW5rTWFjU3lzdGVtRm9udCwgIlNlZ29lIFVJIiwgUm9ib3RvLCBBcmlhbCwgc2Fucy1zZXJpZjsKICAgICAgICB9CgogICAgICAgIGJvZHkgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1iYWNrZ3JvdW5kLWRhcmspOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICAgICAgbGluZS1oZWlnaHQ6IDEuNTsKICAgICAgICAgICAgbWluLWhlaWdodDogMTAwdmg7CiAgICAgICAgfQoKICAgICAgICAuY29udGFpbmVyIHsKICAgICAgICAgICAgbWF4LXdpZHRoOiAxODAwcHg7CiAgICAgICAgICAgIG1hcmdpbjogMCBhdXRvOwogICAgICAgICAgICBwYWRkaW5nOiAyMHB4OwogICAgICAgIH0KCiAgICAgICAgLyogVG9wIEJhciAqLwogICAgICAgIC50b3AtYmFyIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBzcGFjZS1iZXR3ZWVuOwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgICAgICBtYXJnaW4tYm90dG9tOiAyMHB4OwogICAgICAgICAgICBwYWRkaW5nOiAxMHB4IDIwcHg7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLXBhbmVsLWJnKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogOHB4OwogICAgICAgIH0KCiAgICAgICAgLnN0YXR1cy1pbmRpY2F0b3JzIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgZ2FwOiAyMHB4OwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgIH0KCiAgICAgICAgLnN0YXR1cy1pdGVtIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgYWxpZ24taXRlbXM6IGNlbnRlcjsKICAgICAgICAgICAgZ2FwOiA4cHg7CiAgICAgICAgfQoKICAgICAgICAuc3RhdHVzLWRvdCB7CiAgICAgICAgICAgIHdpZHRoOiAxMHB4OwogICAgICAgICAgICBoZWlnaHQ6IDEwcHg7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDUwJTsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYWNjZW50LXJlZCk7CiAgICAgICAgfQoKICAgICAgICAuc3RhdHVzLWRvdC5hY3RpdmUgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiAjMDBmZjAwOwogICAgICAgIH0KCiAgICAgICAgLnRpbWVzdGFtcCB7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS10ZXh0LXNlY29uZGFyeSk7CiAgICAgICAgICAgIGZvbnQtc2l6ZTogMC45ZW07CiAgICAgICAgfQoKICAgICAgICAvKiBNYWluIENvbnRlbnQgTGF5b3V0ICovCiAgICAgICAgLm1haW4tY29udGVudCB7CiAgICAgICAgICAgIGRpc3BsYXk6IGdyaWQ7CiAgICAgICAgICAgIGdyaWQtdGVtcGxhdGUtY29sdW1uczogYXV0byAxZnIgYXV0byAxZnIgYXV0bzsKICAgICAgICAgICAgZ2FwOiAyMHB4OwogICAgICAgICAgICBoZWlnaHQ6IGNhbGMoMTAwdmggLSAxMjBweCk7CiAgICAgICAgfQoKICAgICAgICAvKiBQYW5lbHMgKi8KICAgICAgICAucGFuZWwgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1wYW5lbC1iZyk7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDhweDsKICAgICAgICAgICAgb3ZlcmZsb3c6IGhpZGRlbjsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgZmxleC1kaXJlY3Rpb246IGNvbHVtbjsKICAgICAgICB9CgogICAgICAgIC5wYW5lbC1oZWFkZXIgewogICAgICAgICAgICBwYWRkaW5nOiAxNXB4OwogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiByZ2JhKDAsIDAsIDAsIDAuMik7CiAgICAgICAgfQoKICAgICAgICAucGFuZWwtaGVhZGVyIGgyIHsKICAgICAgICAgICAgZm9udC1zaXplOiAxLjFlbTsKICAgICAgICAgICAgZm9udC13ZWlnaHQ6IDUwMDsKICAgICAgICAgICAgbWFyZ2luLWJvdHRvbTogMTBweDsKICAgICAgICB9CgogICAgICAgIC5zZWFyY2gtY29udGFpbmVyIHsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgZ2FwOiAxMHB4OwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgIH0KCiAgICAgICAgLnNlYXJjaC1pbnB1dCB7CiAgICAgICAgICAgIGZsZXg6IDE7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLWJ1dHRvbi1iZyk7CiAgICAgICAgICAgIGJvcmRlcjogMXB4IHNvbGlkIHZhcigtLWJvcmRlci1jb2xvcik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS10ZXh0LXByaW1hcnkpOwogICAgICAgICAgICBwYWRkaW5nOiA4cHggMTJweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgICAgICBmb250LXNpemU6IDAuOWVtOwogICAgICAgIH0KCiAgICAgICAgLnNlYXJjaC1pbnB1dDpmb2N1cyB7CiAgICAgICAgICAgIG91dGxpbmU6IG5vbmU7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgIH0KCiAgICAgICAgLmNvdW50LWJhZGdlIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYnV0dG9uLWJnKTsKICAgICAgICAgICAgcGFkZGluZzogNHB4IDhweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgICAgICBmb250LXNpemU6IDAuOGVtOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1zZWNvbmRhcnkpOwogICAgICAgIH0KCiAgICAgICAgLnBhbmVsLWNvbnRlbnQgewogICAgICAgICAgICBwYWRkaW5nOiAxNXB4OwogICAgICAgICAgICBkaXNwbGF5OiBncmlkOwogICAgICAgICAgICBncmlkLXRlbXBsYXRlLWNvbHVtbnM6IHJlcGVhdCg0LCBtaW5tYXgoMCwgMWZyKSk7CiAgICAgICAgICAgIGdhcDogOHB4OwogICAgICAgICAgICBvdmVyZmxvdy15OiBhdXRvOwogICAgICAgICAgICBmbGV4OiAxOwogICAgICAgICAgICBhbGlnbi1jb250ZW50OiBzdGFydDsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBzdGFydDsKICAgICAgICB9CgogICAgICAgIC8qIEJ1dHRvbnMgKi8KICAgICAgICAuc291cmNlLWJ0biwgLmRlc3RpbmF0aW9uLWJ0biB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLWJ1dHRvbi1iZyk7CiAgICAgICAgICAgIGJvcmRlcjogMXB4IHNvbGlkIHZhcigtLWJvcmRlci1jb2xvcik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS10ZXh0LXByaW1hcnkpOwogICAgICAgICAgICBwYWRkaW5nOiA4cHggMTBweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgICAgICBjdXJzb3I6IHBvaW50ZXI7CiAgICAgICAgICAgIHRleHQtYWxpZ246IGNlbnRlcjsKICAgICAgICAgICAgZm9udC1zaXplOiAwLjllbTsKICAgICAgICAgICAgdHJhbnNpdGlvbjogYWxsIDAuMnMgZWFzZTsKICAgICAgICAgICAgd2lkdGg6IDEyMHB4OwogICAgICAgICAgICBoZWlnaHQ6IDQycHg7CiAgICAgICAgICAgIGRpc3BsYXk6IGZsZXg7CiAgICAgICAgICAgIGFsaWduLWl0ZW1zOiBjZW50ZXI7CiAgICAgICAgICAgIGp1c3RpZnktY29udGVudDogY2VudGVyOwogICAgICAgICAgICBvdmVyZmxvdzogaGlkZGVuOwogICAgICAgICAgICB3aGl0ZS1zcGFjZTogbm93cmFwOwogICAgICAgICAgICB0ZXh0LW92ZXJmbG93OiBlbGxpcHNpczsKICAgICAgICB9CgogICAgICAgIC5zb3VyY2UtYnRuIHsKICAgICAgICAgICAgYm9yZGVyLWxlZnQ6IDNweCBzb2xpZCB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgfQoKICAgICAgICAuZGVzdGluYXRpb24tYnRuIHsKICAgICAgICAgICAgaGVpZ2h0OiA0OHB4OyAKICAgICAgICAgICAgcGFkZGluZzogNHB4IDhweDsKICAgICAgICAgICAgZmxleC1kaXJlY3Rpb246IGNvbHVtbjsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBzcGFjZS1iZXR3ZWVuOwogICAgICAgICAgICBib3JkZXItbGVmdDogM3B4IHNvbGlkIHZhcigtLWFjY2VudC1yZWQpOwogICAgICAgIH0KCiAgICAgICAgLnNvdXJjZS1idG46aG92ZXIsIC5kZXN0aW5hdGlvbi1idG46aG92ZXIgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiByZ2JhKDI1NSwgMjU1LCAyNTUsIDAuMSk7CiAgICAgICAgfQoKICAgICAgICAuc291cmNlLWJ0bi5zZWxlY3RlZCB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMCwgMjQwLCAyNTUsIDAuMik7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgIH0KCiAgICAgICAgLmRlc3RpbmF0aW9uLWJ0bi5zZWxlY3RlZCB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMjU1LCA1OSwgNTksIDAuMik7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LXJlZCk7CiAgICAgICAgfQoKICAgICAgICAvKiBSb3V0ZSBDb250cm9sIFBhbmVsICovCiAgICAgICAgLnJvdXRlLWNvbnRyb2wtcGFuZWwgewogICAgICAgICAgICBkaXNwbGF5OiBmbGV4OwogICAgICAgICAgICBmbGV4LWRpcmVjdGlvbjogY29sdW1uOwogICAgICAgICAgICBqdXN0aWZ5LWNvbnRlbnQ6IGNlbnRlcjsKICAgICAgICAgICAgYWxpZ24taXRlbXM6IGNlbnRlcjsgCiAgICAgICAgICAgIHBhZGRpbmc6IDIwcHg7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLXBhbmVsLWJnKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogOHB4OwogICAgICAgICAgICBtaW4td2lkdGg6IDMwMHB4OwogICAgICAgICAgICBnYXA6IDIwcHg7CiAgICAgICAgfQoKICAgICAgICAuc2VsZWN0aW9uLWRpc3BsYXkgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBib3JkZXI6IDFweCBzb2xpZCB2YXIoLS1ib3JkZXItY29sb3IpOwogICAgICAgICAgICBib3JkZXItcmFkaXVzOiA0cHg7CiAgICAgICAgICAgIHBhZGRpbmc6IDEwcHg7CiAgICAgICAgICAgIGN1cnNvcjogcG9pbnRlcjsKICAgICAgICAgICAgbWluLWhlaWdodDogODBweDsKICAgICAgICAgICAgbWluLXdpZHRoOiAyMTBweDsKICAgICAgICB9CgogICAgICAgIC5zZWxlY3Rpb24tbGFiZWwgewogICAgICAgICAgICBmb250LXNpemU6IDAuOGVtOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1zZWNvbmRhcnkpOwogICAgICAgICAgICBtYXJnaW4tYm90dG9tOiA1cHg7CiAgICAgICAgfQoKICAgICAgICAuc2VsZWN0aW9uLXZhbHVlIHsKICAgICAgICAgICAgZm9udC1zaXplOiAxLjJlbTsKICAgICAgICAgICAgbWluLWhlaWdodDogMS41ZW07CiAgICAgICAgfQoKICAgICAgICAudGFrZS1idXR0b24gewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICAgICAgYm9yZGVyOiAycHggc29saWQgdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBwYWRkaW5nOiAxNXB4IDQwcHg7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDRweDsKICAgICAgICAgICAgY3Vyc29yOiBwb2ludGVyOwogICAgICAgICAgICBmb250LXNpemU6IDEuMmVtOwogICAgICAgICAgICB0cmFuc2l0aW9uOiBhbGwgMC4ycyBlYXNlOwogICAgICAgIH0KCiAgICAgICAgLnRha2UtYnV0dG9uOmhvdmVyIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogcmdiYSgwLCAyNDAsIDI1NSwgMC4yKTsKICAgICAgICB9CgogICAgICAgIC50YWtlLWJ1dHRvbi5hY3RpdmUgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS1iYWNrZ3JvdW5kLWRhcmspOwogICAgICAgIH0KCiAgICAgICAgLyogQ29udHJvbCBCdXR0b25zICovCiAgICAgICAgLmNvbnRyb2wtYnRuIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYnV0dG9uLWJnKTsKICAgICAgICAgICAgYm9yZGVyOiAxcHggc29saWQgdmFyKC0tYm9yZGVyLWNvbG9yKTsKICAgICAgICAgICAgY29sb3I6IHZhcigtLXRleHQtcHJpbWFyeSk7CiAgICAgICAgICAgIHBhZGRpbmc6IDhweCAxMHB4OwogICAgICAgICAgICBib3JkZXItcmFkaXVzOiA0cHg7CiAgICAgICAgICAgIGN1cnNvcjogcG9pbnRlcjsKICAgICAgICAgICAgdGV4dC1hbGlnbjogY2VudGVyOwogICAgICAgICAgICBmb250LXNpemU6IDAuOWVtOwogICAgICAgICAgICB0cmFuc2l0aW9uOiBhbGwgMC4ycyBlYXNlOwogICAgICAgICAgICB3aWR0aDogMTIwcHg7CiAgICAgICAgICAgIGhlaWdodDogNDJweDsKICAgICAgICAgICAgZGlzcGxheTogZmxleDsKICAgICAgICAgICAgYWxpZ24taXRlbXM6IGNlbnRlcjsKICAgICAgICAgICAganVzdGlmeS1jb250ZW50OiBjZW50ZXI7CiAgICAgICAgICAgIG92ZXJmbG93OiBoaWRkZW47CiAgICAgICAgICAgIHdoaXRlLXNwYWNlOiBub3dyYXA7CiAgICAgICAgICAgIHRleHQtb3ZlcmZsb3c6IGVsbGlwc2lzOwogICAgICAgICAgICBib3JkZXItbGVmdDogM3B4IHNvbGlkIHZhcigtLWFjY2VudC1jeWFuKTsKICAgICAgICB9CgogICAgICAgIC5jb250cm9sLWJ0bjpob3ZlciB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMCwgMjQwLCAyNTUsIDAuMSk7CiAgICAgICAgfQoKICAgICAgICAuY29udHJvbC1idG4uc2VsZWN0ZWQgewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgICAgIGNvbG9yOiB2YXIoLS1iYWNrZ3JvdW5kLWRhcmspOwogICAgICAgIH0KCiAgICAgICAgLyogQ2F0ZWdvcnkgYnV0dG9ucyAqLwogICAgICAgIC5jYXRlZ29yeS1idXR0b25zIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tcGFuZWwtYmcpOwogICAgICAgICAgICBib3JkZXItcmFkaXVzOiA4cHg7CiAgICAgICAgICAgIHBhZGRpbmc6IDE1cHg7CiAgICAgICAgICAgIGRpc3BsYXk6IGZsZXg7CiAgICAgICAgICAgIGZsZXgtZGlyZWN0aW9uOiBjb2x1bW47CiAgICAgICAgICAgIGdhcDogMTBweDsKICAgICAgICAgICAgbWF4LXdpZHRoOiAxNTBweDsKICAgICAgICAgICAgb3ZlcmZsb3cteTogYXV0bzsKICAgICAgICB9CgogICAgICAgIC5jYXRlZ29yeS1idG4gewogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBib3JkZXI6IDFweCBzb2xpZCB2YXIoLS1ib3JkZXItY29sb3IpOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICAgICAgcGFkZGluZzogOHB4IDEycHg7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDRweDsKICAgICAgICAgICAgY3Vyc29yOiBwb2ludGVyOwogICAgICAgICAgICB0ZXh0LWFsaWduOiBsZWZ0OwogICAgICAgICAgICB0cmFuc2l0aW9uOiBhbGwgMC4ycyBlYXNlOwogICAgICAgIH0KCiAgICAgICAgLmNhdGVnb3J5LWJ0bjpob3ZlciB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHJnYmEoMjU1LCAyNTUsIDI1NSwgMC4xKTsKICAgICAgICB9CgogICAgICAgIC5jYXRlZ29yeS1idG4uYWN0aXZlIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tYmFja2dyb3VuZC1kYXJrKTsKICAgICAgICB9CgogICAgICAgIC8qIExvY2sgc3RhdHVzIG1lc3NhZ2UgKi8KICAgICAgICAubG9jay1tZXNzYWdlIHsKICAgICAgICAgICAgZGlzcGxheTogbm9uZTsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogIzIzMjgzNjsKICAgICAgICAgICAgY29sb3I6IHZhcigtLWFjY2VudC1yZWQpOwogICAgICAgICAgICBwYWRkaW5nOiAxMHB4OwogICAgICAgICAgICB0ZXh0LWFsaWduOiBjZW50ZXI7CiAgICAgICAgICAgIGJvcmRlcjogc29saWQ7CiAgICAgICAgICAgIGJvcmRlci1jb2xvcjogdmFyKC0tYWNjZW50LXJlZCk7CiAgICAgICAgICAgIGJvcmRlci1yYWRpdXM6IDRweDsKICAgICAgICAgICAgbWFyZ2luLXRvcDogMTBweDsKICAgICAgICAgICAgZm9udC13ZWlnaHQ6IGJvbGQ7CiAgICAgICAgICAgIG1heC13aWR0aDogMjYwcHg7CiAgICAgICAgICAgIHBvc2l0aW9uOiBhYnNvbHV0ZTsKICAgICAgICAgICAgYm90dG9tOiAzMHB4OwogICAgICAgIH0KCiAgICAgICAgLmxvY2stbWVzc2FnZS52aXNpYmxlIHsKICAgICAgICAgICAgZGlzcGxheTogYmxvY2s7CiAgICAgICAgfQoKICAgICAgICAvKiBJbmZvIEJ1dHRvbiAqLwogICAgICAgIC5pbmZvLWJ1dHRvbiB7CiAgICAgICAgICAgIHBvc2l0aW9uOiBmaXhlZDsKICAgICAgICAgICAgYm90dG9tOiAyMHB4OwogICAgICAgICAgICByaWdodDogMjBweDsKICAgICAgICAgICAgd2lkdGg6IDQwcHg7CiAgICAgICAgICAgIGhlaWdodDogNDBweDsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNTAlOwogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1idXR0b24tYmcpOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBib3JkZXI6IDJweCBzb2xpZCB2YXIoLS1hY2NlbnQtY3lhbik7CiAgICAgICAgICAgIGRpc3BsYXk6IGZsZXg7CiAgICAgICAgICAgIGFsaWduLWl0ZW1zOiBjZW50ZXI7CiAgICAgICAgICAgIGp1c3RpZnktY29udGVudDogY2VudGVyOwogICAgICAgICAgICBmb250LXNpemU6IDIwcHg7CiAgICAgICAgICAgIGZvbnQtd2VpZ2h0OiBib2xkOwogICAgICAgICAgICBjdXJzb3I6IHBvaW50ZXI7CiAgICAgICAgICAgIHotaW5kZXg6IDEwMDsKICAgICAgICAgICAgdHJhbnNpdGlvbjogYWxsIDAuMnMgZWFzZTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLmluZm8tYnV0dG9uOmhvdmVyIHsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogdmFyKC0tYWNjZW50LWN5YW4pOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tYmFja2dyb3VuZC1kYXJrKTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLyogTW9kYWwgUG9wdXAgKi8KICAgICAgICAubW9kYWwgewogICAgICAgICAgICBkaXNwbGF5OiBub25lOwogICAgICAgICAgICBwb3NpdGlvbjogZml4ZWQ7CiAgICAgICAgICAgIHRvcDogMDsKICAgICAgICAgICAgbGVmdDogMDsKICAgICAgICAgICAgd2lkdGg6IDEwMCU7CiAgICAgICAgICAgIGhlaWdodDogMTAwJTsKICAgICAgICAgICAgYmFja2dyb3VuZC1jb2xvcjogcmdiYSgwLCAwLCAwLCAwLjcpOwogICAgICAgICAgICB6LWluZGV4OiAxMDAwOwogICAgICAgICAgICBhbGlnbi1pdGVtczogY2VudGVyOwogICAgICAgICAgICBqdXN0aWZ5LWNvbnRlbnQ6IGNlbnRlcjsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLm1vZGFsLnZpc2libGUgewogICAgICAgICAgICBkaXNwbGF5OiBmbGV4OwogICAgICAgIH0KICAgICAgICAKICAgICAgICAubW9kYWwtY29udGVudCB7CiAgICAgICAgICAgIGJhY2tncm91bmQtY29sb3I6IHZhcigtLXBhbmVsLWJnKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogOHB4OwogICAgICAgICAgICBwYWRkaW5nOiAzMHB4OwogICAgICAgICAgICBtYXgtd2lkdGg6IDYwMHB4OwogICAgICAgICAgICB3aWR0aDogODAlOwogICAgICAgICAgICBwb3NpdGlvbjogcmVsYXRpdmU7CiAgICAgICAgICAgIGJveC1zaGFkb3c6IDAgNHB4IDIwcHggcmdiYSgwLCAwLCAwLCAwLjUpOwogICAgICAgIH0KICAgICAgICAKICAgICAgICAubW9kYWwtY2xvc2UgewogICAgICAgICAgICBwb3NpdGlvbjogYWJzb2x1dGU7CiAgICAgICAgICAgIHRvcDogMTBweDsKICAgICAgICAgICAgcmlnaHQ6IDE1cHg7CiAgICAgICAgICAgIGZvbnQtc2l6ZTogMjRweDsKICAgICAgICAgICAgY3Vyc29yOiBwb2ludGVyOwogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1zZWNvbmRhcnkpOwogICAgICAgIH0KICAgICAgICAKICAgICAgICAubW9kYWwtY2xvc2U6aG92ZXIgewogICAgICAgICAgICBjb2xvcjogdmFyKC0tdGV4dC1wcmltYXJ5KTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLm1vZGFsLXRpdGxlIHsKICAgICAgICAgICAgZm9udC1zaXplOiAxLjRlbTsKICAgICAgICAgICAgbWFyZ2luLWJvdHRvbTogMjBweDsKICAgICAgICAgICAgY29sb3I6IHZhcigtLWFjY2VudC1jeWFuKTsKICAgICAgICB9CiAgICAgICAgCiAgICAgICAgLm1vZGFsLXRleHQgewogICAgICAgICAgICBsaW5lLWhlaWdodDogMS42OwogICAgICAgICAgICB3aGl0ZS1zcGFjZTogcHJlLWxpbmU7CiAgICAgICAgfQogICAgICAgIAogICAgICAgIC8qIFNpbXVsYXRpb24gQmFubmVyICovCiAgICAgICAgLnNpbXVsYXRpb24tYmFubmVyIHsKICAgICAgICAgICAgcG9zaXRpb246IGZpeGVkOwogICAgICAgICAgICBib3R0b206IDA7CiAgICAgICAgICAgIGxlZnQ6IDA7CiAgICAgICAgICAgIHJpZ2h0OiAwOwogICAgICAgICAgICBiYWNrZ3JvdW5kLWNvbG9yOiB2YXIoLS1hY2NlbnQtcmVkKTsKICAgICAgICAgICAgY29sb3I6IHdoaXRlOwogICAgICAgICAgICB0ZXh0LWFsaWduOiBjZW50ZXI7CiAgICAgICAgICAgIHBhZGRpbmc6IDhweDsKICAgICAgICAgICAgZm9udC13ZWlnaHQ6IDUwMDsKICAgICAgICB9CgogICAgICAgIC8qIEhpZGRlbiBDbGFzcyAqLwogICAgICAgIC5oaWRkZW4gewogICAgICAgICAgICBkaXNwbGF5OiBub25lICFpbXBvcnRhbnQ7CiAgICAgICAgfQoKICAgICAgICAvKiBTY3JvbGxiYXIgU3R5bGluZyAqLwogICAgICAgIDo6LXdlYmtpdC1zY3JvbGxiYXIgewogICAgICAgICAgICB3aWR0aDogOHB4OwogICAgICAgIH0KCiAgICAgICAgOjotd2Via2l0LXNjcm9sbGJhci10cmFjayB7CiAgICAgICAgICAgIGJhY2tncm91bmQ6IHZhcigtLWJ1dHRvbi1iZyk7CiAgICAgICAgfQoKICAgICAgICA6Oi13ZWJraXQtc2Nyb2xsYmFyLXRodW1iIHsKICAgICAgICAgICAgYmFja2dyb3VuZDogdmFyKC0tYm9yZGVyLWNvbG9yKTsKICAgICAgICAgICAgYm9yZGVyLXJhZGl1czogNHB4OwogICAgICAgIH0KCiAgICAgICAgOjotd2Via2l0LXNjcm9sbGJhci10aHVtYjpob3ZlciB7CiAgICAgICAgICAgIGJhY2tncm91bmQ6IHZhcigtLXRleHQtc2Vjb25kYXJ5KTsKICAgICAgICB9CiAgICA8L3N0eWxlPgo8L2hlYWQ+Cjxib2R5PgogICAgPGRpdiBjbGFzcz0iY29udGFpbmVyIj4KICAgICAgICA8ZGl2IGNsYXNzPSJ0b3AtYmFyIj4KICAgICAgICAgICAgPGRpdiBjbGFzcz0ic3RhdHVzLWluZGljYXRvcnMiPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic3RhdHVzLWl0ZW0iPgogICAgICAgICAgICAgICAgICAgIDxzcGFuIGNsYXNzPSJzdGF0dXMtZG90IHtyb3V0ZXJfc3RhdHVzfSI+PC9zcGFuPgogICAgICAgICAgICAgICAgICAgIDxzcGFuIGNsYXNzPSJzdGF0dXMtbGFiZWwiPlJvdXRlciBDb25uZWN0aW9uIFN0YXR1czwvc3Bhbj4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0idGltZXN0YW1wIj57dGltZXN0YW1wfTwvZGl2PgogICAgICAgICAgICA8L2Rpdj4KICAgICAgICAgICAgPGRpdiBjbGFzcz0icm91dGVyLWNvbnRyb2xzIj4KICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9ImNvbnRyb2wtYnRuIiBkYXRhLXNvdXJjZT0iSEQtQkFSUyI+SEQgQkFSUzwvYnV0dG9uPgogICAgICAgICAgICA8L2Rpdj4KICAgICAgICA8L2Rpdj4KCiAgICAgICAgPGRpdiBjbGFzcz0ibWFpbi1jb250ZW50Ij4KICAgICAgICAgICAgPCEtLSBTb3VyY2UgQ2F0ZWdvcmllcyAtLT4KICAgICAgICAgICAgPGRpdiBjbGFzcz0iY2F0ZWdvcnktYnV0dG9ucyBzb3VyY2VzIj4KICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9ImNhdGVnb3J5LWJ0biBhY3RpdmUiIGRhdGEtY2F0ZWdvcnk9ImFsbCI+QWxsIFNvdXJjZXM8L2J1dHRvbj4KICAgICAgICAgICAgICAgIHtzb3VyY2VfY2F0ZWdvcmllc30KICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICA8IS0tIFNvdXJjZXMgUGFuZWwgLS0+CiAgICAgICAgICAgIDxkaXYgY2xhc3M9InBhbmVsIHNvdXJjZXMtcGFuZWwiPgogICAgICAgICAgICAgICAgPGgyPlNPVVJDRVM8L2gyPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic2VhcmNoLWNvbnRhaW5lciI+CiAgICAgICAgICAgICAgICAgICAgPGlucHV0IHR5cGU9InRleHQiIGlkPSJzb3VyY2Utc2VhcmNoIiBjbGFzcz0ic2VhcmNoLWlucHV0IiBwbGFjZWhvbGRlcj0iU2VhcmNoIHNvdXJjZXMuLi4iPgogICAgICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9ImNvdW50LWJhZGdlIiBpZD0ic291cmNlLWNvdW50Ij4wLzA8L2Rpdj4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0icGFuZWwtY29udGVudCIgaWQ9InNvdXJjZXMtZ3JpZCI+CiAgICAgICAgICAgICAgICAgICAge3NvdXJjZXN9CiAgICAgICAgICAgICAgICA8L2Rpdj4KICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICA8IS0tIFJvdXRlIENvbnRyb2wgUGFuZWwgLS0+CiAgICAgICAgICAgIDxkaXYgY2xhc3M9InJvdXRlLWNvbnRyb2wtcGFuZWwiPgogICAgICAgICAgICAgICAgPGRpdiBpZD0ic2VsZWN0ZWQtc291cmNlIiBjbGFzcz0ic2VsZWN0aW9uLWRpc3BsYXkiPgogICAgICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9InNlbGVjdGlvbi1sYWJlbCI+U09VUkNFPC9kaXY+CiAgICAgICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ic2VsZWN0aW9uLXZhbHVlIj48L2Rpdj4KICAgICAgICAgICAgICAgIDwvZGl2PgoKICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9InRha2UtYnV0dG9uLWNvbnRhaW5lciI+CiAgICAgICAgICAgICAgICAgICAgPGJ1dHRvbiBjbGFzcz0idGFrZS1idXR0b24iPlRBS0U8L2J1dHRvbj4KICAgICAgICAgICAgICAgIDwvZGl2PgoKICAgICAgICAgICAgICAgIDxkaXYgaWQ9InNlbGVjdGVkLWRlc3RpbmF0aW9uIiBjbGFzcz0ic2VsZWN0aW9uLWRpc3BsYXkiPgogICAgICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9InNlbGVjdGlvbi1sYWJlbCI+REVTVElOQVRJT048L2Rpdj4KICAgICAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJzZWxlY3Rpb24tdmFsdWUiPjwvZGl2PgogICAgICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICAgICAgPGRpdiBpZD0ibG9jay1tZXNzYWdlIiBjbGFzcz0ibG9jay1tZXNzYWdlIj4KICAgICAgICAgICAgICAgICAgICBEZXN0aW5hdGlvbiBpcyBsb2NrZWQsIGNvbnRhY3QgRW5naW5lZXJpbmcKICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICA8L2Rpdj4KCiAgICAgICAgICAgIDwhLS0gRGVzdGluYXRpb25zIFBhbmVsIC0tPgogICAgICAgICAgICA8ZGl2IGNsYXNzPSJwYW5lbCBkZXN0aW5hdGlvbnMtcGFuZWwiPgogICAgICAgICAgICAgICAgPGgyPkRFU1RJTkFUSU9OUzwvaDI+CiAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJzZWFyY2gtY29udGFpbmVyIj4KICAgICAgICAgICAgICAgICAgICA8aW5wdXQgdHlwZT0idGV4dCIgaWQ9ImRlc3RpbmF0aW9uLXNlYXJjaCIgY2xhc3M9InNlYXJjaC1pbnB1dCIgcGxhY2Vob2xkZXI9IlNlYXJjaCBkZXN0aW5hdGlvbnMuLi4iPgogICAgICAgICAgICAgICAgICAgIDxkaXYgY2xhc3M9ImNvdW50LWJhZGdlIiBpZD0iZGVzdGluYXRpb24tY291bnQiPjAvMDwvZGl2PgogICAgICAgICAgICAgICAgPC9kaXY+CiAgICAgICAgICAgICAgICA8ZGl2IGNsYXNzPSJwYW5lbC1jb250ZW50IiBpZD0iZGVzdGluYXRpb25zLWdyaWQiPgogICAgICAgICAgICAgICAgICAgIHtkZXN0aW5hdGlvbnN9CiAgICAgICAgICAgICAgICA8L2Rpdj4KICAgICAgICAgICAgPC9kaXY+CgogICAgICAgICAgICA8IS0tIERlc3RpbmF0aW9uIENhdGVnb3JpZXMgLS0+CiAgICAgICAgICAgIDxkaXYgY2xhc3M9ImNhdGVnb3J5LWJ1dHRvbnMgZGVzdGluYXRpb25zIj4KICAgICAgICAgICAgICAgIDxidXR0b24gY2xhc3M9ImNhdGVnb3J5LWJ0biBhY3RpdmUiIGRhdGEtY2F0ZWdvcnk9ImFsbCI+QWxsIERlc3RpbmF0aW9uczwvYnV0dG9uPgogICAgICAgICAgICAgICAge2Rlc3RpbmF0aW9uX2NhdGVnb3JpZXN9CiAgICAgICAgICAgIDwvZGl2PgogICAgICAgIDwvZGl2PgoKICAgICAgICB7c2ltdWxhdGlvbl9iYW5uZXJ9CiAgICAgICAgCiAgICAgICAgPCEtLSBJbmZvIEJ1dHRvbiAtLT4KICAgICAgICA8YnV0dG9uIGNsYXNzPSJpbmZvLWJ1dHRvbiI+aTwvYnV0dG9uPgogICAgICAgIAogICAgICAgIDwhLS0gSW5mbyBNb2RhbCAtLT4KICAgICAgICA8ZGl2IGlkPSJpbmZvLW1vZGFsIiBjbGFzcz0ibW9kYWwiPgogICAgICAgICAgICA8ZGl2IGNsYXNzPSJtb2RhbC1jb250ZW50Ij4KICAgICAgICAgICAgICAgIDxzcGFuIGNsYXNzPSJtb2RhbC1jbG9zZSI+JnRpbWVzOzwvc3Bhbj4KICAgICAgICAgICAgICAgIDxoMyBjbGFzcz0ibW9kYWwtdGl0bGUiPkhhcnJpcyBMUkMgQ29udHJvbCBJbnRlcmZhY2U8L2gzPgogICAgICAgICAgICAgICAgPGRpdiBjbGFzcz0ibW9kYWwtdGV4dCI+CiAgICAgICAgICAgICAgICAgICAgQSB3ZWItYmFzZWQgY29udHJvbCBpbnRlcmZhY2UgZm9yIEhhcnJpcyBMUkMgc3lzdGVtcy4gVGhpcyBhcHBsaWNhdGlvbiBwcm92aWRlcyB3ZWIgaW50ZXJmYWNlIGZvciBtYW5hZ2luZyB2aWRlbyByb3V0aW5nLCBtb25pdG9yaW5nIHJvdXRlciBzdGF0dXMsIGFuZCBjb250cm9sbGluZyBkZXN0aW5hdGlvbiBsb2NrcyBvbiBIYXJyaXMgTFJDIHJvdXRlcnMuCgogICAgICAgICAgICAgICAgICAgIFBhcnQgb2YgU0JDUy4KICAgICAgICAgICAgICAgICAgICAyMDI1IEJlbiBDb3N0ZXJ0b24gLSBodHRwczovL2dpdGh1Yi5jb20vQmVuY29zdGVydG9uLwoKICAgICAgICAgICAgICAgICAgICBUaGlzIHNvZnR3YXJlIGlzIHByb3ZpZGVkIGFzLWlzIGZvciBjb250cm9sbGluZyBIYXJyaXMgTFJDIHJvdXRlciBzeXN0ZW1zLiBQbGVhc2UgZW5zdXJlIGNvbXBsaWFuY2Ugd2l0aCB5b3VyIG9yZ2FuaXphdGlvbidzIG5ldHdvcmsgYW5kIGVxdWlwbWVudCBwb2xpY2llcyBiZWZvcmUgZGVwbG95bWVudC4KICAgICAgICAgICAgICAgIDwvZGl2PgogICAgICAgICAgICA8L2Rpdj4KICAgICAgICA8L2Rpdj4KICAgIDwvZGl2PgoKICAgIDxzY3JpcHQ+CiAgICAgICAgLy8gRW1iZWRkZWQgSmF2YVNjcmlwdAogICAgICAgIGRvY3VtZW50LmFkZEV2ZW50TGlzdGVuZXIoJ0RPTUNvbnRlbnRMb2FkZWQnLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgbGV0IHNlbGVjdGVkU291cmNlID0gbnVsbDsKICAgICAgICAgICAgbGV0IHNlbGVjdGVkRGVzdGluYXRpb24gPSBudWxsOwoKICAgICAgICAgICAgLy8gR2V0IHRoZSB0aW1lCiAgICAgICAgICAgIGZ1bmN0aW9uIHVwZGF0ZVRpbWVzdGFtcCgpIHsKICAgICAgICAgICAgICAgIGNvbnN0IHRpbWVzdGFtcEVsZW1lbnQgPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcudGltZXN0YW1wJyk7CiAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgIGZ1bmN0aW9uIHVwZGF0ZSgpIHsKICAgICAgICAgICAgICAgICAgICBjb25zdCBub3cgPSBuZXcgRGF0ZSgpOwogICAgICAgICAgICAgICAgICAgIGNvbnN0IGZvcm1hdHRlZERhdGUgPSBub3cudG9Mb2NhbGVEYXRlU3RyaW5nKCdlbi1HQicpOwogICAgICAgICAgICAgICAgICAgIGNvbnN0IGZvcm1hdHRlZFRpbWUgPSBub3cudG9Mb2NhbGVUaW1lU3RyaW5nKCdlbi1HQicsIHsgCiAgICAgICAgICAgICAgICAgICAgICAgIGhvdXI6ICcyLWRpZ2l0JywgCiAgICAgICAgICAgICAgICAgICAgICAgIG1pbnV0ZTogJzItZGlnaXQnLAogICAgICAgICAgICAgICAgICAgICAgICBzZWNvbmQ6ICcyLWRpZ2l0JwogICAgICAgICAgICAgICAgICAgIH0pOwogICAgICAgICAgICAgICAgICAgIHRpbWVzdGFtcEVsZW1lbnQudGV4dENvbnRlbnQgPSBgJHtmb3JtYXR0ZWREYXRlfSAke2Zvcm1hdHRlZFRpbWV9YDsKICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgCiAgICAgICAgICAgICAgICB1cGRhdGUoKTsKICAgICAgICAgICAgICAgIHNldEludGVydmFsKHVwZGF0ZSwgMTAwMCk7CiAgICAgICAgICAgIH0KCiAgICAgICAgICAgIC8vIFNlYXJjaCBmdW5jdGlvbmFsaXR5CiAgICAgICAgICAgIGZ1bmN0aW9uIHNldHVwU2VhcmNoKHNlYXJjaElkLCBidXR0b25DbGFzcywgY291bnRJZCkgewogICAgICAgICAgICAgICAgY29uc3Qgc2VhcmNoSW5wdXQgPSBkb2N1bWVudC5nZXRFbGVtZW50QnlJZChzZWFyY2hJZCk7CiAgICAgICAgICAgICAgICBjb25zdCBjb3VudERpc3BsYXkgPSBkb2N1bWVudC5nZXRFbGVtZW50QnlJZChjb3VudElkKTsKICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgZnVuY3Rpb24gdXBkYXRlQ291bnQoKSB7CiAgICAgICAgICAgICAgICAgICAgY29uc3QgdG90YWxCdXR0b25zID0gZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbChgLiR7YnV0dG9uQ2xhc3N9YCkubGVuZ3RoOwogICAgICAgICAgICAgICAgICAgIGNvbnN0IHZpc2libGVCdXR0b25zID0gZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbChgLiR7YnV0dG9uQ2xhc3N9Om5vdCguaGlkZGVuKWApLmxlbmd0aDsKICAgICAgICAgICAgICAgICAgICBjb3VudERpc3BsYXkudGV4dENvbnRlbnQgPSBgJHt2aXNpYmxlQnV0dG9uc30vJHt0b3RhbEJ1dHRvbnN9YDsKICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgdXBkYXRlQ291bnQoKTsKICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgc2VhcmNoSW5wdXQuYWRkRXZlbnRMaXN0ZW5lcignaW5wdXQnLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgICAgICBjb25zdCBzZWFyY2hUZXJtID0gdGhpcy52YWx1ZS50b0xvd2VyQ2FzZSgpOwogICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoYC4ke2J1dHRvbkNsYXNzfWApLmZvckVhY2goYnRuID0+IHsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc3QgdGV4dCA9IGJ0bi50ZXh0Q29udGVudC50b0xvd2VyQ2FzZSgpOwogICAgICAgICAgICAgICAgICAgICAgICBjb25zdCBpc1Zpc2libGUgPSB0ZXh0LmluY2x1ZGVzKHNlYXJjaFRlcm0pOwogICAgICAgICAgICAgICAgICAgICAgICBidG4uY2xhc3NMaXN0LnRvZ2dsZSgnaGlkZGVuJywgIWlzVmlzaWJsZSk7CiAgICAgICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgdXBkYXRlQ291bnQoKTsKICAgICAgICAgICAgICAgIH0pOwoKICAgICAgICAgICAgICAgIC8vIENsZWFyIHNlYXJjaAogICAgICAgICAgICAgICAgZnVuY3Rpb24gY2xlYXJTZWFyY2goKSB7CiAgICAgICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbChgLiR7YnV0dG9uQ2xhc3N9YCkuZm9yRWFjaChidG4gPT4gewogICAgICAgICAgICAgICAgICAgICAgICBidG4uY2xhc3NMaXN0LnJlbW92ZSgnaGlkZGVuJyk7CiAgICAgICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgICAgICAgICAgdXBkYXRlQ291bnQoKTsKICAgICAgICAgICAgICAgIH0KCiAgICAgICAgICAgICAgICBzZWFyY2hJbnB1dC5hZGRFdmVudExpc3RlbmVyKCdzZWFyY2gnLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgICAgICBpZiAodGhpcy52YWx1ZSA9PT0gJycpIHsKICAgICAgICAgICAgICAgICAgICAgICAgY2xlYXJTZWFyY2goKTsKICAgICAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICB9KTsKCiAgICAgICAgICAgICAgICBzZWFyY2hJbnB1dC5hZGRFdmVudExpc3RlbmVyKCdrZXlkb3duJywgZnVuY3Rpb24oZSkgewogICAgICAgICAgICAgICAgICAgIGlmIChlLmtleSA9PT0gJ0VzY2FwZScpIHsKICAgICAgICAgICAgICAgICAgICAgICAgdGhpcy52YWx1ZSA9ICcnOwogICAgICAgICAgICAgICAgICAgICAgICBjbGVhclNlYXJjaCgpOwogICAgICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgICAgIH0pOwogICAgICAgICAgICB9CgogICAgICAgICAgICAvLyBDYXRlZ29yeSBmdW5jdGlvbmFsaXR5CiAgICAgICAgICAgIGZ1bmN0aW9uIGluaXRpYWxpemVDYXRlZ29yaWVzKCkgewogICAgICAgICAgICAgICAgLy8gU291cmNlIGNhdGVnb3JpZXMKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5jYXRlZ29yeS1idXR0b25zLnNvdXJjZXMgLmNhdGVnb3J5LWJ0bicpLmZvckVhY2goYnRuID0+IHsKICAgICAgICAgICAgICAgICAgICBidG4uYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc3QgY2F0ZWdvcnkgPSB0aGlzLmRhdGFzZXQuY2F0ZWdvcnk7CiAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAvLyBUb2dnbGUgYWN0aXZlIHN0YXRlCiAgICAgICAgICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5jYXRlZ29yeS1idXR0b25zLnNvdXJjZXMgLmNhdGVnb3J5LWJ0bicpLmZvckVhY2goYiA9PiAKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGIuY2xhc3NMaXN0LnJlbW92ZSgnYWN0aXZlJykpOwogICAgICAgICAgICAgICAgICAgICAgICB0aGlzLmNsYXNzTGlzdC5hZGQoJ2FjdGl2ZScpOwogICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgLy8gRmlsdGVyIHNvdXJjZXMKICAgICAgICAgICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbCgnLnNvdXJjZS1idG4nKS5mb3JFYWNoKHNvdXJjZUJ0biA9PiB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBpZiAoY2F0ZWdvcnkgPT09ICdhbGwnIHx8IHNvdXJjZUJ0bi5kYXRhc2V0LmNhdGVnb3JpZXMuaW5jbHVkZXMoY2F0ZWdvcnkpKSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgc291cmNlQnRuLmNsYXNzTGlzdC5yZW1vdmUoJ2hpZGRlbicpOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgfSBlbHNlIHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICBzb3VyY2VCdG4uY2xhc3NMaXN0LmFkZCgnaGlkZGVuJyk7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICAgICAgICAgIH0pOwogICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgY29uc3QgY291bnREaXNwbGF5ID0gZG9jdW1lbnQuZ2V0RWxlbWVudEJ5SWQoJ3NvdXJjZS1jb3VudCcpOwogICAgICAgICAgICAgICAgICAgICAgICBjb25zdCB0b3RhbEJ1dHRvbnMgPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuc291cmNlLWJ0bicpLmxlbmd0aDsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc3QgdmlzaWJsZUJ1dHRvbnMgPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuc291cmNlLWJ0bjpub3QoLmhpZGRlbiknKS5sZW5ndGg7CiAgICAgICAgICAgICAgICAgICAgICAgIGNvdW50RGlzcGxheS50ZXh0Q29udGVudCA9IGAke3Zpc2libGVCdXR0b25zfS8ke3RvdGFsQnV0dG9uc31gOwogICAgICAgICAgICAgICAgICAgIH0pOwogICAgICAgICAgICAgICAgfSk7CgogICAgICAgICAgICAgICAgLy8gRGVzdGluYXRpb24gY2F0ZWdvcmllcwogICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbCgnLmNhdGVnb3J5LWJ1dHRvbnMuZGVzdGluYXRpb25zIC5jYXRlZ29yeS1idG4nKS5mb3JFYWNoKGJ0biA9PiB7CiAgICAgICAgICAgICAgICAgICAgYnRuLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICAgICAgICAgIGNvbnN0IGNhdGVnb3J5ID0gdGhpcy5kYXRhc2V0LmNhdGVnb3J5OwogICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgLy8gVG9nZ2xlIGFjdGl2ZSBzdGF0ZQogICAgICAgICAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuY2F0ZWdvcnktYnV0dG9ucy5kZXN0aW5hdGlvbnMgLmNhdGVnb3J5LWJ0bicpLmZvckVhY2goYiA9PiAKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGIuY2xhc3NMaXN0LnJlbW92ZSgnYWN0aXZlJykpOwogICAgICAgICAgICAgICAgICAgICAgICB0aGlzLmNsYXNzTGlzdC5hZGQoJ2FjdGl2ZScpOwogICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgLy8gRmlsdGVyIGRlc3RpbmF0aW9ucwogICAgICAgICAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuZGVzdGluYXRpb24tYnRuJykuZm9yRWFjaChkZXN0QnRuID0+IHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIGlmIChjYXRlZ29yeSA9PT0gJ2FsbCcgfHwgZGVzdEJ0bi5kYXRhc2V0LmNhdGVnb3JpZXMuaW5jbHVkZXMoY2F0ZWdvcnkpKSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgZGVzdEJ0bi5jbGFzc0xpc3QucmVtb3ZlKCdoaWRkZW4nKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIH0gZWxzZSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgZGVzdEJ0bi5jbGFzc0xpc3QuYWRkKCdoaWRkZW4nKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICBjb25zdCBjb3VudERpc3BsYXkgPSBkb2N1bWVudC5nZXRFbGVtZW50QnlJZCgnZGVzdGluYXRpb24tY291bnQnKTsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc3QgdG90YWxCdXR0b25zID0gZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbCgnLmRlc3RpbmF0aW9uLWJ0bicpLmxlbmd0aDsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc3QgdmlzaWJsZUJ1dHRvbnMgPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuZGVzdGluYXRpb24tYnRuOm5vdCguaGlkZGVuKScpLmxlbmd0aDsKICAgICAgICAgICAgICAgICAgICAgICAgY291bnREaXNwbGF5LnRleHRDb250ZW50ID0gYCR7dmlzaWJsZUJ1dHRvbnN9LyR7dG90YWxCdXR0b25zfWA7CiAgICAgICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgICAgICB9KTsKICAgICAgICAgICAgfQoKICAgICAgICAgICAgLy8gUm91dGVyIHN0YXR1cyBmdW5jdGlvbmFsaXR5CiAgICAgICAgICAgIGZ1bmN0aW9uIHVwZGF0ZURlc3RpbmF0aW9uU3RhdHVzKGRlc3RpbmF0aW9uKSB7CiAgICAgICAgICAgICAgICBjb25zdCBidG4gPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKGAuZGVzdGluYXRpb24tYnRuW2RhdGEtZGVzdGluYXRpb249IiR7ZGVzdGluYXRpb259Il1gKTsKICAgICAgICAgICAgICAgIGlmICghYnRuKSByZXR1cm47CgogICAgICAgICAgICAgICAgZmV0Y2goYC9zdGF0dXMvJHtkZXN0aW5hdGlvbn1gKQogICAgICAgICAgICAgICAgICAgIC50aGVuKHJlc3BvbnNlID0+IHJlc3BvbnNlLmpzb24oKSkKICAgICAgICAgICAgICAgICAgICAudGhlbihkYXRhID0+IHsKICAgICAgICAgICAgICAgICAgICAgICAgaWYgKHNlbGVjdGVkRGVzdGluYXRpb24gPT09IGRlc3RpbmF0aW9uICYmIGRhdGEuc291cmNlKSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBjb25zdCBzb3VyY2VCdG4gPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKGAuc291cmNlLWJ0bltkYXRhLXNvdXJjZT0iJHtkYXRhLnNvdXJjZX0iXWApOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgaWYgKGRhdGEuc291cmNlID09PSAnSEQtQkFSUycpIHsKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICBzZWxlY3RTb3VyY2UoJ0hELUJBUlMnLCBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcuY29udHJvbC1idG5bZGF0YS1zb3VyY2U9IkhELUJBUlMiXScpKTsKICAgICAgICAgICAgICAgICAgICAgICAgICAgIH0gZWxzZSBpZiAoc291cmNlQnRuKSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgc2VsZWN0U291cmNlKGRhdGEuc291cmNlLCBzb3VyY2VCdG4pOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgfQogICAgICAgICAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICAgICAgfSkKICAgICAgICAgICAgICAgICAgICAuY2F0Y2goZXJyb3IgPT4gewogICAgICAgICAgICAgICAgICAgICAgICBjb25zb2xlLmVycm9yKCdFcnJvciBnZXR0aW5nIHN0YXR1czonLCBlcnJvcik7CiAgICAgICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgIH0KCiAgICAgICAgICAgIC8vIFNlbGVjdGlvbiBmdW5jdGlvbmFsaXR5CiAgICAgICAgICAgIGZ1bmN0aW9uIHNlbGVjdFNvdXJjZShzb3VyY2UsIGJ1dHRvbkVsZW1lbnQpIHsKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5zb3VyY2UtYnRuLCAuY29udHJvbC1idG4nKS5mb3JFYWNoKGIgPT4gYi5jbGFzc0xpc3QucmVtb3ZlKCdzZWxlY3RlZCcpKTsKICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgaWYgKGJ1dHRvbkVsZW1lbnQpIHsKICAgICAgICAgICAgICAgICAgICBidXR0b25FbGVtZW50LmNsYXNzTGlzdC5hZGQoJ3NlbGVjdGVkJyk7CiAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgIHNlbGVjdGVkU291cmNlID0gc291cmNlOwogICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvcignI3NlbGVjdGVkLXNvdXJjZSAuc2VsZWN0aW9uLXZhbHVlJykudGV4dENvbnRlbnQgPSBzb3VyY2U7CiAgICAgICAgICAgICAgICB1cGRhdGVUYWtlQnV0dG9uKCk7CiAgICAgICAgICAgIH0KCiAgICAgICAgICAgIGZ1bmN0aW9uIHJlc2V0U2VsZWN0aW9ucygpIHsKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5zb3VyY2UtYnRuLCAuY29udHJvbC1idG4nKS5mb3JFYWNoKGJ0biA9PiBidG4uY2xhc3NMaXN0LnJlbW92ZSgnc2VsZWN0ZWQnKSk7CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuZGVzdGluYXRpb24tYnRuJykuZm9yRWFjaChidG4gPT4gYnRuLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvcignI3NlbGVjdGVkLXNvdXJjZSAuc2VsZWN0aW9uLXZhbHVlJykudGV4dENvbnRlbnQgPSAnJzsKICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJyNzZWxlY3RlZC1kZXN0aW5hdGlvbiAuc2VsZWN0aW9uLXZhbHVlJykudGV4dENvbnRlbnQgPSAnJzsKICAgICAgICAgICAgICAgIGRvY3VtZW50LmdldEVsZW1lbnRCeUlkKCdsb2NrLW1lc3NhZ2UnKS5jbGFzc0xpc3QucmVtb3ZlKCd2aXNpYmxlJyk7CiAgICAgICAgICAgICAgICBzZWxlY3RlZFNvdXJjZSA9IG51bGw7CiAgICAgICAgICAgICAgICBzZWxlY3RlZERlc3RpbmF0aW9uID0gbnVsbDsKICAgICAgICAgICAgICAgIHVwZGF0ZVRha2VCdXR0b24oKTsKICAgICAgICAgICAgfQoKICAgICAgICAgICAgZnVuY3Rpb24gdXBkYXRlVGFrZUJ1dHRvbigpIHsKICAgICAgICAgICAgICAgIGNvbnN0IHRha2VCdXR0b24gPSBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcudGFrZS1idXR0b24nKTsKICAgICAgICAgICAgICAgIGlmIChzZWxlY3RlZFNvdXJjZSAmJiBzZWxlY3RlZERlc3RpbmF0aW9uKSB7CiAgICAgICAgICAgICAgICAgICAgdGFrZUJ1dHRvbi5jbGFzc0xpc3QuYWRkKCdhY3RpdmUnKTsKICAgICAgICAgICAgICAgIH0gZWxzZSB7CiAgICAgICAgICAgICAgICAgICAgdGFrZUJ1dHRvbi5jbGFzc0xpc3QucmVtb3ZlKCdhY3RpdmUnKTsKICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgfQoKICAgICAgICAgICAgLy8gRXZlbnQgTGlzdGVuZXJzCiAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5zb3VyY2UtYnRuJykuZm9yRWFjaChidG4gPT4gewogICAgICAgICAgICAgICAgYnRuLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICAgICAgc2VsZWN0U291cmNlKHRoaXMuZGF0YXNldC5zb3VyY2UsIHRoaXMpOwogICAgICAgICAgICAgICAgfSk7CiAgICAgICAgICAgIH0pOwogICAgICAgICAgICAKICAgICAgICAgICAgZG9jdW1lbnQucXVlcnlTZWxlY3RvckFsbCgnLmRlc3RpbmF0aW9uLWJ0bicpLmZvckVhY2goYnRuID0+IHsKICAgICAgICAgICAgICAgIGJ0bi5hZGRFdmVudExpc3RlbmVyKCdjbGljaycsIGZ1bmN0aW9uKCkgewogICAgICAgICAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5kZXN0aW5hdGlvbi1idG4nKS5mb3JFYWNoKGIgPT4gYi5jbGFzc0xpc3QucmVtb3ZlKCdzZWxlY3RlZCcpKTsKICAgICAgICAgICAgICAgICAgICB0aGlzLmNsYXNzTGlzdC5hZGQoJ3NlbGVjdGVkJyk7CiAgICAgICAgICAgICAgICAgICAgc2VsZWN0ZWREZXN0aW5hdGlvbiA9IHRoaXMuZGF0YXNldC5kZXN0aW5hdGlvbjsKICAgICAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yKCcjc2VsZWN0ZWQtZGVzdGluYXRpb24gLnNlbGVjdGlvbi12YWx1ZScpLnRleHRDb250ZW50ID0gc2VsZWN0ZWREZXN0aW5hdGlvbjsKICAgICAgICAgICAgICAgICAgICB1cGRhdGVUYWtlQnV0dG9uKCk7CiAgICAgICAgICAgICAgICAgICAgdXBkYXRlRGVzdGluYXRpb25TdGF0dXMoc2VsZWN0ZWREZXN0aW5hdGlvbik7CiAgICAgICAgICAgICAgICB9KTsKICAgICAgICAgICAgfSk7CgogICAgICAgICAgICBkb2N1bWVudC5nZXRFbGVtZW50QnlJZCgnc2VsZWN0ZWQtc291cmNlJykuYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbigpIHsKICAgICAgICAgICAgICAgIHNlbGVjdGVkU291cmNlID0gbnVsbDsKICAgICAgICAgICAgICAgIHRoaXMucXVlcnlTZWxlY3RvcignLnNlbGVjdGlvbi12YWx1ZScpLnRleHRDb250ZW50ID0gJyc7CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuc291cmNlLWJ0biwgLmNvbnRyb2wtYnRuJykuZm9yRWFjaChidG4gPT4gYnRuLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgdXBkYXRlVGFrZUJ1dHRvbigpOwogICAgICAgICAgICB9KTsKCiAgICAgICAgICAgIGRvY3VtZW50LmdldEVsZW1lbnRCeUlkKCdzZWxlY3RlZC1kZXN0aW5hdGlvbicpLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICBzZWxlY3RlZERlc3RpbmF0aW9uID0gbnVsbDsKICAgICAgICAgICAgICAgIHRoaXMucXVlcnlTZWxlY3RvcignLnNlbGVjdGlvbi12YWx1ZScpLnRleHRDb250ZW50ID0gJyc7CiAgICAgICAgICAgICAgICBkb2N1bWVudC5xdWVyeVNlbGVjdG9yQWxsKCcuZGVzdGluYXRpb24tYnRuJykuZm9yRWFjaChidG4gPT4gYnRuLmNsYXNzTGlzdC5yZW1vdmUoJ3NlbGVjdGVkJykpOwogICAgICAgICAgICAgICAgdXBkYXRlVGFrZUJ1dHRvbigpOwogICAgICAgICAgICAgICAgbG9ja01lc3NhZ2UgPSBkb2N1bWVudC5nZXRFbGVtZW50QnlJZCgnbG9jay1tZXNzYWdlJykuY2xhc3NMaXN0LnJlbW92ZSgndmlzaWJsZScpOwogICAgICAgICAgICB9KTsKCiAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3IoJy50YWtlLWJ1dHRvbicpLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICBpZiAoc2VsZWN0ZWRTb3VyY2UgJiYgc2VsZWN0ZWREZXN0aW5hdGlvbikgewogICAgICAgICAgICAgICAgICAgIGZldGNoKCcvcm91dGUnLCB7CiAgICAgICAgICAgICAgICAgICAgICAgIG1ldGhvZDogJ1BPU1QnLAogICAgICAgICAgICAgICAgICAgICAgICBoZWFkZXJzOiB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAnQ29udGVudC1UeXBlJzogJ2FwcGxpY2F0aW9uL2pzb24nLAogICAgICAgICAgICAgICAgICAgICAgICB9LAogICAgICAgICAgICAgICAgICAgICAgICBib2R5OiBKU09OLnN0cmluZ2lmeSh7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBzb3VyY2U6IHNlbGVjdGVkU291cmNlLAogICAgICAgICAgICAgICAgICAgICAgICAgICAgZGVzdGluYXRpb246IHNlbGVjdGVkRGVzdGluYXRpb24KICAgICAgICAgICAgICAgICAgICAgICAgfSkKICAgICAgICAgICAgICAgICAgICB9KQogICAgICAgICAgICAgICAgICAgIC50aGVuKHJlc3BvbnNlID0+IHJlc3BvbnNlLmpzb24oKSkKICAgICAgICAgICAgICAgICAgICAudGhlbihkYXRhID0+IHsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc29sZS5sb2coJ1JvdXRlIHJlc3BvbnNlOicsIGRhdGEpOwogICAgICAgICAgICAgICAgICAgICAgICBjb25zdCBsb2NrTWVzc2FnZSA9IGRvY3VtZW50LmdldEVsZW1lbnRCeUlkKCdsb2NrLW1lc3NhZ2UnKTsKICAgICAgICAgICAgICAgICAgICAgICAgY29uc29sZS5sb2coJ0xvY2sgbWVzc2FnZSBlbGVtZW50OicsIGxvY2tNZXNzYWdlKTsKICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgIGlmIChkYXRhLmxvY2tlZCkgewogICAgICAgICAgICAgICAgICAgICAgICAgICAgY29uc29sZS5sb2coJ1Nob3dpbmcgbG9jayBtZXNzYWdlJyk7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBsb2NrTWVzc2FnZS5jbGFzc0xpc3QuYWRkKCd2aXNpYmxlJyk7CiAgICAgICAgICAgICAgICAgICAgICAgIH0gZWxzZSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICBjb25zb2xlLmxvZygnSGlkaW5nIGxvY2sgbWVzc2FnZScpOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgbG9ja01lc3NhZ2UuY2xhc3NMaXN0LnJlbW92ZSgndmlzaWJsZScpOwogICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICBpZiAoZGF0YS5zdWNjZXNzKSB7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgcmVzZXRTZWxlY3Rpb25zKCk7CiAgICAgICAgICAgICAgICAgICAgICAgICAgICB9CiAgICAgICAgICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgICAgICAgICB9KQogICAgICAgICAgICAgICAgfQogICAgICAgICAgICB9KTsKCiAgICAgICAgICAgIGRvY3VtZW50LnF1ZXJ5U2VsZWN0b3JBbGwoJy5jb250cm9sLWJ0bicpLmZvckVhY2goYnRuID0+IHsKICAgICAgICAgICAgICAgIGJ0bi5hZGRFdmVudExpc3RlbmVyKCdjbGljaycsIGZ1bmN0aW9uKCkgewogICAgICAgICAgICAgICAgICAgIHNlbGVjdFNvdXJjZSh0aGlzLmRhdGFzZXQuc291cmNlLCB0aGlzKTsKICAgICAgICAgICAgICAgIH0pOwogICAgICAgICAgICB9KTsKCiAgICAgICAgICAgIC8vIEluaXRpYWxpemUgYWxsIGNvbXBvbmVudHMKICAgICAgICAgICAgLy8gSW5mbyBidXR0b24gZnVuY3Rpb25hbGl0eQogICAgICAgICAgICBjb25zdCBpbmZvQnV0dG9uID0gZG9jdW1lbnQucXVlcnlTZWxlY3RvcignLmluZm8tYnV0dG9uJyk7CiAgICAgICAgICAgIGNvbnN0IGluZm9Nb2RhbCA9IGRvY3VtZW50LmdldEVsZW1lbnRCeUlkKCdpbmZvLW1vZGFsJyk7CiAgICAgICAgICAgIGNvbnN0IGNsb3NlQnV0dG9uID0gZG9jdW1lbnQucXVlcnlTZWxlY3RvcignLm1vZGFsLWNsb3NlJyk7CiAgICAgICAgICAgIAogICAgICAgICAgICBpbmZvQnV0dG9uLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICBpbmZvTW9kYWwuY2xhc3NMaXN0LmFkZCgndmlzaWJsZScpOwogICAgICAgICAgICB9KTsKICAgICAgICAgICAgCiAgICAgICAgICAgIGNsb3NlQnV0dG9uLmFkZEV2ZW50TGlzdGVuZXIoJ2NsaWNrJywgZnVuY3Rpb24oKSB7CiAgICAgICAgICAgICAgICBpbmZvTW9kYWwuY2xhc3NMaXN0LnJlbW92ZSgndmlzaWJsZScpOwogICAgICAgICAgICB9KTsKICAgICAgICAgICAgCiAgICAgICAgICAgIC8vIENsb3NlIG1vZGFsIHdoZW4gY2xpY2tpbmcgb3V0c2lkZSBvZiBpdAogICAgICAgICAgICB3aW5kb3cuYWRkRXZlbnRMaXN0ZW5lcignY2xpY2snLCBmdW5jdGlvbihldmVudCkgewogICAgICAgICAgICAgICAgaWYgKGV2ZW50LnRhcmdldCA9PT0gaW5mb01vZGFsKSB7CiAgICAgICAgICAgICAgICAgICAgaW5mb01vZGFsLmNsYXNzTGlzdC5yZW1vdmUoJ3Zpc2libGUnKTsKICAgICAgICAgICAgICAgIH0KICAgICAgICAgICAgfSk7CiAgICAgICAgICAgIAogICAgICAgICAgICB1cGRhdGVUaW1lc3RhbXAoKTsKICAgICAgICAgICAgc2V0dXBTZWFyY2goJ3NvdXJjZS1zZWFyY2gnLCAnc291cmNlLWJ0bicsICdzb3VyY2UtY291bnQnKTsKICAgICAgICAgICAgc2V0dXBTZWFyY2goJ2Rlc3RpbmF0aW9uLXNlYXJjaCcsICdkZXN0aW5hdGlvbi1idG4nLCAnZGVzdGluYXRpb24tY291bnQnKTsKICAgICAgICAgICAgaW5pdGlhbGl6ZUNhdGVnb3JpZXMoKTsKICAgICAgICB9KTsKICAgIDwvc2NyaXB0Pgo8L2JvZHk+CjwvaHRtbD4="""
 
 def load_ui_template():
     global HTML_TEMPLATE
     HTML_TEMPLATE = base64.b64decode(HTML_TEMPLATE_B64).decode('utf-8')
 
 # Global variables
-router = None
+frames = {}
 simulation_mode = False
 SOURCES = {
     
@@ -238,20 +1974,33 @@ DESTINATION_CATEGORIES = {
     'DST CAT 4': ['', '', '', ''],
 }
 
-def categorize_with_mapping(items, category_map):
+def build_category_index(category_map):
+    #Reverse mapping of name -> categories it is listed in, in category order
+    index = {}
+    for category, category_items in category_map.items():
+        for item in category_items:
+            item_categories = index.setdefault(item, [])
+            if category not in item_categories:
+                item_categories.append(category)
+    return index
+
+def categorize_with_mapping(items, category_map, index=None):
     #Categorize items based on custom mapping
-    categories = {}
+    if index is None:
+        index = build_category_index(category_map)
+    categories = {category: [] for category in category_map}
     uncategorized = []
 
-    for category, category_items in category_map.items():
-        categories[category] = []
-        for item in items:
-            if item in category_items:
+    for item in items:
+        item_categories = index.get(item)
+        if item_categories:
+            for category in item_categories:
                 categories[category].append(item)
-        categories[category].sort()
+        else:
+            uncategorized.append(item)
 
-    categorized_items = [item for sublist in category_map.values() for item in sublist]
-    uncategorized = [item for item in items if item not in categorized_items]
+    for category_items in categories.values():
+        category_items.sort()
 
     if uncategorized:
         categories['Other'] = sorted(uncategorized)
@@ -260,198 +2009,687 @@ def categorize_with_mapping(items, category_map):
 
     return dict(sorted(categories.items()))
 
-def load_router_config():
-    global SOURCES, DESTINATIONS, router
+def load_router_config(frame=None):
+    #Query a frame's name tables into new dicts and swap them in only once both dumps
+    #have arrived complete, so a dump cut short never replaces a good table.
+    #Returns True if the frame's sources/destinations were replaced.
+    frame = frame or default_frame()
     try:
-        # Ensure router connection is available
-        if router is None:
-            initialize_router()
-        
-        if router is None or simulation_mode:
+        if frame is None or simulation_mode or not frame.router.ensure_connection():
             logger.warning("Router not available, using empty configuration")
-            return {}, {}
+            return False
         
         # Query sources from router using proper Harris LRC protocol
-        sources = []
-        SOURCES.clear()
+        sources = {}
         try:
-            router.clear_buffer()
-            src_command = "~SRC?Q${NAME}\\\n"
-            router.sock.sendall(src_command.encode())
-            
-            import time
-            time.sleep(0.5)
-            
-            # Read the full response until we see the termination marker
-            src_response = ""
-            while True:
-                chunk = router.sock.recv(4096).decode()
-                src_response += chunk
-                if '~SRC%Q${NAME}\\' in src_response:  # Complete response received
-                    break
-                    
-            logger.info(f"Source query response length: {len(src_response)} characters")
-            logger.info(f"Source query response (first 200 chars): '{src_response[:200]}...'")
-            
-            # Parse source entries using the working pattern
-            src_pattern = r'~SRC%I#\{(\d+)\};NAME\$\{([^}]+)\}'
-            src_matches = re.findall(src_pattern, src_response)
-            logger.info(f"Source regex matches: {len(src_matches)} total matches")
-            
-            # Sort by source number and populate SOURCES dict
-            src_matches.sort(key=lambda x: int(x[0]))
-            for number, name in src_matches:
-                SOURCES[int(number)] = name
-                sources.append(name)
-            
-            logger.info(f"Loaded {len(sources)} sources from router")
+            for number, name in frame.router.query_names('SRC'):
+                sources[number] = name
+            logger.info(f"Loaded {len(sources)} sources from router '{frame.name}'")
             
         except Exception as e:
             logger.error(f"Error querying sources: {str(e)}")
+            return False
         
         # Query destinations from router using proper Harris LRC protocol
-        destinations = []
-        DESTINATIONS.clear()
+        destinations = {}
         try:
-            router.clear_buffer()
-            dest_command = "~DEST?Q${NAME}\\\n"
-            router.sock.sendall(dest_command.encode())
-            
-            time.sleep(0.5)
-            
-            # Read the full response until we see the termination marker
-            dest_response = ""
-            while True:
-                chunk = router.sock.recv(4096).decode()
-                dest_response += chunk
-                if '~DEST%Q${NAME}\\' in dest_response:  # Complete response received
-                    break
-                    
-            logger.info(f"Destination query response length: {len(dest_response)} characters")
-            logger.info(f"Destination query response (first 200 chars): '{dest_response[:200]}...'")
-            
-            # Parse destination entries using the working pattern
-            dest_pattern = r'~DEST%I#\{(\d+)\};NAME\$\{([^}]+)\}'
-            dest_matches = re.findall(dest_pattern, dest_response)
-            logger.info(f"Destination regex matches: {len(dest_matches)} total matches")
-            
-            # Sort by destination number and populate DESTINATIONS dict
-            dest_matches.sort(key=lambda x: int(x[0]))
-            for number, name in dest_matches:
-                DESTINATIONS[int(number)] = name
-                destinations.append(name)
-            
-            logger.info(f"Loaded {len(destinations)} destinations from router")
+            for number, name in frame.router.query_names('DEST'):
+                destinations[number] = name
+            logger.info(f"Loaded {len(destinations)} destinations from router '{frame.name}'")
             
         except Exception as e:
             logger.error(f"Error querying destinations: {str(e)}")
+            return False
         
-        # Add alias sources while keeping originals
-        for alias in SOURCE_ALIASES.keys():
-            if SOURCE_ALIASES[alias] in sources:
-                sources.append(alias)
-
-        # Add alias destinations while keeping originals
-        for alias in DESTINATION_ALIASES.keys():
-            if DESTINATION_ALIASES[alias] in destinations:
-                destinations.append(alias)
+        frame.set_name_tables(sources, destinations)
         
-        grouped_sources = categorize_with_mapping(sources, SOURCE_CATEGORIES)
-        grouped_destinations = categorize_with_mapping(destinations, DESTINATION_CATEGORIES)
+        # Seed the tally cache now that the destination names are known
+        if frame.tally.stale:
+            frame.tally.resync_async()
         
-        logger.info(f"Successfully loaded and categorized router configuration from router queries")
-        return grouped_sources, grouped_destinations
+        logger.info(f"Successfully loaded router configuration from router queries")
+        return True
         
     except Exception as e:
         logger.error(f"Error loading router config: {str(e)}")
-        return {}, {}
+        return False
+
+
+def group_router_names(frame, source_index=None, destination_index=None):
+    #Categorize a frame's source/destination tables, including aliases
+    sources = [frame.sources[number] for number in sorted(frame.sources)]
+    destinations = [frame.destinations[number] for number in sorted(frame.destinations)]
     
+    # Add alias sources while keeping originals
+    for alias in SOURCE_ALIASES.keys():
+        if SOURCE_ALIASES[alias] in sources:
+            sources.append(alias)
+
+    # Add alias destinations while keeping originals
+    for alias in DESTINATION_ALIASES.keys():
+        if DESTINATION_ALIASES[alias] in destinations:
+            destinations.append(alias)
+    
+    grouped_sources = categorize_with_mapping(sources, SOURCE_CATEGORIES, source_index)
+    grouped_destinations = categorize_with_mapping(destinations, DESTINATION_CATEGORIES, destination_index)
+    return grouped_sources, grouped_destinations
+
+
+class NameListing:
+    #One name table sorted case-insensitively, with the sorted positions of each category's
+    #members, so prefix and category filters and paging are bisects rather than scans
+    def __init__(self, names, category_index):
+        self.names = sorted(set(names), key=lambda name: (name.casefold(), name))
+        self.keys = [name.casefold() for name in self.names]
+        self.item_categories = [category_index.get(name) or ['Other'] for name in self.names]
+        self.categories = {}
+        for position, categories in enumerate(self.item_categories):
+            for category in categories:
+                self.categories.setdefault(category, []).append(position)
+
+    def query(self, prefix=None, category=None, contains=None, offset=0, limit=100):
+        #Returns (total matches, [{'name', 'categories'}] for the requested page)
+        low, high = 0, len(self.names)
+        if prefix:
+            key = prefix.casefold()
+            low = bisect.bisect_left(self.keys, key)
+            high = bisect.bisect_left(self.keys, key + '\U0010ffff', low)
+
+        if category and category != 'all':
+            members = self.categories.get(category, [])
+            positions = members[bisect.bisect_left(members, low):bisect.bisect_left(members, high)]
+        else:
+            positions = range(low, high)
+        if contains:
+            # Substring search cannot use the index; it only scans what the other filters left
+            needle = contains.casefold()
+            positions = [position for position in positions if needle in self.keys[position]]
+
+        page = positions[offset:offset + limit]
+        return len(positions), [{'name': self.names[position], 'categories': self.item_categories[position]} for position in page]
+
+
+class NameTableCache:
+    #Router name tables served from memory. Refreshed in the background when older than
+    #ttl seconds or when the router announces a name change, and snapshotted to disk so a
+    #restart can serve the UI straight away while the live query runs.
+    def __init__(self, frame, path=None, ttl=300):
+        self.frame = frame
+        self.path = path
+        self.ttl = ttl
+        self.listings = {'sources': NameListing([], {}), 'destinations': NameListing([], {})}
+        self.tables = {'SRC': [], 'DEST': []}
+        self.loaded_at = None
+        self.version = 0
+        self.digest = hashlib.md5(b'').hexdigest()
+        self.refresh_lock = threading.Lock()
+
+    def get(self):
+        #Load the tables synchronously the first time; later, refresh them in the background once older than ttl
+        if self.loaded_at is None:
+            self.refresh()
+        elif time.time() - self.loaded_at > self.ttl:
+            self.refresh_async()
+
+    def refresh(self):
+        #Re-query the router's name tables; concurrent calls share a single query
+        if not self.refresh_lock.acquire(blocking=False):
+            with self.refresh_lock:
+                return
+        try:
+            if self.frame.commands.call(load_router_config, self.frame):
+                self._publish()
+                self.save_snapshot()
+        finally:
+            self.refresh_lock.release()
+
+    def refresh_async(self):
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def on_message(self, message):
+        #Unsolicited ~SRC%/~DEST% entries mean a name was changed on the router
+        if message.command in ('SRC', 'DEST') and message.op == '%' and 'NAME' in message.args and not self.refresh_lock.locked():
+            logger.info(f"Router name change notification: '{message.raw}'")
+            self.refresh_async()
+
+    def _publish(self, loaded_at=None):
+        #Build everything page rendering needs once per name table or category change
+        source_index = build_category_index(SOURCE_CATEGORIES)
+        destination_index = build_category_index(DESTINATION_CATEGORIES)
+        grouped_sources, grouped_destinations = group_router_names(self.frame, source_index, destination_index)
+        
+        sources = {item for items in grouped_sources.values() for item in items}
+        destinations = {item for items in grouped_destinations.values() for item in items}
+        self.listings = {'sources': NameListing(sources, source_index),
+                         'destinations': NameListing(destinations, destination_index)}
+        # The router's own numbered tables, as ~SRC?/~DEST? dumps return them
+        self.tables = {'SRC': sorted(self.frame.sources.items()), 'DEST': sorted(self.frame.destinations.items())}
+        self.frame.tally.renumber(self.frame.destinations, self.frame.sources)
+        # Identifies the published content itself, unlike version, which restarts with the process
+        self.digest = hashlib.md5(json.dumps([grouped_sources, grouped_destinations]).encode('utf-8')).hexdigest()
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        self.version += 1
+
+    def save_snapshot(self):
+        if not self.path:
+            return
+        snapshot = {
+            'saved_at': self.loaded_at,
+            'sources': self.frame.sources,
+            'destinations': self.frame.destinations
+        }
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not save name table snapshot: {str(e)}")
+
+    def load_snapshot(self):
+        #Populate the frame's name tables from the last snapshot on disk, if there is one
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read name table snapshot: {str(e)}")
+            return False
 
-def try_router_connection(host, port=52116):
-    #Attempt to connect to the router
-    global router, simulation_mode
-    try:
-        router = IP3Router(host, port)
-        simulation_mode = False
-        logger.info("Successfully connected to physical router")
+        self.frame.set_name_tables({int(number): name for number, name in snapshot.get('sources', {}).items()},
+                                   {int(number): name for number, name in snapshot.get('destinations', {}).items()})
+        self._publish(snapshot.get('saved_at', 0))
+        logger.info(f"Loaded {len(self.frame.sources)} sources and {len(self.frame.destinations)} destinations from {self.path}")
         return True
-    except Exception as e:
-        logger.warning(f"Router connection failed: {str(e)}")
-        return False
 
-def initialize_router():
-    #Initialize router connection
-    global router, router_host, router_port
-    if router is None and router_host is not None:
-        try_router_connection(router_host, router_port)
+
+class LRCProxyClient:
+    #One downstream LRC session. Commands are read and answered on one thread; router
+    #notifications are written from the session's broadcast subscription by another.
+    def __init__(self, proxy, sock, address):
+        self.proxy = proxy
+        self.sock = sock
+        self.address = address
+        self.send_lock = threading.Lock()
+        self.subscriber = proxy.notifications.subscribe()
+
+    def start(self):
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, messages):
+        if messages:
+            with self.send_lock:
+                self.sock.sendall("".join(messages).encode('utf-8'))
+
+    def close(self):
+        self.proxy.notifications.unsubscribe(self.subscriber)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _read_loop(self):
+        framer = LRCFramer()
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                if not data:
+                    break
+                for message in framer.feed(data):
+                    try:
+                        self.proxy.handle(self, message)
+                    except ConnectionError as e:
+                        logger.warning(f"Proxy command '{message.raw}' from {self.address[0]} not sent: {str(e)}")
+        except OSError:
+            pass
+        finally:
+            logger.info(f"LRC proxy client {self.address[0]}:{self.address[1]} disconnected")
+            self.close()
+            self.sock.close()
+
+    def _write_loop(self):
+        #A session that stops reading is dropped by the broadcaster and disconnected here
+        events = self.proxy.notifications
+        try:
+            while True:
+                try:
+                    _, raw = self.subscriber.get(timeout=15)
+                except queue.Empty:
+                    if self.subscriber not in events.subscribers:
+                        break
+                    continue
+                self.send([raw])
+        except OSError:
+            pass
+        finally:
+            self.close()
+
+
+class LRCProxy:
+    #Shares a frame's single router session with downstream LRC clients (scripts, panels)
+    #that would otherwise each need one of the frame's limited control sessions.
+    #Crosspoint, lock and name queries are answered from the frame's caches while they are
+    #current; takes and locks go through the frame's command queue like the web UI's.
+    #Every crosspoint and lock change, whoever made it, is sent to every client.
+    def __init__(self, frame, host='0.0.0.0', port=52116):
+        self.frame = frame
+        self.host = host
+        self.port = port
+        self.server = None
+        self.notifications = EventBroadcaster(max_pending=4096)
+        frame.tally.add_change_listener(self.publish_xpoint)
+        frame.locks.add_change_listener(self.publish_lock)
+
+    def start(self):
+        #Listen in a background thread; returns the bound port (useful with port=0)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((self.host, self.port))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        logger.info(f"LRC proxy for frame '{self.frame.name}' listening on {self.host}:{self.port}")
+        return self.port
+
+    def stop(self):
+        if self.server:
+            self.server.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            logger.info(f"LRC proxy client connected from {address[0]}:{address[1]}")
+            LRCProxyClient(self, sock, address).start()
+
+    @staticmethod
+    def encode_xpoint(dst, src):
+        return f"~XPOINT%D${{{dst}}};S${{{src}}}\\"
+
+    @staticmethod
+    def encode_lock(dst, locked):
+        return f"~LOCK%D${{{dst}}};V${{{'ON' if locked else 'OFF'}}};U#{{20}}\\"
+
+    def publish_xpoint(self, dst, src):
+        self.notifications.publish('xpoint', self.encode_xpoint(dst, src))
+
+    def publish_lock(self, dst, locked):
+        self.notifications.publish('lock', self.encode_lock(dst, locked))
+
+    def handle(self, client, message):
+        #Answer one downstream command. Changes a command causes reach the client through
+        #the broadcast; it is only answered directly when nothing will change.
+        frame = self.frame
+        router = frame.router
+        dst = message.args.get('D')
+        answered = 'router'
+
+        if message.command == 'XPOINT' and message.op == '?':
+            if dst is not None and not frame.knows_destination(dst):
+                client.send([f"~XPOINT!E${{UNKNOWN}};D${{{dst}}}\\"])
+                answered = 'cache'
+            elif dst is not None:
+                source = None if frame.tally.stale else frame.tally.lookup(dst)[0]
+                if source is not None:
+                    answered = 'cache'
+                else:
+                    # Read-only, with its reply matched to it, so it need not wait behind queued takes
+                    source = router.status(dst)
+                client.send([self.encode_xpoint(dst, source)] if source is not None else [])
+            else:
+                if frame.tally.stale:
+                    crosspoints = frame.commands.call(router.status_all)
+                else:
+                    crosspoints = frame.tally.snapshot()
+                    answered = 'cache'
+                client.send([self.encode_xpoint(d, s) for d, s in crosspoints.items()])
+
+        elif message.command == 'XPOINT' and message.op == ':' and dst is not None and 'S' in message.args:
+            src = message.args['S']
+            before = frame.tally.lookup(dst)[0]
+            # Catch the router's own error so a failed take is answered with it
+            errors = router.expect(lambda m: m.command == 'XPOINT' and m.op == '!' and m.args.get('D') == dst)
+            try:
+                result = frame.commands.call(router.route, src, dst)
+            finally:
+                router.release(errors)
+            if result == "locked":
+                client.send([f"~XPOINT!LOCK!D${{{dst}}}\\"])
+            elif result is True:
+                if before == src:
+                    client.send([self.encode_xpoint(dst, src)])
+            else:
+                error = errors.get(0)
+                client.send([error.raw if error else f"~XPOINT!E${{FAILED}};D${{{dst}}}\\"])
+
+        elif message.command == 'LOCK' and message.op == '?':
+            if frame.locks.stale:
+                states = frame.commands.call(router.lock_status_all)
+            else:
+                states = {d: frame.locks.is_locked(d) for _, d in frame.names.tables['DEST']}
+                answered = 'cache'
+            if dst is not None:
+                states = {dst: states[dst]} if dst in states else {}
+            client.send([self.encode_lock(d, locked) for d, locked in states.items()])
+
+        elif message.command == 'LOCK' and message.op == ':' and dst is not None and message.args.get('V') in ('ON', 'OFF'):
+            locked = message.args['V'] == 'ON'
+            before = frame.locks.is_locked(dst)
+            operation = router.lock_destination if locked else router.unlock_destination
+            # As with takes, a refused or unanswered lock is answered with the router's error, or one of our own
+            errors = router.expect(lambda m: m.command == 'LOCK' and m.op == '!' and m.args.get('D') == dst)
+            try:
+                confirmed = frame.commands.call(operation, dst)
+            finally:
+                router.release(errors)
+            if not confirmed:
+                error = errors.get(0)
+                client.send([error.raw if error else f"~LOCK!E${{FAILED}};D${{{dst}}}\\"])
+            elif before == locked:
+                client.send([self.encode_lock(dst, locked)])
+
+        elif message.command in ('SRC', 'DEST') and message.op == '?':
+            # Answered from the last complete, published table, never one being reloaded
+            frame.names.get()
+            table = frame.names.tables[message.command]
+            client.send([f"~{message.command}%I#{{{number}}};NAME${{{name}}}\\" for number, name in table]
+                        + [f"~{message.command}%Q${{NAME}}\\"])
+            answered = 'cache'
+
+        else:
+            # Replies to other commands cannot be told apart from other sessions' traffic,
+            # so these are passed through and only their effects are seen, via the broadcast
+            frame.commands.call(router.send_bytes, f"{message.raw}\n".encode('utf-8'))
+
+        metrics.increment('lrc_proxy_commands_total', frame=frame.name, command=message.command or 'other', answered=answered)
+
+
+class RouterFrame:
+    #One LRC frame: its own connection, command queue, tally cache, name tables and event stream
+    def __init__(self, name, host, port=52116, take_timeout=2.0, names_cache=None, names_ttl=300, sources=None, destinations=None, journal_dir=None, proxy_port=None):
+        self.name = name
+        self.router = IP3Router(host, port, confirm_timeout=take_timeout, name=name)
+        self.commands = CommandQueue()
+        self.sources = {}
+        self.destinations = {}
+        self.destination_names = frozenset()
+        # Dicts kept in step with this frame's name tables, e.g. the SOURCES/DESTINATIONS globals
+        self.shared_sources = sources
+        self.shared_destinations = destinations
+        self.tally = TallyCache(self.router, self.commands, lambda: list(self.destinations.values()))
+        self.locks = LockCache(self.router, self.commands)
+        self.router.locks = self.locks
+        self.names = NameTableCache(self, names_cache, names_ttl)
+        self.events = EventBroadcaster()
+        self.supervisor = RouterSupervisor(self.router, self.commands,
+                                           lambda: next(iter(self.destinations.values()), None),
+                                           on_change=self.publish_link_event)
+        self.index_page = None
+        self.index_page_lock = threading.Lock()
+
+        # Names can change while the link is down, so they are reloaded on every reconnect
+        self.router.add_connect_listener(self.names.refresh)
+        self.router.add_listener(self.names.on_message)
+        self.router.add_listener(self.publish_lock_event)
+        self.tally.add_change_listener(self.publish_xpoint_event)
+        self.scheduler = SalvoScheduler(self)
+
+        # Every change is journaled, including the full matrix on each resync as a baseline
+        self.journal = None
+        if journal_dir:
+            self.journal = RouteJournal(os.path.join(journal_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', name)))
+            self.tally.add_change_listener(self.journal.record_xpoint)
+            self.tally.add_sync_listener(self.journal.record_baseline)
+            self.router.add_listener(self.journal.record_lock)
+
+        # Downstream LRC clients share this frame's router session through the proxy
+        self.proxy = LRCProxy(self, port=proxy_port) if proxy_port is not None else None
+
+    def set_name_tables(self, sources, destinations):
+        #Swap in complete name tables; readers holding the old dicts never see a half-loaded one.
+        #The shared dicts are updated in place so references to them stay valid.
+        self.sources = sources
+        self.destinations = destinations
+        self.destination_names = frozenset(destinations.values())
+        if self.shared_sources is not None:
+            self.shared_sources.clear()
+            self.shared_sources.update(sources)
+        if self.shared_destinations is not None:
+            self.shared_destinations.clear()
+            self.shared_destinations.update(destinations)
+
+    def knows_destination(self, dst):
+        #False only once the name tables have loaded without dst, so it needs no router round trip
+        return not self.destination_names or dst in self.destination_names
+
+    def publish_xpoint_event(self, dst, src):
+        self.events.publish('xpoint', {'frame': self.name, 'destination': dst, 'source': src})
+
+    def publish_lock_event(self, message):
+        if message.command == 'LOCK' and message.op == '%' and 'D' in message.args and 'V' in message.args:
+            self.events.publish('lock', {'frame': self.name, 'destination': message.args['D'], 'locked': message.args['V'] == 'ON'})
+
+    def publish_link_event(self, supervisor):
+        self.events.publish('link', dict(supervisor.describe(), frame=self.name))
+
+    def start(self):
+        #Connect in the background; the name tables and tally load once the link is up,
+        #and the UI is served from the snapshot meanwhile
+        if self.journal:
+            self.journal.start()
+        if self.proxy:
+            self.proxy.start()
+        self.scheduler.start()
+        self.supervisor.start()
+
+
+def add_frame(name, host, port=52116, take_timeout=2.0, names_cache=None, names_ttl=300, journal_dir=None, proxy_port=None):
+    #Register a frame; the first one registered is the default and keeps SOURCES/DESTINATIONS current
+    first = not frames
+    frame = RouterFrame(name, host, port, take_timeout, names_cache, names_ttl,
+                        sources=SOURCES if first else None,
+                        destinations=DESTINATIONS if first else None,
+                        journal_dir=journal_dir,
+                        proxy_port=proxy_port)
+    frame.names.load_snapshot()
+    frames[name] = frame
+    logger.info(f"Router frame '{name}' at {host}:{port}")
+    return frame
+
+def default_frame():
+    return next(iter(frames.values()), None)
+
+def load_frames_config(path, take_timeout=2.0, names_ttl=300, journal_dir=None):
+    #Create every frame listed in a JSON config file:
+    #{"frames": [{"name": "main", "host": "10.0.0.1", "port": 52116, "names_cache": "main.json", "proxy_port": 52117}, ...]}
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    for entry in config.get('frames', []):
+        add_frame(entry['name'], entry['host'], entry.get('port', 52116),
+                  entry.get('take_timeout', take_timeout),
+                  entry.get('names_cache', f"router_names_{entry['name']}.json"),
+                  entry.get('names_ttl', names_ttl),
+                  journal_dir,
+                  entry.get('proxy_port'))
+    if not frames:
+        raise ValueError(f"No frames configured in {path}")
+
+def start_frames():
+    #Start every frame's supervisor; each connects and loads its tables independently
+    for frame in frames.values():
+        frame.start()
+
+
+def parse_time(value):
+    #Epoch seconds or an ISO 8601 local time such as 2024-05-01T19:02; None passes through
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
 
 class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
     #HTTP requets for router control interface
     
+    def resolve_frame(self):
+        #Select the frame addressed by an optional /frames/<name> prefix and strip it from the path.
+        #Unprefixed paths address the default frame.
+        path = urlparse(self.path).path
+        if path.startswith('/frames/'):
+            parts = path.split('/', 3)
+            self.frame = frames.get(unquote(parts[2]))
+            if self.frame is not None and len(parts) < 4:
+                # The UI uses relative URLs, so the frame page must end in a slash
+                self.send_response(301)
+                self.send_header('Location', f"{path}/")
+                self.end_headers()
+                return None
+            path = '/' + (parts[3] if len(parts) > 3 else '')
+        else:
+            self.frame = default_frame()
+        
+        if self.frame is None:
+            self.send_error(404, "Unknown router frame")
+            return None
+        return path
+    
     def do_GET(self):
         #Handle GET requests
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
+        started = time.monotonic()
+        if urlparse(self.path).path == '/frames':
+            self.handle_frames()
+            self.record_request('/frames', started)
+            return
+        if urlparse(self.path).path == '/metrics':
+            self.handle_metrics()
+            return
+        
+        path = self.resolve_frame()
+        if path is None:
+            return
         
         if path == '/':
             self.serve_index()
         elif path.startswith('/status/'):
-            destination = path.split('/')[-1]
+            destination = unquote(path.split('/')[-1])
             self.handle_status(destination)
+            path = '/status/'
+        elif path == '/matrix':
+            self.handle_matrix()
+        elif path == '/events':
+            # Long-lived stream; its duration is not a request latency
+            self.handle_events()
+            return
         elif path == '/router_status':
             self.handle_router_status()
+        elif path == '/trace':
+            self.handle_trace()
+        elif path == '/history':
+            self.handle_history()
+        elif path == '/schedule':
+            self.send_json_response({'success': True, 'jobs': self.frame.scheduler.list(), 'simulation': simulation_mode})
+        elif path == '/tally':
+            self.handle_tally()
+        elif path in ('/api/sources', '/api/destinations'):
+            self.handle_name_listing(path.split('/')[-1])
         else:
             self.send_error(404, "Not Found")
+            path = 'other'
+        self.record_request(path, started)
     
     def do_POST(self):
         #Handle POST requests
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
+        started = time.monotonic()
+        path = self.resolve_frame()
+        if path is None:
+            return
         
         if path == '/route':
             self.handle_route()
+        elif path == '/salvo':
+            self.handle_salvo()
+        elif path in ('/lock', '/unlock'):
+            self.handle_bulk_lock(path == '/lock')
+        elif path == '/schedule':
+            self.handle_schedule()
+        elif re.fullmatch(r'/schedule/\d+/cancel', path):
+            self.handle_cancel_schedule(int(path.split('/')[2]))
+            path = '/schedule/cancel'
         elif path.startswith('/lock/'):
-            destination = path.split('/')[-1]
+            destination = unquote(path.split('/')[-1])
             self.handle_lock(destination)
+            path = '/lock/'
         elif path.startswith('/unlock/'):
-            destination = path.split('/')[-1]
+            destination = unquote(path.split('/')[-1])
             self.handle_unlock(destination)
+            path = '/unlock/'
         else:
             self.send_error(404, "Not Found")
+            path = 'other'
+        self.record_request(path, started)
+    
+    def record_request(self, endpoint, started):
+        #Endpoints are recorded by route, not full path, so label cardinality stays bounded
+        frame = getattr(self, 'frame', None)
+        metrics.observe('http_request_duration_seconds', time.monotonic() - started,
+                        frame=frame.name if frame else '', method=self.command, endpoint=endpoint)
+    
+    def handle_metrics(self):
+        #Prometheus scrape endpoint; link and queue state is sampled now rather than tracked
+        gauges = []
+        for frame in frames.values():
+            labels = {'frame': frame.name}
+            link = frame.supervisor.describe()
+            gauges.append(('lrc_router_connected', 'gauge', 'Whether the router link is up', labels, int(link['state'] == 'connected')))
+            gauges.append(('lrc_router_reconnects_total', 'counter', 'Router reconnects after a lost link', labels, link['reconnects']))
+            gauges.append(('lrc_router_failed_connect_attempts', 'gauge', 'Consecutive failed connection attempts', labels, link['failed_attempts']))
+            if link['rtt'] is not None:
+                gauges.append(('lrc_heartbeat_rtt_seconds', 'gauge', 'Last heartbeat round-trip time', labels, link['rtt']))
+            gauges.append(('lrc_command_queue_depth', 'gauge', 'Router commands waiting for the link', labels, frame.commands.depth))
+            gauges.append(('lrc_tally_stale', 'gauge', 'Whether the tally cache needs a resync', labels, int(frame.tally.stale)))
+            gauges.append(('http_event_clients', 'gauge', 'Connected /events clients', labels, frame.events.count))
+            if frame.proxy:
+                gauges.append(('lrc_proxy_clients', 'gauge', 'Connected LRC proxy clients', labels, frame.proxy.notifications.count))
+        
+        body = metrics.render(gauges).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
     def serve_index(self):
         #Serve the main index.html page with router data
         try:
-            # Load router configuration
-            grouped_sources, grouped_destinations = load_router_config()
-            
-            # Extract flat lists from categorized data
-            sources = []
-            for category_items in grouped_sources.values():
-                sources.extend(category_items)
-            sources = sorted(list(set(sources)))  # Remove duplicates and sort
+            page = self.get_index_page()
             
-            destinations = []
-            for category_items in grouped_destinations.values():
-                destinations.extend(category_items)
-            destinations = sorted(list(set(destinations)))  # Remove duplicates and sort
+            # Browsers revalidating an unchanged page get a bodiless 304
+            if page.etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+                self.send_response(304)
+                self.send_header('ETag', page.etag)
+                self.end_headers()
+                return
             
-            # Render embedded template with context
-            html_content = self.render_template(
-                sources=sources,
-                destinations=destinations,
-                source_categories=list(SOURCE_CATEGORIES.keys()),
-                destination_categories=list(DESTINATION_CATEGORIES.keys()),
-                source_to_categories={src: [cat for cat, items in SOURCE_CATEGORIES.items() if src in items] for src in sources},
-                destination_to_categories={dst: [cat for cat, items in DESTINATION_CATEGORIES.items() if dst in items] for dst in destinations},
-                simulation_mode=simulation_mode
-            )
+            use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            body = page.gzip_body if use_gzip else page.body
             
             self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+            self.send_header('Content-type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', page.etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
             self.end_headers()
-            self.wfile.write(html_content.encode('utf-8'))
+            self.wfile.write(body)
             
         except Exception as e:
             logger.error(f"Error serving index: {str(e)}")
@@ -459,11 +2697,108 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
     
 
     
+    def get_index_page(self):
+        #Return the frame's rendered index page, rendering it only when the name tables or router state change
+        frame = self.frame
+        names = frame.names
+        
+        # Router name tables and their category indexes are cached and refreshed in the background
+        names.get()
+        
+        key = (names.version, simulation_mode)
+        page = frame.index_page
+        if page is None or page.key != key:
+            with frame.index_page_lock:
+                if frame.index_page is None or frame.index_page.key != key:
+                    html_content = self.render_template(
+                        source_categories=list(SOURCE_CATEGORIES.keys()),
+                        destination_categories=list(DESTINATION_CATEGORIES.keys()),
+                        simulation_mode=simulation_mode
+                    )
+                    frame.index_page = RenderedPage(key, html_content)
+                page = frame.index_page
+        return page
+    
+    def handle_tally(self):
+        #Crosspoints changed since ?since=<version>; without it, or when that version can no
+        #longer be diffed against (name tables renumbered, server restarted), the full table
+        try:
+            since = parse_qs(urlparse(self.path).query).get('since', [None])[0]
+            since = int(since) if since is not None else None
+        except ValueError:
+            self.send_json_response({'success': False, 'message': 'since must be an integer version', 'simulation': simulation_mode})
+            return
+        
+        tally = self.frame.tally
+        version, full, crosspoints = tally.changes(since)
+        self.send_json_response({
+            'success': True,
+            'version': version,
+            'since': since,
+            'full': full,
+            'crosspoints': crosspoints,
+            'stale': tally.stale,
+            'simulation': simulation_mode
+        })
+    
+    def handle_name_listing(self, kind):
+        #Paged name table: ?prefix=&category=&contains=&offset=&limit=
+        #The result depends only on the table contents and the query, so that is the ETag.
+        names = self.frame.names
+        names.get()
+        query = urlparse(self.path).query
+        etag = f'"{names.digest[:16]}-{hashlib.md5(query.encode("utf-8")).hexdigest()[:16]}"'
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        try:
+            params = parse_qs(query)
+            param = lambda name: params.get(name, [None])[0]
+            offset = max(int(param('offset') or 0), 0)
+            limit = min(max(int(param('limit') or 100), 1), 1000)
+        except ValueError:
+            self.send_json_response({'success': False, 'message': 'offset and limit must be integers', 'simulation': simulation_mode})
+            return
+        
+        listing = names.listings[kind]
+        total, items = listing.query(param('prefix'), param('category'), param('contains'), offset, limit)
+        body = json.dumps({
+            'success': True,
+            'items': items,
+            'total': total,
+            'size': len(listing.names),
+            'offset': offset,
+            'limit': limit,
+            'version': names.version,
+            'simulation': simulation_mode
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_frames(self):
+        #List every configured frame and its link state
+        response = {
+            'frames': [{
+                'name': frame.name,
+                'host': frame.router.host,
+                'port': frame.router.port,
+                'connected': frame.router.connected,
+                'rtt': frame.supervisor.rtt,
+                'stale': frame.tally.stale
+            } for frame in frames.values()]
+        }
+        self.send_json_response(response)
+    
     def handle_route(self):
         #Handle routing requests
-        if router is None:
-            initialize_router()
-        
         try:
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
@@ -481,19 +2816,21 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
                 router_destination = DESTINATION_ALIASES.get(destination, destination)
                 router_source = SOURCE_ALIASES.get(source, source)
                 
-                result = router.route(router_source, router_destination)
+                result, latency = self.frame.commands.call(self.frame.router.route_timed, router_source, router_destination)
                 
                 if result == "locked":
                     response = {
                         'success': False,
                         'locked': True,
                         'message': 'Destination is locked, contact Engineering',
+                        'latency': latency,
                         'simulation': simulation_mode
                     }
                 else:
                     response = {
                         'success': True,
                         'result': result,
+                        'latency': latency,
                         'simulation': simulation_mode
                     }
             
@@ -508,19 +2845,159 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
             }
             self.send_json_response(response)
     
+    def handle_salvo(self):
+        #Handle salvo requests: many routes taken together
+        try:
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            routes = data.get('routes') or []
+            
+            if not routes or not all(route.get('source') and route.get('destination') for route in routes):
+                response = {
+                    'success': False,
+                    'message': 'A list of routes with source and destination is required'
+                }
+            elif any(route.get('frame', self.frame.name) not in frames for route in routes):
+                response = {
+                    'success': False,
+                    'message': 'Unknown router frame'
+                }
+            else:
+                # Routes may name their frame; each frame's share is taken on its own link in parallel
+                by_frame = {}
+                for route in routes:
+                    pair = (SOURCE_ALIASES.get(route['source'], route['source']),
+                            DESTINATION_ALIASES.get(route['destination'], route['destination']))
+                    by_frame.setdefault(route.get('frame', self.frame.name), []).append(pair)
+                
+                started = time.monotonic()
+                with ThreadPoolExecutor(max_workers=len(by_frame)) as executor:
+                    futures = {name: executor.submit(frames[name].commands.call, frames[name].router.salvo, pairs)
+                               for name, pairs in by_frame.items()}
+                    outcomes = {name: future.result() for name, future in futures.items()}
+                elapsed = time.monotonic() - started
+                
+                results = []
+                for route in routes:
+                    frame_name = route.get('frame', self.frame.name)
+                    router_destination = DESTINATION_ALIASES.get(route['destination'], route['destination'])
+                    result = outcomes[frame_name].get(router_destination, False)
+                    results.append({
+                        'frame': frame_name,
+                        'source': route['source'],
+                        'destination': route['destination'],
+                        'success': result is True,
+                        'locked': result == "locked"
+                    })
+                
+                response = {
+                    'success': all(result['success'] for result in results),
+                    'results': results,
+                    'elapsed': elapsed,
+                    'simulation': simulation_mode
+                }
+            
+            self.send_json_response(response)
+            
+        except Exception as e:
+            logger.error(f"Error in salvo operation: {str(e)}")
+            response = {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+    
+    def handle_schedule(self):
+        #Schedule a salvo to fire at {"at": ISO 8601 or epoch seconds} or {"timecode": "HH:MM:SS:FF", "fps": 25}
+        try:
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            routes = data.get('routes') or []
+            
+            if not all(route.get('source') and route.get('destination') for route in routes):
+                raise ValueError('Every route needs a source and destination')
+            if data.get('timecode'):
+                fire_at = parse_timecode(data['timecode'], int(data.get('fps', 25)))
+            elif data.get('at') is not None:
+                fire_at = parse_time(str(data['at']))
+            else:
+                raise ValueError('Either at or timecode is required')
+            
+            job = self.frame.scheduler.schedule([(route['source'], route['destination']) for route in routes],
+                                                fire_at, data.get('label'))
+            response = {
+                'success': True,
+                'job': job,
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+            
+        except ValueError as e:
+            response = {
+                'success': False,
+                'message': str(e),
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+        except Exception as e:
+            logger.error(f"Error scheduling salvo: {str(e)}")
+            response = {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+    
+    def handle_cancel_schedule(self, job_id):
+        job = self.frame.scheduler.cancel(job_id)
+        response = {
+            'success': job is not None,
+            'job': job,
+            'message': None if job else 'No scheduled salvo with that id is pending',
+            'simulation': simulation_mode
+        }
+        self.send_json_response(response)
+    
     def handle_status(self, destination):
         #Handle status requests
-        if router is None:
-            initialize_router()
-        
         try:
             router_destination = DESTINATION_ALIASES.get(destination, destination)
-            current_source = router.status(router_destination)
+            
+            # Names the loaded tables do not list are answered without asking the router
+            if not self.frame.knows_destination(router_destination):
+                response = {
+                    'success': False,
+                    'message': f"Unknown destination {destination}",
+                    'destination': destination,
+                    'simulation': simulation_mode
+                }
+                self.send_json_response(response)
+                return
+            
+            # Answer from the tally cache; only query the router if it has no current entry.
+            # While the link is down the last known source is still returned, marked stale,
+            # and it is only replaced when the live query actually answers. The query is
+            # read-only and its reply is matched to it, so it does not wait in the command queue.
+            tally = self.frame.tally
+            current_source, age = tally.lookup(router_destination)
+            cached = current_source is not None
+            stale = cached and tally.stale
+            if not cached or stale:
+                live_source = self.frame.router.status(router_destination)
+                if live_source is not None:
+                    current_source, age, cached, stale = live_source, 0.0, False, False
             
             response = {
                 'success': True if current_source else False,
                 'source': current_source,
                 'destination': destination,
+                'locked': self.frame.locks.is_locked(router_destination),
+                'cached': cached,
+                'age': age,
+                'stale': stale,
                 'simulation': simulation_mode
             }
             self.send_json_response(response)
@@ -534,25 +3011,184 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
             }
             self.send_json_response(response)
     
+    def handle_matrix(self):
+        #Handle whole-matrix requests
+        try:
+            tally = self.frame.tally
+            cached = not tally.stale
+            if not cached:
+                tally.resync()
+            version, _, matrix = tally.changes()
+            
+            response = {
+                'success': bool(matrix),
+                'matrix': matrix,
+                'count': len(matrix),
+                'version': version,
+                'locks': self.frame.locks.snapshot(),
+                'cached': cached,
+                'stale': tally.stale,
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+            
+        except Exception as e:
+            logger.error(f"Error in matrix query: {str(e)}")
+            response = {
+                'success': False,
+                'message': str(e),
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+    
+    def handle_events(self):
+        #Stream crosspoint and lock changes to the browser as Server-Sent Events
+        # Subscribe before taking the snapshot so no change can fall between the two
+        events = self.frame.events
+        tally = self.frame.tally
+        subscriber = events.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            
+            if tally.stale:
+                tally.resync_async()
+            self.send_event('matrix', {
+                'frame': self.frame.name,
+                'connected': self.frame.router.connected,
+                'crosspoints': tally.snapshot(),
+                'locks': self.frame.locks.snapshot(),
+                'aliases': DESTINATION_ALIASES,
+                'stale': tally.stale
+            })
+            
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    if subscriber not in events.subscribers:
+                        break
+                    # Comment line keeps proxies from timing out an idle stream
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                self.send_event(event, data)
+                
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            events.unsubscribe(subscriber)
+    
+    def send_event(self, event, data):
+        #Write one Server-Sent Event
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+    
+    def handle_history(self):
+        #Query the route journal: ?destination=&from=&to=&limit= for changes in a time range,
+        #or ?destination=&at= for what was on a destination at one instant
+        try:
+            journal = self.frame.journal
+            query = parse_qs(urlparse(self.path).query)
+            param = lambda name: query.get(name, [None])[0]
+            destination = param('destination')
+            router_destination = DESTINATION_ALIASES.get(destination, destination) if destination else None
+            
+            if journal is None:
+                response = {
+                    'success': False,
+                    'message': 'Route journal is disabled'
+                }
+            elif param('at') is not None:
+                if not router_destination:
+                    response = {
+                        'success': False,
+                        'message': 'A destination is required with at'
+                    }
+                else:
+                    when = parse_time(param('at'))
+                    response = dict(journal.state_at(router_destination, when), **{
+                        'success': True,
+                        'frame': self.frame.name,
+                        'destination': destination,
+                        'at': when,
+                        'simulation': simulation_mode
+                    })
+            else:
+                limit = min(max(int(param('limit') or 500), 1), 5000)
+                records, truncated = journal.query(parse_time(param('from')), parse_time(param('to')), router_destination, limit)
+                response = {
+                    'success': True,
+                    'frame': self.frame.name,
+                    'records': records,
+                    'count': len(records),
+                    'truncated': truncated,
+                    'simulation': simulation_mode
+                }
+            self.send_json_response(response)
+            
+        except ValueError as e:
+            response = {
+                'success': False,
+                'message': f'Invalid query: {str(e)}',
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+        except Exception as e:
+            logger.error(f"Error in history query: {str(e)}")
+            response = {
+                'success': False,
+                'message': str(e),
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+    
+    def handle_trace(self):
+        #Download the frame's protocol trace for replay with lrc_simulator.py --replay or benchmark.py --trace
+        #The capture is streamed in batches of lines; closing the connection marks its end
+        router = self.frame.router
+        filename = f"lrc_trace_{re.sub(r'[^A-Za-z0-9_.-]', '_', self.frame.name)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            batch, size = [], 0
+            for line in router.trace.dump(frame=self.frame.name, router=f"{router.host}:{router.port}"):
+                batch.append(line)
+                size += len(line)
+                if size >= 65536:
+                    self.wfile.write("".join(batch).encode('utf-8'))
+                    batch, size = [], 0
+            self.wfile.write("".join(batch).encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+    
     def handle_router_status(self):
         #Handle router status requests
-        if router is None:
-            initialize_router()
+        link = self.frame.supervisor.describe()
+        if simulation_mode:
+            status = 'Simulated'
+        else:
+            status = 'Connected' if link['state'] == 'connected' else 'Disconnected'
         
-        response = {
+        response = dict(link, **{
+            'frame': self.frame.name,
             'simulation_mode': simulation_mode,
-            'status': 'Simulated' if simulation_mode else 'Connected'
-        }
+            'status': status,
+            'stale': self.frame.tally.stale
+        })
         self.send_json_response(response)
     
     def handle_lock(self, destination):
         #Handle lock destination requests
-        if router is None:
-            initialize_router()
-        
         try:
             router_destination = DESTINATION_ALIASES.get(destination, destination)
-            success = router.lock_destination(router_destination)
+            success = self.frame.commands.call(self.frame.router.lock_destination, router_destination)
             response = {
                 'success': success,
                 'message': f"{'Successfully locked' if success else 'Failed to lock'} {destination}",
@@ -569,14 +3205,51 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
             }
             self.send_json_response(response)
     
+    def handle_bulk_lock(self, locked):
+        #Lock or unlock many destinations in one pipelined exchange
+        action = 'lock' if locked else 'unlock'
+        try:
+            content_length = int(self.headers['Content-Length'])
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+            destinations = data.get('destinations') or []
+            
+            if not destinations:
+                response = {
+                    'success': False,
+                    'message': 'A list of destinations is required'
+                }
+            else:
+                router_destinations = {destination: DESTINATION_ALIASES.get(destination, destination) for destination in destinations}
+                started = time.monotonic()
+                outcome = self.frame.commands.call(self.frame.router.lock_many, router_destinations.values(), locked)
+                elapsed = time.monotonic() - started
+                
+                results = [{'destination': destination, 'success': outcome.get(router_destination, False)}
+                           for destination, router_destination in router_destinations.items()]
+                response = {
+                    'success': all(result['success'] for result in results),
+                    'results': results,
+                    'elapsed': elapsed,
+                    'simulation': simulation_mode
+                }
+            
+            self.send_json_response(response)
+            
+        except Exception as e:
+            logger.error(f"Error in bulk {action} operation: {str(e)}")
+            response = {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'simulation': simulation_mode
+            }
+            self.send_json_response(response)
+    
     def handle_unlock(self, destination):
         #Handle unlock destination requests
-        if router is None:
-            initialize_router()
-        
         try:
             router_destination = DESTINATION_ALIASES.get(destination, destination)
-            success = router.unlock_destination(router_destination)
+            success = self.frame.commands.call(self.frame.router.unlock_destination, router_destination)
             response = {
                 'success': success,
                 'message': f"{'Successfully unlocked' if success else 'Failed to unlock'} {destination}",
@@ -603,29 +3276,16 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
     
     def render_template(self, **context):
         #Render the embedded HTML template with context data
-        rendered = HTML_TEMPLATE
-        
-        # Generate HTML for sources
-        sources_html = ""
-        for source in context.get('sources', []):
-            categories = " ".join(context.get('source_to_categories', {}).get(source, []))
-            sources_html += f'<div class="source-btn" data-source="{source}" data-categories="{categories}">{source}</div>\n'
-        
-        # Generate HTML for destinations  
-        destinations_html = ""
-        for destination in context.get('destinations', []):
-            categories = " ".join(context.get('destination_to_categories', {}).get(destination, []))
-            destinations_html += f'<div class="destination-btn" data-destination="{destination}" data-categories="{categories}">{destination}</div>\n'
-        
-        # Generate HTML for source categories
-        source_categories_html = ""
-        for category in context.get('source_categories', []):
-            source_categories_html += f'<button class="category-btn" data-category="{category}">{category}</button>\n'
+        # Source and destination buttons are not embedded; the page loads the visible
+        # category or search results from /api/sources and /api/destinations on demand
         
-        # Generate HTML for destination categories
-        destination_categories_html = ""
-        for category in context.get('destination_categories', []):
-            destination_categories_html += f'<button class="category-btn" data-category="{category}">{category}</button>\n'
+        # Generate HTML for source and destination categories
+        source_categories_html = "".join(
+            f'<button class="category-btn" data-category="{category}">{category}</button>\n'
+            for category in context.get('source_categories', []))
+        destination_categories_html = "".join(
+            f'<button class="category-btn" data-category="{category}">{category}</button>\n'
+            for category in context.get('destination_categories', []))
         
         # Router status
         router_status = "active" if not context.get('simulation_mode', False) else ""
@@ -633,33 +3293,33 @@ class RouterHTTPRequestHandler(BaseHTTPRequestHandler):
         # Simulation banner
         simulation_banner = '<div class="simulation-banner">Router Not Connected</div>' if context.get('simulation_mode', False) else ""
         
-        # Current timestamp
-        timestamp = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-        
-        # Replace placeholders
-        rendered = rendered.replace('{sources}', sources_html)
-        rendered = rendered.replace('{destinations}', destinations_html)
-        rendered = rendered.replace('{source_categories}', source_categories_html)
-        rendered = rendered.replace('{destination_categories}', destination_categories_html)
-        rendered = rendered.replace('{router_status}', router_status)
-        rendered = rendered.replace('{simulation_banner}', simulation_banner)
-        rendered = rendered.replace('{timestamp}', timestamp)
-        
-        return rendered
+        # Replace every placeholder in a single pass; the clock is filled in by the browser
+        values = {
+            'source_categories': source_categories_html,
+            'destination_categories': destination_categories_html,
+            'router_status': router_status,
+            'simulation_banner': simulation_banner,
+            'timestamp': ''
+        }
+        return TEMPLATE_PLACEHOLDER.sub(lambda match: values[match.group(1)], HTML_TEMPLATE)
     
     def log_message(self, format, *args):
         logger.info(f"{self.address_string()} - {format % args}")
 
 
+class RouterHTTPServer(ThreadingHTTPServer):
+    #One thread per HTTP request; router access is serialized by the command queue
+    daemon_threads = True
+    request_queue_size = 64
+
+
 def start_server(port=5050):
     server_address = ('0.0.0.0', port)
-    httpd = HTTPServer(server_address, RouterHTTPRequestHandler)
+    httpd = RouterHTTPServer(server_address, RouterHTTPRequestHandler)
     logger.info(f"Starting HTTP server on {server_address[0]}:{server_address[1]}")
     
-    # Initialize router in a separate thread
-    router_thread = threading.Thread(target=initialize_router)
-    router_thread.daemon = True
-    router_thread.start()
+    # Connect to the routers and refresh their name tables in the background
+    start_frames()
     
     try:
         httpd.serve_forever()
@@ -670,21 +3330,29 @@ def start_server(port=5050):
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Harris LRC Router Control Server')
-    parser.add_argument('--host', required=True, help='Router IP address (required)')
+    parser.add_argument('--host', help='Router IP address (required unless --config is given)')
     parser.add_argument('--port', type=int, default=52116, help='Router port (default: 52116)')
-    return parser.parse_args()
-
-def set_router_config(host, port):
-    global router_host, router_port
-    router_host = host
-    router_port = port
+    parser.add_argument('--take-timeout', type=float, default=2.0, help='Seconds to wait for a take to be acknowledged before querying status (default: 2.0)')
+    parser.add_argument('--names-cache', default='router_names.json', help='Name table snapshot file (default: router_names.json)')
+    parser.add_argument('--names-ttl', type=int, default=300, help='Seconds before name tables are refreshed (default: 300)')
+    parser.add_argument('--config', help='JSON file listing several router frames to control')
+    parser.add_argument('--journal-dir', default='journal', help='Directory for the route history journal, one subdirectory per frame; empty to disable (default: journal)')
+    parser.add_argument('--proxy-port', type=int, help='Accept LRC clients on this port and share the router session with them (default: off)')
+    args = parser.parse_args()
+    if not args.host and not args.config:
+        parser.error('either --host or --config is required')
+    return args
 
 if __name__ == '__main__':
     args = parse_arguments()
-    set_router_config(args.host, args.port)
+    if args.config:
+        load_frames_config(args.config, args.take_timeout, args.names_ttl, args.journal_dir)
+    else:
+        add_frame('main', args.host, args.port, args.take_timeout, args.names_cache, args.names_ttl, args.journal_dir, args.proxy_port)
     
     logger.info(f"Starting router control server...")
-    logger.info(f"Router: {router_host}:{router_port}")
+    for frame in frames.values():
+        logger.info(f"Router '{frame.name}': {frame.router.host}:{frame.router.port}")
     logger.info(f"Web server will run on port 5050")
     
     load_ui_template()  
@@ -0,0 +1,313 @@
+import logging, socket, threading, time, random, re, argparse, queue, json
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Simulated Harris LRC router for exercising harris_lrc.py without hardware.
+#
+# Speaks the subset of LRC the control server uses:
+#   ~SRC?Q${NAME}\ and ~DEST?Q${NAME}\      name table dumps
+#   ~XPOINT?\ and ~XPOINT?D${dst}\          crosspoint queries
+#   ~XPOINT:S${src};D${dst}\                takes, acknowledged to every client with ~XPOINT%
+#   LOCK:D${dst};V${ON|OFF};U#{20}\         destination locks, announced with ~LOCK%
+#   ~LOCK?\ and ~LOCK?D${dst}\              lock state queries
+#
+# Replies can be delayed, split into small TCP segments or dropped, so latency
+# and robustness can be measured on a laptop. With --replay, commands found in a
+# protocol trace captured from a real frame (GET /trace) are answered with the
+# recorded reply bytes, chunking and timing instead.
+
+ARG_PATTERN = re.compile(r'([A-Z]+)[\$#]\{([^}]*)\}')
+
+
+def load_replay(path):
+    #Read a harris_lrc.py trace and map each command sent to the bytes the router sent
+    #back before the next command, as [[(delay, data), ...], ...] per occurrence.
+    #Pipelined commands sent in one write share one reply list, attached to the last.
+    replies = {}
+    current = None
+    sent_at = 0.0
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != 'lrc-trace':
+            raise ValueError(f"{path} is not an LRC trace")
+        for line in f:
+            if not line.strip():
+                continue
+            timestamp, direction, data = json.loads(line)
+            data = data.encode('latin-1')
+            if direction == 'tx':
+                commands = [raw.decode('utf-8', errors='replace').strip() for raw in data.split(b"\\")]
+                commands = [command for command in commands if command]
+                if not commands:
+                    continue
+                for command in commands[:-1]:
+                    replies.setdefault(command, []).append([])
+                current = []
+                replies.setdefault(commands[-1], []).append(current)
+                sent_at = timestamp
+            elif direction == 'rx' and current is not None:
+                current.append((timestamp - sent_at, data))
+            else:
+                current = None
+    logger.info(f"Loaded {sum(len(r) for r in replies.values())} recorded replies for {len(replies)} commands from {path}")
+    return replies
+
+
+class SimulatedClient:
+    #One connected control session. Replies are written by a dedicated thread so
+    #per-reply latency does not hold up reading further commands.
+    def __init__(self, simulator, sock, address):
+        self.simulator = simulator
+        self.sock = sock
+        self.address = address
+        self.outbox = queue.Queue()
+        self.last_due = 0.0
+        self.send_lock = threading.Lock()
+        self.closed = False
+
+    def start(self):
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def send(self, messages):
+        #Queue reply messages, applying the simulator's latency and drop settings
+        simulator = self.simulator
+        kept = [message for message in messages if random.random() >= simulator.drop]
+        if not kept:
+            return
+        delay = simulator.latency + random.uniform(0, simulator.jitter)
+        with self.send_lock:
+            # Never let jitter reorder replies on one session
+            due = max(time.monotonic() + delay, self.last_due)
+            self.last_due = due
+            self.outbox.put((due, "".join(kept).encode('utf-8')))
+
+    def send_raw(self, data, due):
+        #Queue captured bytes unchanged, to be written at monotonic time `due`
+        with self.send_lock:
+            due = max(due, self.last_due)
+            self.last_due = due
+            self.outbox.put((due, data))
+
+    def _write_loop(self):
+        while True:
+            due, data = self.outbox.get()
+            if data is None:
+                return
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                fragment = self.simulator.fragment
+                if fragment:
+                    # Split into random-sized segments to exercise reassembly
+                    position = 0
+                    while position < len(data):
+                        size = random.randint(1, fragment)
+                        self.sock.sendall(data[position:position + size])
+                        position += size
+                else:
+                    self.sock.sendall(data)
+            except OSError:
+                return
+
+    def _read_loop(self):
+        buffer = b""
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                while b"\\" in buffer:
+                    raw, _, buffer = buffer.partition(b"\\")
+                    command = raw.decode('utf-8', errors='replace').strip()
+                    if command:
+                        self.simulator.handle(self, command)
+        except OSError:
+            pass
+        finally:
+            self.closed = True
+            self.outbox.put((0, None))
+            self.simulator.disconnect(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+
+class LRCSimulator:
+    #A fake LRC frame with a sources x destinations matrix
+    def __init__(self, host='127.0.0.1', port=52116, sources=64, destinations=64, latency=0.0, jitter=0.0, fragment=0, drop=0.0, churn=0.0, replay=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.drop = drop
+        self.churn = churn
+        self.source_names = {number: f"SRC {number}" for number in range(1, sources + 1)}
+        self.destination_names = {number: f"DST {number}" for number in range(1, destinations + 1)}
+        self.crosspoints = {name: self.source_names[(number - 1) % sources + 1]
+                            for number, name in self.destination_names.items()}
+        self.locks = set()
+        self.replay = replay or {}
+        self.replayed = {}
+        self.clients = []
+        self.lock = threading.Lock()
+        self.server = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        #Listen in background threads; returns the bound port (useful with port=0)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((self.host, self.port))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        if self.churn:
+            threading.Thread(target=self._churn_loop, daemon=True).start()
+        logger.info(f"LRC simulator listening on {self.host}:{self.port} "
+                    f"({len(self.source_names)}x{len(self.destination_names)})")
+        return self.port
+
+    def stop(self):
+        #Stop accepting and drop every session, as a frame going offline would
+        self.stopped.set()
+        if self.server:
+            # close() alone does not wake a thread blocked in accept()
+            try:
+                self.server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server.close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _accept_loop(self):
+        while not self.stopped.is_set():
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                return
+            if self.stopped.is_set():
+                sock.close()
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = SimulatedClient(self, sock, address)
+            with self.lock:
+                self.clients.append(client)
+            logger.info(f"Client connected from {address[0]}:{address[1]}")
+            client.start()
+
+    def disconnect(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def broadcast(self, messages):
+        #Unsolicited notifications go to every connected session
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.send(messages)
+
+    def _churn_loop(self):
+        #Make random takes, as other control panels on the frame would
+        while not self.stopped.wait(1.0 / self.churn):
+            dst = random.choice(list(self.destination_names.values()))
+            if dst in self.locks:
+                continue
+            src = random.choice(list(self.source_names.values()))
+            self.crosspoints[dst] = src
+            self.broadcast([f"~XPOINT%D${{{dst}}};S${{{src}}}\\"])
+
+    def handle(self, client, command):
+        #Answer a single command from a client
+        if command in self.replay:
+            self.replay_reply(client, command)
+            return
+
+        args = dict(ARG_PATTERN.findall(command))
+        head = command.lstrip('~')
+
+        if head.startswith('SRC?'):
+            client.send([f"~SRC%I#{{{number}}};NAME${{{name}}}\\" for number, name in self.source_names.items()]
+                        + ["~SRC%Q${NAME}\\"])
+        elif head.startswith('DEST?'):
+            client.send([f"~DEST%I#{{{number}}};NAME${{{name}}}\\" for number, name in self.destination_names.items()]
+                        + ["~DEST%Q${NAME}\\"])
+        elif head.startswith('XPOINT?'):
+            if 'D' in args:
+                dst = args['D']
+                if dst in self.crosspoints:
+                    client.send([f"~XPOINT%D${{{dst}}};S${{{self.crosspoints[dst]}}}\\"])
+            else:
+                client.send([f"~XPOINT%D${{{dst}}};S${{{src}}}\\" for dst, src in self.crosspoints.items()])
+        elif head.startswith('XPOINT:'):
+            dst, src = args.get('D'), args.get('S')
+            if dst not in self.crosspoints or src not in self.source_names.values():
+                client.send([f"~XPOINT!E${{UNKNOWN}};D${{{dst}}}\\"])
+            elif dst in self.locks:
+                client.send([f"~XPOINT!LOCK!D${{{dst}}}\\"])
+            else:
+                self.crosspoints[dst] = src
+                self.broadcast([f"~XPOINT%D${{{dst}}};S${{{src}}}\\"])
+        elif head.startswith('LOCK?'):
+            dsts = [args['D']] if 'D' in args else list(self.destination_names.values())
+            client.send([f"~LOCK%D${{{dst}}};V${{{'ON' if dst in self.locks else 'OFF'}}};U#{{20}}\\"
+                         for dst in dsts if dst in self.crosspoints])
+        elif head.startswith('LOCK:'):
+            dst, value = args.get('D'), args.get('V')
+            if value == 'ON':
+                self.locks.add(dst)
+            else:
+                self.locks.discard(dst)
+            self.broadcast([f"~LOCK%D${{{dst}}};V${{{value}}};U#{{20}}\\"])
+        else:
+            logger.debug(f"Ignoring unsupported command: '{command}'")
+
+    def replay_reply(self, client, command):
+        #Answer with the next recorded reply to this command, cycling through occurrences
+        with self.lock:
+            occurrences = self.replay[command]
+            index = self.replayed.get(command, 0)
+            self.replayed[command] = index + 1
+        received = time.monotonic()
+        for delay, data in occurrences[index % len(occurrences)]:
+            client.send_raw(data, received + delay)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Simulated Harris LRC router for offline testing')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=52116, help='Port to listen on (default: 52116)')
+    parser.add_argument('--sources', type=int, default=64, help='Number of sources (default: 64)')
+    parser.add_argument('--destinations', type=int, default=64, help='Number of destinations (default: 64)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added before every reply (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay of up to this many seconds (default: 0)')
+    parser.add_argument('--fragment', type=int, default=0, help='Split replies into TCP segments of at most this many bytes (default: off)')
+    parser.add_argument('--drop', type=float, default=0.0, help='Probability of silently dropping each reply (default: 0)')
+    parser.add_argument('--churn', type=float, default=0.0, help='Random takes per second made by "other panels" (default: 0)')
+    parser.add_argument('--replay', help='Protocol trace from GET /trace; recorded commands are answered with the captured replies')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    simulator = LRCSimulator(args.host, args.port, args.sources, args.destinations,
+                             args.latency, args.jitter, args.fragment, args.drop, args.churn,
+                             load_replay(args.replay) if args.replay else None)
+    simulator.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        logger.info("Simulator stopped by user")
+        simulator.stop()
@@ -0,0 +1,615 @@
+import asyncio, contextlib, gzip, http.client, io, json, logging, os, shutil, socket, tempfile, threading, time, unittest
+
+import harris_lrc
+import lrc_simulator
+
+logging.disable(logging.CRITICAL)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.02)
+
+
+class FramerTest(unittest.TestCase):
+    def test_messages_split_across_reads(self):
+        framer = harris_lrc.LRCFramer()
+        self.assertEqual(framer.feed(b"~XPOINT%D${DST 1};S$"), [])
+        first, second = framer.feed(b"{SRC 2}\\\n~LOCK%D${DST 1};V${ON};U#{20}\\~XP")
+        self.assertEqual((first.command, first.op, first.args), ('XPOINT', '%', {'D': 'DST 1', 'S': 'SRC 2'}))
+        self.assertEqual((second.command, second.args['V'], second.args['U']), ('LOCK', 'ON', '20'))
+        self.assertEqual(bytes(framer.buffer), b"~XP")
+
+
+class TallyMatrixTest(unittest.TestCase):
+    def test_changes_since_a_version(self):
+        matrix = harris_lrc.TallyMatrix()
+        matrix.renumber({1: 'DST 1', 2: 'DST 2'}, {1: 'SRC 1', 2: 'SRC 2'})
+        matrix.set('DST 1', 'SRC 1', 1.0)
+        version = matrix.version
+        self.assertFalse(matrix.set('DST 1', 'SRC 1', 2.0))
+        self.assertTrue(matrix.set('DST 2', 'SRC 2', 2.0))
+        self.assertEqual(matrix.changed_since(version), {'DST 2': 'SRC 2'})
+        self.assertEqual(matrix.items(), {'DST 1': 'SRC 1', 'DST 2': 'SRC 2'})
+        self.assertEqual(matrix.get('DST 1'), ('SRC 1', 2.0))
+        self.assertEqual(list(matrix.sources[:3]), [0, 1, 2])
+
+    def test_renumbering_keeps_state_and_invalidates_versions(self):
+        matrix = harris_lrc.TallyMatrix()
+        matrix.set('DST 9', 'SRC 9', 1.0)
+        version = matrix.version
+        self.assertTrue(matrix.renumber({4: 'DST 9'}, {7: 'SRC 9'}))
+        self.assertFalse(matrix.renumber({4: 'DST 9'}, {7: 'SRC 9'}))
+        self.assertEqual(matrix.sources[4], 7)
+        self.assertEqual(matrix.items(), {'DST 9': 'SRC 9'})
+        self.assertIsNone(matrix.changed_since(version))
+
+
+class MetricsTest(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        metrics = harris_lrc.Metrics()
+        metrics.observe('lrc_command_duration_seconds', 0.003, frame='a', command='route')
+        metrics.observe('lrc_command_duration_seconds', 0.2, frame='a', command='route')
+        metrics.increment('lrc_command_retries_total', frame='a', command='status')
+        lines = metrics.render([('lrc_router_connected', 'gauge', 'Whether the router link is up', {'frame': 'a"b'}, 1)]).splitlines()
+        self.assertIn('# TYPE lrc_command_duration_seconds histogram', lines)
+        self.assertIn('lrc_command_duration_seconds_bucket{frame="a",command="route",le="0.0025"} 0', lines)
+        self.assertIn('lrc_command_duration_seconds_bucket{frame="a",command="route",le="0.005"} 1', lines)
+        self.assertIn('lrc_command_duration_seconds_bucket{frame="a",command="route",le="+Inf"} 2', lines)
+        self.assertIn('lrc_command_duration_seconds_count{frame="a",command="route"} 2', lines)
+        self.assertIn('lrc_command_retries_total{frame="a",command="status"} 1', lines)
+        self.assertIn('# TYPE lrc_router_connected gauge', lines)
+        self.assertIn('lrc_router_connected{frame="a\\"b"} 1', lines)
+
+
+class ProtocolTraceTest(unittest.TestCase):
+    def test_buffer_is_bounded_by_bytes(self):
+        trace = harris_lrc.ProtocolTrace(max_bytes=10000)
+        for _ in range(100):
+            trace.record('rx', b'x' * 4096)
+        self.assertEqual((len(trace.records), trace.size), (2, 8192))
+
+
+class AsyncRouterTest(unittest.TestCase):
+    #AsyncIP3Router against the simulator directly, one event loop per test
+    def setUp(self):
+        self.simulator = lrc_simulator.LRCSimulator(port=0, sources=8, destinations=8)
+        self.port = self.simulator.start()
+        self.addCleanup(self.simulator.stop)
+
+    def run_client(self, scenario):
+        async def run():
+            async with harris_lrc.AsyncIP3Router('127.0.0.1', self.port, timeout=0.5) as router:
+                return await scenario(router)
+        return asyncio.run(run())
+
+    def test_take_status_and_names(self):
+        async def scenario(router):
+            names = [name async for _, name in router.query_names('DEST')]
+            return names, await router.route('SRC 4', 'DST 1'), await router.status('DST 1')
+        names, taken, source = self.run_client(scenario)
+        self.assertEqual(names, [f"DST {n}" for n in range(1, 9)])
+        self.assertIs(taken, True)
+        self.assertEqual(source, 'SRC 4')
+
+    def test_concurrent_salvo_and_locks(self):
+        async def scenario(router):
+            locked = await router.lock('DST 3')
+            salvo, status = await asyncio.gather(router.salvo([('SRC 1', 'DST 2'), ('SRC 1', 'DST 3'), ('NOPE', 'DST 4')]),
+                                                 router.status('DST 5'))
+            return locked, salvo, status, await router.unlock('DST 3')
+        locked, salvo, status, unlocked = self.run_client(scenario)
+        self.assertTrue(locked and unlocked)
+        self.assertEqual(salvo, {'DST 2': True, 'DST 3': "locked", 'DST 4': False})
+        self.assertEqual(status, 'SRC 5')
+
+    def test_tally_events_follow_changes(self):
+        async def scenario(router):
+            # The subscription starts with the first iteration
+            first = asyncio.ensure_future(router.tally_events().__anext__())
+            await asyncio.sleep(0)
+            await router.route('SRC 2', 'DST 6')
+            return await asyncio.wait_for(first, 2)
+        self.assertEqual(self.run_client(scenario), {'event': 'xpoint', 'destination': 'DST 6', 'source': 'SRC 2'})
+
+    def test_status_error_fails_at_once(self):
+        handle = self.simulator.handle
+
+        def refuse(client, command):
+            if command.startswith('~XPOINT?D${NOPE}'):
+                client.send(["~XPOINT!E${UNKNOWN};D${NOPE}\\"])
+            else:
+                handle(client, command)
+        self.simulator.handle = refuse
+        started = time.monotonic()
+        self.assertIsNone(self.run_client(lambda router: router.status('NOPE')))
+        self.assertLess(time.monotonic() - started, 0.4)
+
+
+class FrameTest(unittest.TestCase):
+    #A frame connected to a simulated router over real sockets
+    size = 8
+    journal = False
+    heartbeat = 5.0
+
+    def setUp(self):
+        self.simulator = lrc_simulator.LRCSimulator(port=0, sources=self.size, destinations=self.size)
+        port = self.simulator.start()
+        self.journal_dir = tempfile.mkdtemp() if self.journal else None
+        self.frame = harris_lrc.RouterFrame('test', '127.0.0.1', port, take_timeout=0.5, journal_dir=self.journal_dir)
+        self.frame.router.timeout = 0.5
+        self.frame.supervisor.interval = self.heartbeat
+        self.frame.start()
+        self.httpd = None
+        wait_for(lambda: self.frame.names.loaded_at is not None and not self.frame.tally.stale and not self.frame.locks.stale)
+
+    def tearDown(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            harris_lrc.frames.pop(self.frame.name, None)
+        if self.frame.proxy:
+            self.frame.proxy.stop()
+        self.frame.supervisor.stop()
+        self.frame.router.close()
+        self.simulator.stop()
+        if self.journal_dir:
+            shutil.rmtree(self.journal_dir, ignore_errors=True)
+
+    def call(self, fn, *args):
+        return self.frame.commands.call(fn, *args)
+
+    def request(self, method, path, body=None, headers={}):
+        #One request to a control server serving this frame as the default; returns the response, read
+        if self.httpd is None:
+            harris_lrc.load_ui_template()
+            harris_lrc.frames[self.frame.name] = self.frame
+            self.httpd = harris_lrc.RouterHTTPServer(('127.0.0.1', 0), harris_lrc.RouterHTTPRequestHandler)
+            threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        connection = http.client.HTTPConnection('127.0.0.1', self.httpd.server_address[1], timeout=10)
+        try:
+            connection.request(method, path, None if body is None else json.dumps(body), headers)
+            response = connection.getresponse()
+            response.body = response.read()
+            return response
+        finally:
+            connection.close()
+
+    def get_json(self, path):
+        return json.loads(self.request('GET', path).body)
+
+    def post_json(self, path, body):
+        return json.loads(self.request('POST', path, body).body)
+
+    def ignore(self, prefix):
+        #Make the simulator stop answering commands that start with prefix
+        handle = self.simulator.handle
+        self.simulator.handle = lambda client, command: None if command.startswith(prefix) else handle(client, command)
+
+
+class SimulatedFrameTest(FrameTest):
+    def test_frame_loads_tables_and_tally_from_simulator(self):
+        self.assertEqual(sorted(self.frame.destinations.values()), sorted(f"DST {n}" for n in range(1, self.size + 1)))
+        self.assertEqual(self.frame.tally.snapshot(), {f"DST {n}": f"SRC {n}" for n in range(1, self.size + 1)})
+
+
+class TallyTest(FrameTest):
+    def test_tally_diff_after_take(self):
+        version, full, crosspoints = self.frame.tally.changes()
+        self.assertTrue(full)
+        self.assertEqual(len(crosspoints), self.size)
+        self.call(self.frame.router.route, 'SRC 5', 'DST 6')
+        wait_for(lambda: self.frame.tally.lookup('DST 6')[0] == 'SRC 5')
+        _, full, changed = self.frame.tally.changes(version)
+        self.assertFalse(full)
+        self.assertEqual(changed, {'DST 6': 'SRC 5'})
+
+    def test_tally_endpoint_diffs_by_version(self):
+        tally = self.get_json('/tally')
+        self.assertTrue(tally['full'])
+        self.call(self.frame.router.route, 'SRC 8', 'DST 1')
+        wait_for(lambda: self.frame.tally.lookup('DST 1')[0] == 'SRC 8')
+        changed = self.get_json(f"/tally?since={tally['version']}")
+        self.assertEqual((changed['full'], changed['crosspoints']), (False, {'DST 1': 'SRC 8'}))
+        self.assertTrue(self.get_json('/tally?since=1')['full'])
+
+
+class StatusTest(FrameTest):
+    def test_status_from_tally(self):
+        status = self.get_json('/status/DST%202')
+        self.assertEqual((status['source'], status['cached'], status['stale']), ('SRC 2', True, False))
+
+    def test_take_updates_tally(self):
+        self.assertIs(self.call(self.frame.router.route, 'SRC 4', 'DST 2'), True)
+        wait_for(lambda: self.frame.tally.lookup('DST 2')[0] == 'SRC 4')
+
+    def test_last_known_source_is_served_stale_while_link_is_down(self):
+        self.simulator.stop()
+        wait_for(lambda: not self.frame.router.connected)
+        status = self.get_json('/status/DST%203')
+        self.assertEqual((status['source'], status['cached'], status['stale']), ('SRC 3', True, True))
+        self.assertGreaterEqual(status['age'], 0)
+
+
+class CommandQueueTest(FrameTest):
+    def test_unknown_destination_is_answered_without_the_router(self):
+        self.ignore('~XPOINT?')
+        started = time.monotonic()
+        status = self.get_json('/status/NOPE')
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual((status['success'], status['message']), (False, 'Unknown destination NOPE'))
+
+    def test_unanswered_status_does_not_hold_up_takes(self):
+        self.frame.tally.synced_at = None
+        self.ignore('~XPOINT?D')
+        timings = []
+
+        def status():
+            started = time.monotonic()
+            self.get_json('/status/DST%202')
+            timings.append(time.monotonic() - started)
+        thread = threading.Thread(target=status)
+        thread.start()
+        time.sleep(0.1)
+        started = time.monotonic()
+        take = self.post_json('/route', {'source': 'SRC 1', 'destination': 'DST 5'})
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertIs(take['result'], True)
+        thread.join()
+        self.assertLess(timings[0], 0.9)
+
+    def test_unconfirmed_take_is_not_retried(self):
+        self.ignore('~XPOINT:')
+        self.ignore('~XPOINT?D')
+        started = time.monotonic()
+        self.assertIs(self.call(self.frame.router.route, 'SRC 1', 'DST 5'), False)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+
+class TakeTest(FrameTest):
+    def test_take_is_confirmed_from_its_acknowledgement(self):
+        self.ignore('~XPOINT?D')
+        confirmed, latency = self.call(self.frame.router.route_timed, 'SRC 6', 'DST 1')
+        self.assertIs(confirmed, True)
+        self.assertLess(latency, 0.4)
+
+    def test_router_error_fails_take_at_once(self):
+        started = time.monotonic()
+        self.assertIs(self.call(self.frame.router.route, 'NOPE', 'DST 1'), False)
+        self.assertLess(time.monotonic() - started, 0.4)
+
+
+class BackoffTest(unittest.TestCase):
+    def test_reconnects_back_off_exponentially(self):
+        with socket.socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            port = unused.getsockname()[1]
+        supervisor = harris_lrc.RouterSupervisor(harris_lrc.IP3Router('127.0.0.1', port), None, lambda: None, max_backoff=4.0)
+        delays = []
+        supervisor.stop_event.wait = delays.append
+        for _ in range(5):
+            supervisor._reconnect()
+        self.assertEqual(supervisor.failures, 5)
+        for attempt, delay in enumerate(delays, 1):
+            ceiling = min(4.0, 0.5 * 2 ** attempt)
+            self.assertTrue(ceiling / 2 <= delay <= ceiling, (attempt, delay))
+
+
+class SupervisorTest(FrameTest):
+    heartbeat = 0.2
+
+    def test_heartbeat_measures_round_trip(self):
+        wait_for(lambda: self.frame.supervisor.rtt is not None)
+        self.assertEqual(self.frame.supervisor.describe()['state'], 'connected')
+
+    def test_link_loss_is_noticed(self):
+        self.simulator.stop()
+        wait_for(lambda: not self.frame.router.connected)
+        self.assertTrue(self.frame.tally.stale)
+
+    def test_missed_heartbeats_reconnect(self):
+        self.ignore('~XPOINT?D')
+        wait_for(lambda: self.frame.supervisor.reconnects >= 1)
+        self.assertGreaterEqual(harris_lrc.metrics.counters[('lrc_heartbeat_misses_total', (('frame', 'test'),))], 2)
+
+class TraceCaptureTest(FrameTest):
+    def test_capture_loads_and_replays(self):
+        self.call(self.frame.router.route, 'SRC 2', 'DST 7')
+        capture = self.request('GET', '/trace')
+        self.assertIn('attachment', capture.headers['Content-Disposition'])
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'trace.jsonl')
+        with open(path, 'wb') as f:
+            f.write(capture.body)
+
+        header, records = harris_lrc.load_trace(path)
+        self.assertEqual((header['frame'], header['records']), ('test', len(records)))
+        self.assertIn(('tx', b"~XPOINT:S${SRC 2};D${DST 7}\\\n"), [(direction, data) for _, direction, data in records])
+        replay = harris_lrc.replay_trace_parser(records)
+        self.assertEqual(replay['bytes'], sum(len(data) for _, direction, data in records if direction == 'rx'))
+        self.assertGreater(replay['messages'], self.size)
+
+
+class SalvoTest(FrameTest):
+    def test_salvo_takes_every_route(self):
+        salvo = self.post_json('/salvo', {'routes': [{'source': 'SRC 1', 'destination': 'DST 2'},
+                                                     {'source': 'SRC 2', 'destination': 'DST 1'}]})
+        self.assertTrue(salvo['success'])
+        self.assertEqual([result['success'] for result in salvo['results']], [True, True])
+        wait_for(lambda: self.frame.tally.lookup('DST 1')[0] == 'SRC 2' and self.frame.tally.lookup('DST 2')[0] == 'SRC 1')
+
+    def test_salvo_reports_each_route(self):
+        self.assertTrue(self.call(self.frame.router.lock_destination, 'DST 3'))
+        wait_for(lambda: self.frame.locks.is_locked('DST 3'))
+        salvo = self.post_json('/salvo', {'routes': [{'source': 'SRC 1', 'destination': 'DST 2'},
+                                                     {'source': 'NOPE', 'destination': 'DST 4'},
+                                                     {'source': 'SRC 1', 'destination': 'DST 3'}]})
+        self.assertFalse(salvo['success'])
+        self.assertEqual([(result['success'], result['locked']) for result in salvo['results']],
+                         [(True, False), (False, False), (False, True)])
+
+    def test_salvo_needs_complete_routes(self):
+        salvo = self.post_json('/salvo', {'routes': [{'source': 'SRC 1'}]})
+        self.assertFalse(salvo['success'])
+
+
+class SchedulerTest(FrameTest):
+    def test_salvo_fires_at_its_time(self):
+        fire_at = time.time() + 0.3
+        scheduled = self.post_json('/schedule', {'at': fire_at, 'label': 'opening',
+                                                 'routes': [{'source': 'SRC 3', 'destination': 'DST 1'},
+                                                            {'source': 'SRC 3', 'destination': 'DST 2'}]})
+        self.assertEqual(scheduled['job']['state'], 'scheduled')
+        wait_for(lambda: self.frame.scheduler.list()[0]['state'] not in ('scheduled', 'firing'))
+        job, = self.frame.scheduler.list()
+        self.assertEqual(job['state'], 'fired')
+        self.assertTrue(all(route['success'] for route in job['routes']))
+        self.assertLess(abs(job['jitter']), 0.05)
+        self.assertGreaterEqual(job['fired_at'], fire_at)
+
+    def test_cancelled_salvo_does_not_fire(self):
+        job = self.frame.scheduler.schedule([('SRC 3', 'DST 1')], time.time() + 0.3)
+        self.assertEqual(self.post_json(f"/schedule/{job['id']}/cancel", {})['job']['state'], 'cancelled')
+        self.assertIsNone(self.frame.scheduler.cancel(job['id']))
+        time.sleep(0.5)
+        self.assertEqual(self.frame.tally.lookup('DST 1')[0], 'SRC 1')
+
+    def test_invalid_salvos_are_refused_when_scheduled(self):
+        scheduler = self.frame.scheduler
+        with self.assertRaises(ValueError):
+            scheduler.schedule([('SRC 1', 'DST 1')], time.time() - 1)
+        with self.assertRaises(ValueError):
+            scheduler.schedule([('SRC 1', 'DST 1'), ('SRC 2', 'DST 1')], time.time() + 1)
+        with self.assertRaises(ValueError):
+            scheduler.schedule([('NOPE', 'DST 1')], time.time() + 1)
+        self.assertEqual(scheduler.list(), [])
+
+
+class IndexPageTest(FrameTest):
+    def test_page_is_gzipped_on_request(self):
+        plain = self.request('GET', '/')
+        compressed = self.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertIsNone(plain.headers['Content-Encoding'])
+        self.assertEqual(gzip.decompress(compressed.body), plain.body)
+        self.assertEqual(compressed.headers['ETag'], plain.headers['ETag'])
+
+    def test_unchanged_page_is_not_modified(self):
+        etag = self.request('GET', '/').headers['ETag']
+        revalidated = self.request('GET', '/', headers={'If-None-Match': etag})
+        self.assertEqual((revalidated.status, revalidated.body), (304, b''))
+        harris_lrc.simulation_mode = True
+        try:
+            changed = self.request('GET', '/', headers={'If-None-Match': etag})
+        finally:
+            harris_lrc.simulation_mode = False
+        self.assertEqual(changed.status, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+
+class LockTest(FrameTest):
+    def test_locked_destination_is_refused(self):
+        self.assertTrue(self.call(self.frame.router.lock_destination, 'DST 3'))
+        wait_for(lambda: self.frame.locks.is_locked('DST 3'))
+        self.assertEqual(self.call(self.frame.router.route, 'SRC 1', 'DST 3'), "locked")
+
+    def test_lock_results_are_logged_not_printed(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.call(self.frame.router.lock_destination, 'DST 1')
+            self.call(self.frame.router.unlock_destination, 'DST 1')
+        self.assertEqual(output.getvalue(), "")
+
+    def test_unanswered_lock_query_keeps_cached_locks(self):
+        self.assertTrue(self.call(self.frame.router.lock_destination, 'DST 1'))
+        wait_for(lambda: self.frame.locks.is_locked('DST 1'))
+        self.ignore('~LOCK?')
+        self.frame.locks.resync()
+        self.assertTrue(self.frame.locks.is_locked('DST 1'))
+
+    def test_bulk_lock_and_unlock(self):
+        locked = self.post_json('/lock', {'destinations': ['DST 1', 'DST 2']})
+        self.assertEqual([result['success'] for result in locked['results']], [True, True])
+        wait_for(lambda: self.frame.locks.snapshot() == ['DST 1', 'DST 2'])
+        unlocked = self.post_json('/unlock', {'destinations': ['DST 1']})
+        self.assertTrue(unlocked['success'])
+        wait_for(lambda: self.frame.locks.snapshot() == ['DST 2'])
+
+
+class JournalTest(FrameTest):
+    journal = True
+
+    def test_resync_writes_baseline(self):
+        wait_for(lambda: len(self.frame.journal.query(destination='DST 2')[0]) >= 1)
+        records, _ = self.frame.journal.query(destination='DST 2')
+        self.assertTrue(any(record.get('baseline') for record in records))
+
+    def test_state_at_finds_source_and_lock(self):
+        self.call(self.frame.router.route, 'SRC 7', 'DST 4')
+        self.call(self.frame.router.lock_destination, 'DST 4')
+        wait_for(lambda: self.frame.journal.state_at('DST 4', time.time())['locked'])
+        state = self.frame.journal.state_at('DST 4', time.time())
+        self.assertEqual((state['source'], state['locked']), ('SRC 7', True))
+        self.assertEqual(self.frame.journal.state_at('DST 5', time.time())['source'], 'SRC 5')
+
+    def test_history_limit_is_at_least_one(self):
+        wait_for(lambda: len(self.frame.journal.query()[0]) >= 2)
+        history = self.get_json('/history?limit=-3')
+        self.assertEqual((history['count'], history['truncated']), (1, True))
+
+
+class JournalRecoveryTest(unittest.TestCase):
+    def test_torn_last_line_is_skipped_after_restart(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        journal = harris_lrc.RouteJournal(directory)
+        journal.start()
+        for n in range(1, 6):
+            journal.record_xpoint(f"DST {n}", f"SRC {n}")
+        wait_for(lambda: journal.current.count == 5)
+        size = journal.current.size
+        with open(journal.current.path, 'ab') as f:
+            f.write(b'{"t":1')
+
+        restarted = harris_lrc.RouteJournal(directory)
+        restarted.start()
+        recovered = restarted.segments[0]
+        self.assertEqual((recovered.count, recovered.size), (5, size))
+        records, truncated = restarted.query()
+        self.assertEqual([record['destination'] for record in records], [f"DST {n}" for n in range(1, 6)])
+        self.assertFalse(truncated)
+        recovered.size += len(b'{"t":1')
+        self.assertEqual(len(restarted.query()[0]), 5)
+
+
+class NameTableTest(FrameTest):
+    def test_truncated_name_dump_keeps_last_tables(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'names.json')
+        self.frame.names.path = path
+        handle = self.simulator.handle
+
+        def short_dump(client, command):
+            if command.startswith('~DEST?'):
+                client.send([f"~DEST%I#{{{n}}};NAME${{DST {n}}}\\" for n in range(1, 4)])
+            else:
+                handle(client, command)
+        self.simulator.handle = short_dump
+
+        self.frame.names.refresh()
+        self.assertEqual(len(self.frame.destinations), self.size)
+        self.assertEqual(len(self.frame.names.tables['DEST']), self.size)
+        self.assertEqual(len(self.frame.tally.matrix.table_destinations), self.size)
+        self.assertFalse(os.path.exists(path))
+
+    def test_name_digest_follows_content(self):
+        digest = self.frame.names.digest
+        self.frame.names._publish()
+        self.assertEqual(self.frame.names.digest, digest)
+        self.frame.set_name_tables(self.frame.sources, {**self.frame.destinations, 99: 'DST 99'})
+        self.frame.names._publish()
+        self.assertNotEqual(self.frame.names.digest, digest)
+
+    def test_listing_pages_and_revalidates(self):
+        listing = self.request('GET', '/api/destinations?prefix=dst&offset=2&limit=3')
+        page = json.loads(listing.body)
+        self.assertEqual((page['total'], [item['name'] for item in page['items']]), (self.size, ['DST 3', 'DST 4', 'DST 5']))
+        revalidated = self.request('GET', '/api/destinations?prefix=dst&offset=2&limit=3', headers={'If-None-Match': listing.headers['ETag']})
+        self.assertEqual(revalidated.status, 304)
+        other_page = self.request('GET', '/api/destinations?prefix=dst&offset=5&limit=3')
+        self.assertNotEqual(other_page.headers['ETag'], listing.headers['ETag'])
+
+    def test_shared_tables_follow_reloads(self):
+        sources, destinations = {1: 'OLD'}, {}
+        self.frame.shared_sources, self.frame.shared_destinations = sources, destinations
+        self.frame.names.refresh()
+        self.assertEqual(sources, self.frame.sources)
+        self.assertEqual(destinations, self.frame.destinations)
+        self.assertEqual(len(destinations), self.size)
+
+
+class ProxyTest(FrameTest):
+    size = 64
+
+    def setUp(self):
+        super().setUp()
+        self.frame.proxy = harris_lrc.LRCProxy(self.frame, '127.0.0.1', 0)
+        self.port = self.frame.proxy.start()
+
+    def connect(self):
+        count = self.frame.proxy.notifications.count
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=2)
+        self.addCleanup(sock.close)
+        wait_for(lambda: self.frame.proxy.notifications.count > count)
+        return sock
+
+    def exchange(self, sock, command, quiet=0.3):
+        sock.sendall(command)
+        sock.settimeout(quiet)
+        data = b""
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        except socket.timeout:
+            pass
+        return harris_lrc.LRCFramer().feed(data)
+
+    def test_status_from_tally(self):
+        message, = self.exchange(self.connect(), b"~XPOINT?D${DST 3}\\\n")
+        self.assertEqual(message.args, {'D': 'DST 3', 'S': 'SRC 3'})
+
+    def test_take_is_broadcast(self):
+        first, second = self.connect(), self.connect()
+        self.exchange(first, b"~XPOINT:S${SRC 9};D${DST 1}\\\n")
+        message, = self.exchange(second, b"")
+        self.assertEqual(message.args, {'D': 'DST 1', 'S': 'SRC 9'})
+
+    def test_failed_take_is_answered(self):
+        message, = self.exchange(self.connect(), b"~XPOINT:S${NOPE};D${DST 1}\\\n")
+        self.assertEqual((message.command, message.op, message.args['D']), ('XPOINT', '!', 'DST 1'))
+
+    def test_name_dump_is_complete_during_refresh(self):
+        sock = self.connect()
+        stop = threading.Event()
+
+        def refresh():
+            while not stop.is_set():
+                self.frame.names.refresh()
+        threading.Thread(target=refresh, daemon=True).start()
+        try:
+            for _ in range(5):
+                messages = self.exchange(sock, b"~DEST?Q${NAME}\\\n")
+                self.assertEqual(len(messages), self.size + 1)
+                self.assertEqual(messages[-1].args, {'Q': 'NAME'})
+        finally:
+            stop.set()
+
+
+    def test_failed_lock_is_answered(self):
+        self.ignore('LOCK:')
+        message, = self.exchange(self.connect(), b"LOCK:D${DST 1};V${ON};U#{20}\\\n", quiet=0.8)
+        self.assertEqual((message.raw, message.args['D']), ("~LOCK!E${FAILED};D${DST 1}\\", 'DST 1'))
+
+    def test_router_lock_error_is_relayed(self):
+        handle = self.simulator.handle
+
+        def refuse(client, command):
+            if command.startswith('LOCK:'):
+                client.send(["~LOCK!E${REFUSED};D${DST 2}\\"])
+            else:
+                handle(client, command)
+        self.simulator.handle = refuse
+        message, = self.exchange(self.connect(), b"LOCK:D${DST 2};V${ON};U#{20}\\\n")
+        self.assertEqual(message.raw, "~LOCK!E${REFUSED};D${DST 2}\\")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import logging, socket, time, unittest
+
+import harris_lrc
+import lrc_simulator
+
+logging.disable(logging.CRITICAL)
+
+
+def read_available(sock, quiet=0.3):
+    #Everything the peer sends until it goes quiet for `quiet` seconds
+    sock.settimeout(quiet)
+    data = b""
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except (socket.timeout, ConnectionResetError):
+        pass
+    return data
+
+
+class SimulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.simulator = lrc_simulator.LRCSimulator(port=0, sources=8, destinations=8)
+        self.port = self.simulator.start()
+
+    def tearDown(self):
+        self.simulator.stop()
+
+    def connect(self):
+        #Connect and wait until the simulator has registered the session for broadcasts
+        sessions = len(self.simulator.clients)
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=2)
+        self.addCleanup(sock.close)
+        deadline = time.monotonic() + 2
+        while len(self.simulator.clients) <= sessions and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return sock
+
+    def test_take_is_announced_to_every_session(self):
+        first, second = self.connect(), self.connect()
+        first.sendall(b"~XPOINT:S${SRC 3};D${DST 1}\\\n")
+        for sock in (first, second):
+            messages = harris_lrc.LRCFramer().feed(read_available(sock))
+            self.assertEqual([(m.command, m.op, m.args) for m in messages],
+                             [('XPOINT', '%', {'D': 'DST 1', 'S': 'SRC 3'})])
+
+    def test_unknown_source_is_an_error(self):
+        sock = self.connect()
+        sock.sendall(b"~XPOINT:S${NOPE};D${DST 1}\\\n")
+        message, = harris_lrc.LRCFramer().feed(read_available(sock))
+        self.assertEqual((message.command, message.op, message.args.get('D')), ('XPOINT', '!', 'DST 1'))
+
+    def test_fragmented_replies_reassemble(self):
+        self.simulator.fragment = 3
+        sock = self.connect()
+        sock.sendall(b"~DEST?Q${NAME}\\\n")
+        framer = harris_lrc.LRCFramer()
+        messages = []
+        sock.settimeout(0.3)
+        try:
+            while True:
+                chunk = sock.recv(5)
+                if not chunk:
+                    break
+                messages.extend(framer.feed(chunk))
+        except socket.timeout:
+            pass
+        self.assertEqual([m.args['NAME'] for m in messages[:-1]], [f"DST {n}" for n in range(1, 9)])
+        self.assertEqual(messages[-1].args, {'Q': 'NAME'})
+
+    def test_stop_refuses_new_sessions_and_drops_existing(self):
+        sock = self.connect()
+        self.simulator.stop()
+        time.sleep(0.1)
+        self.assertEqual(read_available(sock), b"")
+        with self.assertRaises(ConnectionRefusedError):
+            socket.create_connection(('127.0.0.1', self.port), timeout=2).close()
+
+
+if __name__ == '__main__':
+    unittest.main()